@@ -0,0 +1,150 @@
+"""Measure the chat broadcast latency of a quiet room while other clients
+load the history of a large room
+
+Start the backend first (from src: uvicorn main:app) with the database it
+uses reachable through MONGO_DB_HOST, then run (from stage4/backend):
+
+    python benchmarks/chat_broadcast_latency.py --history-messages 20000
+
+A sender and a receiver join the quiet room and exchange timestamped
+messages, first on an idle server and then while loaders keep walking the
+whole history of the large room page by page. With blocking database
+calls on the event loop the second run shows the loaders' round-trips in
+the quiet room's latency.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+import jwt
+import websockets
+from bson.objectid import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from constants import ALGORITHM, SECRET_KEY  # noqa: E402
+from db import get_engine_db  # noqa: E402
+from services.message_store import save_messages  # noqa: E402
+
+
+def create_user():
+    """Insert a benchmark user and return an access token for it"""
+    db = get_engine_db()
+    now = datetime.now(timezone.utc)
+    user_id = db.users.insert_one({
+        "username": f"bench_{ObjectId()}"[:25],
+        "email": [{"value": "bench@bench.test", "is_verified": True}],
+        "password": "",
+        "first_name": "bench",
+        "last_name": "bench",
+        "_created_at": now,
+        "_updated_at": now,
+    }).inserted_id
+    token = jwt.encode(
+        {"user_id": str(user_id), "exp": now + timedelta(hours=1)},
+        SECRET_KEY, algorithm=ALGORITHM
+    )
+    return user_id, token
+
+
+async def seed_history(room_id, sender_id, count):
+    """Fill the large room with `count` messages"""
+    start = datetime.now(timezone.utc) - timedelta(seconds=count)
+    messages = [{
+        "_id": ObjectId(),
+        "sender_id": sender_id,
+        "content": f"history message {i}",
+        "timestamp": start + timedelta(seconds=i),
+    } for i in range(count)]
+    await save_messages(room_id, messages)
+
+
+async def join(url, token, room_id):
+    """Open a socket to a room and skip the handshake frames"""
+    socket = await websockets.connect(url)
+    await socket.send(json.dumps({"token": token, "room_id": str(room_id)}))
+    await socket.recv()  # connected
+    await socket.recv()  # history
+    return socket
+
+
+async def measure(url, token, room_id, samples, interval):
+    """Send timestamped messages to a room and return the delivery times"""
+    sender = await join(url, token, room_id)
+    receiver = await join(url, token, room_id)
+    latencies = []
+
+    for _ in range(samples):
+        await sender.send(f"ping {time.perf_counter()}")
+        while True:
+            frame = json.loads(await receiver.recv())
+            if frame.get("content", "").startswith("ping "):
+                break
+        sent_at = float(frame["content"].split()[1])
+        latencies.append((time.perf_counter() - sent_at) * 1000)
+        await asyncio.sleep(interval)
+
+    await sender.close()
+    await receiver.close()
+    return latencies
+
+
+async def load_history(http_url, token, room_id, stop: asyncio.Event):
+    """Keep walking the whole history of a room until told to stop"""
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=http_url, headers=headers) as http:
+        while not stop.is_set():
+            params = {"limit": 200}
+            while not stop.is_set():
+                page = (await http.get(f"/chat/{room_id}/messages",
+                                       params=params)).json()
+                if not page["has_more"]:
+                    break
+                params["before"] = page["next_cursor"]
+
+
+def report(name, latencies):
+    """Print a summary of the delivery times"""
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:>16}: p50 {statistics.median(latencies):7.2f} ms"
+          f"  p95 {p95:7.2f} ms  max {latencies[-1]:7.2f} ms")
+
+
+async def main(args):
+    """Run the benchmark"""
+    user_id, token = create_user()
+    quiet_room, large_room = ObjectId(), ObjectId()
+    await seed_history(large_room, user_id, args.history_messages)
+
+    report("idle", await measure(args.ws_url, token, quiet_room,
+                                 args.samples, args.interval))
+
+    stop = asyncio.Event()
+    loaders = [
+        asyncio.create_task(load_history(args.http_url, token, large_room,
+                                         stop))
+        for _ in range(args.loaders)
+    ]
+    latencies = await measure(args.ws_url, token, quiet_room,
+                              args.samples, args.interval)
+    stop.set()
+    await asyncio.gather(*loaders)
+    report("history loading", latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--ws-url", default="ws://localhost:8000/ws/chat")
+    parser.add_argument("--http-url", default="http://localhost:8000")
+    parser.add_argument("--history-messages", type=int, default=20000)
+    parser.add_argument("--loaders", type=int, default=8)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.01)
+    asyncio.run(main(parser.parse_args()))
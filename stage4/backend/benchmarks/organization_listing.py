@@ -0,0 +1,111 @@
+"""Measure the response time of the organizations listing with many large
+organizations
+
+Start the backend first (from src: uvicorn main:app) with the database it
+uses reachable through MONGO_DB_HOST, then run (from stage4/backend):
+
+    python benchmarks/organization_listing.py --orgs 1000 --members 10000
+
+The organizations are seeded with a bench_ name prefix and removed at the
+end. The whole listing is walked page by page with and without the members
+lists, next to the full collection scan the listing used to do.
+"""
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from bson.objectid import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from db import get_engine_db  # noqa: E402
+
+PREFIX = "bench_"
+
+
+def seed(orgs, members):
+    """Insert `orgs` organizations of `members` members each"""
+    db = get_engine_db()
+    now = datetime.now(timezone.utc)
+    for start in range(0, orgs, 50):
+        db.organizations.insert_many([{
+            "organization_name": f"{PREFIX}{i}",
+            "email_domain": "@bench.edu",
+            "location": "bench",
+            "photo_url": None,
+            "members": [ObjectId() for _ in range(members)],
+            "members_count": members,
+            "_banned_members": [],
+            "_created_at": now,
+            "_updated_at": now,
+        } for i in range(start, min(start + 50, orgs))])
+
+
+def cleanup():
+    """Remove the seeded organizations"""
+    get_engine_db().organizations.delete_many(
+        {"organization_name": {"$regex": f"^{PREFIX}"}})
+
+
+def legacy_listing():
+    """The former listing, every document pulled whole into Python"""
+    return [
+        {"members": [str(m) for m in org.get("members", [])],
+         "members_count": len(org.get("members", []))}
+        for org in get_engine_db().organizations.find()
+    ]
+
+
+def walk(http, include_members, limit):
+    """Fetch every page of the listing, returns the organizations count"""
+    params = {"limit": limit, "include_members": include_members}
+    count = 0
+    while True:
+        response = http.get("/organizations", params=params)
+        response.raise_for_status()
+        count += len(response.json())
+        if "X-Next-Cursor" not in response.headers:
+            return count
+        params["after"] = response.headers["X-Next-Cursor"]
+
+
+def timed(name, runs, fn):
+    """Print the median and worst time of `runs` calls of fn"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    print(f"{name:>28}: median {statistics.median(times):9.1f} ms"
+          f"  max {max(times):9.1f} ms")
+
+
+def main(args):
+    """Run the benchmark"""
+    seed(args.orgs, args.members)
+    try:
+        with httpx.Client(base_url=args.http_url, timeout=None) as http:
+            timed("legacy full scan (db only)", args.runs, legacy_listing)
+            timed("listing with members", args.runs,
+                  lambda: walk(http, True, args.limit))
+            timed("listing without members", args.runs,
+                  lambda: walk(http, False, args.limit))
+            timed("first page without members", args.runs,
+                  lambda: http.get("/organizations", params={
+                      "limit": args.limit, "include_members": False}))
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--http-url", default="http://localhost:8000")
+    parser.add_argument("--orgs", type=int, default=1000)
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=5)
+    main(parser.parse_args())
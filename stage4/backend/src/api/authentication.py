@@ -5,24 +5,35 @@ from typing import Annotated
 
 import jwt
 from bson.objectid import ObjectId
-from constants import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY
+from constants import (ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY,
+                       USER_CACHE_SIZE, USER_CACHE_TTL)
 from core.NewUser import NewUser
+from core.TTLCache import TTLCache
 from core.User import User
-from db import get_engine_db
+from db import get_async_engine_db, get_engine_db
 from fastapi import Depends
 from fastapi.exceptions import HTTPException
 from fastapi.routing import APIRouter
 from fastapi.security.oauth2 import (OAuth2PasswordBearer,
                                      OAuth2PasswordRequestForm)
+from indexes import duplicated_key
 from jwt.exceptions import ExpiredSignatureError, PyJWTError
-from pwdlib import PasswordHash
+from pymongo.errors import DuplicateKeyError
 from services.email_service import (generate_verification_token,
                                     decode_verification_token,
                                     send_verification_email)
+from services.password_service import hash_password, verify_password
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 auth = APIRouter(prefix="/auth", tags=["Authentication"])
-password_hash = PasswordHash.recommended()
+# users of recent requests by user_id, the endpoints changing a user
+# invalidate it and other processes see the change once it expires
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def invalidate_user(user_id: str):
+    """Forget the cached user after it changed"""
+    user_cache.invalidate(user_id)
 
 
 def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
@@ -39,6 +50,10 @@ def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     if not user_id:
         raise HTTPException(status_code=401, detail="token missing user_id")
 
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
     try:
         object_id = ObjectId(user_id)
     except Exception as ex:
@@ -56,59 +71,58 @@ def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
              for k, v in found.items()}
     found["user_id"] = str(found["user_id"])
 
-    return User(**found)
+    user = User(**found)
+    user_cache.set(user_id, user)
+    return user
 
 
 @auth.post("/register")
-def register_endpoint(user: NewUser):
+async def register_endpoint(user: NewUser):
     """Registeration endpoint to create a new user"""
-    db = get_engine_db()
+    db = get_async_engine_db()
 
-    if db.users.find_one({"username": user.username}):
-        raise HTTPException(
-            status_code=422,
-            detail="USERNAME_ALREADY_EXIST"
+    password = await hash_password(user.password)
+    current_time = datetime.now(timezone.utc)
+    try:
+        await db.users.insert_one(
+            {
+                "username": user.username,
+                "email": [{
+                    "value": user.email,
+                    "is_verified": False
+                }],
+                "password": password,
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "_created_at": current_time,
+                "_updated_at": current_time,
+            }
         )
-
-    if db.users.find_one({"email.value": user.email}):
+    except DuplicateKeyError as ex:
         raise HTTPException(
             status_code=422,
-            detail="EMAIL_ALREADY_EXIST"
-        )
-
-    current_time = datetime.now(timezone.utc)
-    db.users.insert_one(
-        {
-            "username": user.username,
-            "email": [{
-                "value": user.email,
-                "is_verified": False
-            }],
-            "password": password_hash.hash(user.password),
-            "first_name": user.first_name,
-            "last_name": user.last_name,
-            "_created_at": current_time,
-            "_updated_at": current_time,
-        }
-    )
+            detail=("USERNAME_ALREADY_EXIST"
+                    if duplicated_key(ex) == "username"
+                    else "EMAIL_ALREADY_EXIST")
+        ) from ex
     token = generate_verification_token(user.email)
-    send_verification_email(user.email, token, user.username)
+    await send_verification_email(user.email, token, user.username)
 
     return {"message": "USER_REGISTERED"}
 
 
 @auth.post("/login")
-def login_endpoint(
+async def login_endpoint(
     user: Annotated[OAuth2PasswordRequestForm, Depends()],
 ):
     """Login endpoint"""
 
-    db = get_engine_db()
+    db = get_async_engine_db()
 
-    found = db.users.find_one({"username": user.username})
+    found = await db.users.find_one({"username": user.username})
     if not found:
         raise HTTPException(status_code=401, detail="INVALID_USERNAME")
-    if not password_hash.verify(user.password, found["password"]):
+    if not await verify_password(user.password, found["password"]):
         raise HTTPException(status_code=401, detail="INVALID_PASSWORD")
 
     exp_time = datetime.now(timezone.utc) + timedelta(
@@ -141,16 +155,18 @@ def verify_email_endpoint(token: str):
 
     db = get_engine_db()
 
-    result = db.users.update_one(
+    found = db.users.find_one_and_update(
         {"email.value": email},
         {
             "$set": {
                 "email.$.is_verified": True,
             }
-        }
+        },
+        projection={"_id": 1}
     )
 
-    if result.matched_count == 0:
+    if found is None:
         raise HTTPException(status_code=404, detail="EMAIL_NOT_FOUND")
+    invalidate_user(str(found["_id"]))
 
     return {"message": "EMAIL_VERIFIED"}
@@ -1,85 +1,248 @@
 """Chat websocket definition
 """
+import asyncio
+import json
 from datetime import datetime, timezone
+from os import environ
 
-import jwt
+import orjson
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
-from constants import ALGORITHM, SECRET_KEY
+from constants import CHAT_HISTORY_MAX_PAGE_SIZE, CHAT_HISTORY_PAGE_SIZE
+from core.Backplane import Backplane, InMemoryBackplane
 from core.ConnectionManager import ConnectionManager
+from core.User import User
+from core.MessageWriteBuffer import MessageWriteBuffer
+from core.MongoBackplane import MongoBackplane
+from core.RecentMessagesCache import RecentMessagesCache
 from db import get_engine_db
-from fastapi import status
+from fastapi import Query, status
+from fastapi.exceptions import HTTPException
 from fastapi.routing import APIRouter
 from fastapi.websockets import WebSocket, WebSocketDisconnect
-from jwt.exceptions import ExpiredSignatureError, PyJWTError
-from spam_model import is_spam
+from services.membership import is_member
+from services.message_store import get_messages, save_message
+from services.user_directory import get_sender, get_senders
+from spam_model import is_spam_async
+
+from .authentication import AuthUser, get_current_user
+from .groups import group_access_error
+
+
+def create_backplane() -> Backplane:
+    """Backplane chosen by CHAT_BACKPLANE, "mongo" is needed as soon as more
+    than one process serves the chat
+    """
+    if environ.get("CHAT_BACKPLANE", "memory") == "mongo":
+        return MongoBackplane()
+    return InMemoryBackplane()
+
 
 chat = APIRouter(prefix="/ws/chat", tags=["chat"])
-manager = ConnectionManager()
+chat_history = APIRouter(prefix="/chat", tags=["chat"])
+manager = ConnectionManager(backplane=create_backplane())
+recent_messages = RecentMessagesCache()
+# CHAT_WRITE_BEHIND=1 saves messages in batches after broadcasting them
+write_buffer = (MessageWriteBuffer()
+                if environ.get("CHAT_WRITE_BEHIND", "0") == "1" else None)
 
 
-def get_messages_with_users(room_id: str, is_org: bool):
-    """Gets messages with user info for org or group"""
+def room_access_error(user: User, room_id: ObjectId) -> str | None:
+    """Check if the user can read and write the chat of an organization or
+    a group, the members only and for a group the allowed email domains
+    Returns None if access granted, the error code otherwise
+    """
     db = get_engine_db()
+    user_id = ObjectId(user.user_id)
+    group = db.groups.find_one({"_id": room_id},
+                               {"admin": 1, "AllowedEmailDomains": 1})
+    if group is not None:
+        if group.get("admin") == user_id:
+            return None
+        collection = db.groups
+        access_error = group_access_error(
+            user, group.get("AllowedEmailDomains", []))
+    elif db.organizations.count_documents({"_id": room_id}, limit=1) == 1:
+        collection = db.organizations
+        access_error = None
+    else:
+        return "ROOM_NOT_FOUND"
+
+    if access_error is None and not is_member(collection, room_id, user_id):
+        access_error = "NOT_A_MEMBER"
+    return access_error
+
 
-    collection = db. organizations if is_org else db.groups
+def format_timestamp(timestamp: datetime) -> str:
+    """Format a message timestamp the way the clients expect it"""
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%S.") + \
+        f"{timestamp.microsecond // 1000:03d}Z"
 
-    pipeline = [
-        {"$match": {"_id": ObjectId(room_id)}},
-        {"$unwind": {"path": "$messages",
-                     "preserveNullAndEmptyArrays": False}},
+
+async def get_messages_with_users(room_id: str, before: str | None = None,
+                                  limit: int = CHAT_HISTORY_PAGE_SIZE):
+    """Gets up to `limit` messages with user info for org or group,
+    oldest first, optionally only the ones older than the message `before`
+    """
+    room_obj_id = ObjectId(room_id)
+    before_id = ObjectId(before) if before else None
+    # taken before reading the database, a message written meanwhile is
+    # found in one or the other
+    buffered = write_buffer.buffered(room_obj_id) if write_buffer else []
+    messages = await get_messages(room_obj_id, before_id, limit)
+    if buffered:
+        stored = {m["_id"] for m in messages}
+        messages = sorted(messages + [
+            m for m in buffered
+            if m["_id"] not in stored and (before_id is None
+                                           or m["_id"] < before_id)
+        ], key=lambda m: m["_id"])[-limit:]
+
+    senders = await get_senders(m["sender_id"] for m in messages)
+
+    return [
         {
-            "$lookup": {
-                "from": "users",
-                "localField": "messages.sender_id",
-                "foreignField":  "_id",
-                "as":  "sender_info"
+            "message_id": str(m["_id"]),
+            "content": m["content"],
+            "timestamp": format_timestamp(m["timestamp"]),
+            "user": {
+                "_id": str(m["sender_id"]),
+                "username": senders.get(m["sender_id"], {}).get("username"),
             }
-        },
-        {"$unwind": {"path": "$sender_info",
-                     "preserveNullAndEmptyArrays": True}},
+        }
+        for m in messages
+    ]
+
+
+async def refresh_usernames(messages: list[dict]) -> list[dict]:
+    """Copies of history messages with the current usernames of their
+    senders, for the ones cached before a user changed it
+    """
+    senders = await get_senders(ObjectId(m["user"]["_id"]) for m in messages)
+    return [
         {
-            "$project": {
-                "_id": 0,
-                "message_id": {"$toString": "$messages._id"},
-                "content": "$messages.content",
-                "timestamp": {
-                    "$dateToString": {
-                        "format": "%Y-%m-%dT%H:%M:%S.%LZ",  # ← Remove space
-                        "date": "$messages.timestamp",
-                        "timezone":  "UTC"
-                    }
-                },
-                "user": {
-                    "_id": {"$toString":  "$sender_info._id"},
-                    "username":  "$sender_info.username",
-                }
+            **m,
+            "user": {
+                "_id": m["user"]["_id"],
+                "username": senders.get(
+                    ObjectId(m["user"]["_id"]), {}).get("username"),
             }
         }
+        for m in messages
     ]
 
-    return list(collection.aggregate(pipeline))
 
+async def get_history_page(room_id: str, before: str | None = None,
+                           limit: int = CHAT_HISTORY_PAGE_SIZE):
+    """Gets a page of the room history along with the cursor of the next
+    (older) page, the cursor is None when there is nothing older
+
+    Pages within the latest messages are served from memory, loading the
+    latest page of a room that is not cached yet caches it.
+    """
+    page = recent_messages.get_page(room_id, before, limit)
+    if page is not None:
+        page["data"] = await refresh_usernames(page["data"])
+        return page
+
+    if before is None and room_id not in recent_messages:
+        capacity = recent_messages.capacity
+        recent_messages.begin_fill(room_id)
+        try:
+            messages = await get_messages_with_users(
+                room_id, None, max(limit, capacity) + 1)
+        except Exception:
+            recent_messages.discard(room_id)
+            raise
+        # never complete with write-behind, this process or another one may
+        # still buffer older messages missing from the database
+        recent_messages.fill(room_id, messages[-capacity:],
+                             len(messages) <= capacity and not write_buffer)
+    else:
+        # fetch one extra message to know if there is an older page
+        messages = await get_messages_with_users(room_id, before, limit + 1)
+
+    has_more = len(messages) > limit
+    messages = messages[-limit:]
+
+    return {
+        "data": messages,
+        "has_more": has_more,
+        "next_cursor": messages[0]["message_id"] if has_more else None,
+    }
+
+
+def cache_broadcast(room_id: str, frame: str):
+    """Add the messages broadcast to a cached room, by this process or
+    another one, to its latest messages
+    """
+    if room_id not in recent_messages:
+        return
+    message = orjson.loads(frame)
+    if "id" not in message or "content" not in message:
+        return
+    recent_messages.append(room_id, {
+        "message_id": message["id"],
+        "content": message["content"],
+        "timestamp": format_timestamp(
+            datetime.fromisoformat(message["timestamp"])),
+        "user": {
+            "_id": message["sender_id"],
+            "username": message["username"],
+        }
+    })
 
-def save_message_to_db(room_id: str, is_org:  bool, message: dict):
-    """Saves a message to the appropriate collection"""
-    db = get_engine_db()
-    collection = db.organizations if is_org else db.groups
 
-    collection.update_one(
-        {"_id": ObjectId(room_id)},
-        {"$push": {"messages": message}}
-    )
+manager.backplane.subscribe(cache_broadcast)
 
 
-# pylint: disable=too-many-locals
+def parse_control_frame(text: str) -> dict | None:
+    """Return the request if the text received from the socket is a control
+    frame ({"type": "load_older", "before": ...}) instead of a chat message
+    """
+    if not text.startswith("{"):
+        return None
+    try:
+        frame = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(frame, dict) or frame.get("type") != "load_older":
+        return None
+    return frame
+
+
+async def save_message_to_db(room_id: str, message: dict):
+    """Saves a message to the history of the room, only buffering it when
+    write-behind is enabled
+    """
+    if write_buffer:
+        write_buffer.add(ObjectId(room_id), message)
+        return
+    await save_message(ObjectId(room_id), message)
+
+
+async def send_older_history(websocket: WebSocket, room_id: str, before):
+    """Answer a "load_older" control frame with the page before `before`"""
+    try:
+        page = await get_history_page(room_id, before)
+    except (InvalidId, TypeError):
+        await manager.send_personal_message({
+            "error": "INVALID_CURSOR"
+        }, websocket)
+        return
+    await manager.send_personal_message({
+        "type": "older_history",
+        **page
+    }, websocket)
+
+
+# pylint: disable=too-many-locals,too-many-statements
 @chat.websocket("")
 async def websocket_endpoint(websocket: WebSocket):
     """ route for websocket connection"""
     await websocket.accept()
 
-    db = get_engine_db()
     room_id = None
-    is_org = True
     user_id = None
 
     try:
@@ -87,46 +250,47 @@ async def websocket_endpoint(websocket: WebSocket):
         data = await websocket.receive_json()
         token = data.get("token")
         room_id = data.get("room_id")
-        is_org = data.get("isOrg", True)
 
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            print("token done decode")
-        except ExpiredSignatureError:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-            return
-        except PyJWTError:
+            user = await asyncio.to_thread(get_current_user, token)
+            access_error = await asyncio.to_thread(
+                room_access_error, user, ObjectId(room_id))
+        except (HTTPException, InvalidId, TypeError):
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
-
-        user_id = payload.get("user_id")
-        print(user_id)
-        if not user_id:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        if access_error is not None:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION,
+                                  reason=access_error)
             return
 
-        user_doc = db.users.find_one({"_id": ObjectId(user_id)})
-        print("db ok ?")
-        if not user_doc:
+        user_id = user.user_id
+        sender = await get_sender(ObjectId(user_id))
+        if not sender:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
 
-        username = user_doc.get("username")
         manager.connect(websocket, room_id)
 
-        await websocket.send_json({"type": "connected", "status": "ok"})
+        await manager.send_personal_message(
+            {"type": "connected", "status": "ok"}, websocket)
 
-        list_msges = get_messages_with_users(room_id, is_org)
         history_payload = {
             "type": "history",
-            "data": list_msges
+            **(await get_history_page(room_id))
         }
 
         await manager.send_personal_message(history_payload, websocket)
 
         while True:
             message_text = await websocket.receive_text()
-            if is_spam(message_text):
+
+            control = parse_control_frame(message_text)
+            if control is not None:
+                await send_older_history(websocket, room_id,
+                                         control.get("before"))
+                continue
+
+            if await is_spam_async(message_text):
                 await manager.send_personal_message({
                     "error": "MESSAGE_IS_SPAM"
                 }, websocket)
@@ -139,12 +303,14 @@ async def websocket_endpoint(websocket: WebSocket):
                 "timestamp": datetime.now(timezone.utc)
             }
 
-            save_message_to_db(room_id, is_org, new_message)
+            await save_message_to_db(room_id, new_message)
 
+            # cached, and picks up a username changed while connected
+            sender = await get_sender(ObjectId(user_id)) or sender
             broadcast_data = {
                 "id": str(new_message["_id"]),
                 "sender_id": user_id,
-                "username": username,
+                "username": sender["username"],
                 "content": message_text,
                 "timestamp": new_message["timestamp"].isoformat()
             }
@@ -160,3 +326,34 @@ async def websocket_endpoint(websocket: WebSocket):
             manager.disconnect(websocket, room_id)
         if websocket.client_state.name != "DISCONNECTED":
             await websocket.close()
+
+
+@chat_history.get("/{room_id}/messages")
+async def get_room_messages(
+    room_id: str,
+    user: AuthUser,
+    before: str | None = None,
+    limit: int = Query(CHAT_HISTORY_PAGE_SIZE, ge=1,
+                       le=CHAT_HISTORY_MAX_PAGE_SIZE),
+):
+    """Get a page of the room messages older than the message `before`,
+    the latest messages are returned when no cursor is given
+    """
+    try:
+        room_obj_id = ObjectId(room_id)
+    except Exception as ex:
+        raise HTTPException(
+            status_code=400, detail="INVALID_ROOM_ID"
+        ) from ex
+
+    access_error = await asyncio.to_thread(room_access_error, user,
+                                           room_obj_id)
+    if access_error == "ROOM_NOT_FOUND":
+        raise HTTPException(status_code=404, detail=access_error)
+    if access_error is not None:
+        raise HTTPException(status_code=403, detail=access_error)
+
+    try:
+        return await get_history_page(room_id, before, limit)
+    except InvalidId as ex:
+        raise HTTPException(status_code=400, detail="INVALID_CURSOR") from ex
@@ -1,30 +1,46 @@
 """Group API endpoints
 """
 
-import shutil
-import uuid
+import asyncio
 from datetime import datetime, timezone
-from pathlib import Path
 
+from typing import Literal
+
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
-from constants import GROUPS_RESOURCES_DIR
-from db import get_engine_db
-from fastapi import File, Form, UploadFile
+from constants import (RESOURCE_MAX_SIZE, RESOURCES_MAX_PAGE_SIZE,
+                       RESOURCES_PAGE_SIZE)
+from db import get_async_engine_db, get_engine_db
+from fastapi import File, Form, Query, Response, UploadFile
 from fastapi.exceptions import HTTPException
 from fastapi.routing import APIRouter
+from services.blob_store import release_blob, store_upload
+from services.group_tree import ancestors_of, build_tree, get_org_groups
+from services.membership import is_member
+from services.resources import get_counters, list_resources, vote
 
 from .authentication import AuthUser
 
 groups = APIRouter(prefix="/groups", tags=["Groups"])
-
-
-def check_group_access(user: AuthUser, allowed_domains: list[str]):
+# fields of the group summaries, the members are counted in members_count
+GROUP_SUMMARY = {
+    "title": 1,
+    "org_id": 1,
+    "admin": 1,
+    "parentGroupId": 1,
+    "members_count": 1,
+    "AllowedEmailDomains": 1,
+}
+
+
+def group_access_error(user: AuthUser,
+                       allowed_domains: list[str]) -> str | None:
     """Check if user can access group based on email domain
-    Returns None if access granted, raises HTTPException otherwise
+    Returns None if access granted, the error code otherwise
     """
     # No restrictions - allow everyone
     if not allowed_domains:
-        return
+        return None
 
     # Check all user emails
     has_matching_domain = False
@@ -40,14 +56,23 @@ def check_group_access(user: AuthUser, allowed_domains: list[str]):
 
     # User has verified email with allowed domain - grant access
     if has_verified_matching:
-        return
+        return None
 
     # User has matching domain but not verified
     if has_matching_domain:
-        raise HTTPException(status_code=403, detail="EMAIL_NOT_VERIFIED")
+        return "EMAIL_NOT_VERIFIED"
 
     # User has no email with allowed domain
-    raise HTTPException(status_code=403, detail="EMAIL_DOMAIN_NOT_ALLOWED")
+    return "EMAIL_DOMAIN_NOT_ALLOWED"
+
+
+def check_group_access(user: AuthUser, allowed_domains: list[str]):
+    """Check if user can access group based on email domain
+    Returns None if access granted, raises HTTPException otherwise
+    """
+    error = group_access_error(user, allowed_domains)
+    if error:
+        raise HTTPException(status_code=403, detail=error)
 
 
 @groups.get("/org/{org_id}")
@@ -71,7 +96,7 @@ def get_all_groups_in_organization(org_id: str):
         ]
     }
 
-    groups_data = list(db.groups.find(query))
+    groups_data = list(db.groups.find(query, GROUP_SUMMARY))
 
     groups_list = []
     for group in groups_data:
@@ -80,13 +105,47 @@ def get_all_groups_in_organization(org_id: str):
             "title": group["title"],
             "org_id": str(group.get("org_id", "")),
             "admin": str(group.get("admin", "")),
-            "members_count": len(group.get("members", [])),
+            "members_count": group.get("members_count", 0),
             "AllowedEmailDomains": group.get("AllowedEmailDomains", [])
         })
 
     return groups_list
 
 
+@groups.get("/org/{org_id}/tree")
+def get_organization_groups_tree(
+    org_id: str,
+    user: AuthUser,
+    max_depth: int | None = Query(None, ge=1),
+):
+    """Get the groups of an Organization nested under their parents, down
+    to max_depth levels when given, with the access of the user to each
+    """
+    try:
+        org_obj_id = ObjectId(org_id)
+    except Exception as ex:
+        raise HTTPException(
+            status_code=400, detail="Invalid org_id format"
+        ) from ex
+
+    def node(group):
+        is_admin = str(group.get("admin")) == user.user_id
+        access_error = None if is_admin else group_access_error(
+            user, group.get("AllowedEmailDomains", []))
+        return {
+            "group_id": str(group["_id"]),
+            "title": group["title"],
+            "admin": str(group.get("admin", "")),
+            "members_count": group.get("members_count", 0),
+            "AllowedEmailDomains": group.get("AllowedEmailDomains", []),
+            "is_admin": is_admin,
+            "can_access": access_error is None,
+            "access_error": access_error,
+        }
+
+    return build_tree(get_org_groups(org_obj_id), max_depth, node)
+
+
 @groups.get("/{group_id}")
 def get_group_by_id(group_id: str, user: AuthUser):
     """Get a group by its ID"""
@@ -99,7 +158,7 @@ def get_group_by_id(group_id: str, user: AuthUser):
             status_code=400, detail="Invalid group_id format"
         ) from ex
 
-    group = db.groups.find_one({"_id": group_obj_id})
+    group = db.groups.find_one({"_id": group_obj_id}, GROUP_SUMMARY)
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
@@ -119,7 +178,7 @@ def get_group_by_id(group_id: str, user: AuthUser):
             if group.get("parentGroupId")
             else None
         ),
-        "members_count": len(group.get("members", [])),
+        "members_count": group.get("members_count", 0),
         "AllowedEmailDomains": group.get("AllowedEmailDomains", [])
     }
 
@@ -136,7 +195,8 @@ def get_subgroups_of_group(group_id: str, user: AuthUser):
             status_code=400, detail="Invalid group_id format"
         ) from ex
 
-    parent_group = db.groups.find_one({"_id": group_obj_id})
+    parent_group = db.groups.find_one({"_id": group_obj_id},
+                                      {"members": 0, "resources": 0})
     if not parent_group:
         raise HTTPException(status_code=404, detail="Group not found")
 
@@ -161,7 +221,8 @@ def get_subgroups_of_group(group_id: str, user: AuthUser):
         except Exception:
             continue
 
-    subgroups_data = db.groups.find({"_id": {"$in": subgroup_obj_ids}})
+    subgroups_data = db.groups.find({"_id": {"$in": subgroup_obj_ids}},
+                                    GROUP_SUMMARY)
 
     subgroups_list = []
     for group in subgroups_data:
@@ -170,7 +231,7 @@ def get_subgroups_of_group(group_id: str, user: AuthUser):
             "title": group["title"],
             "org_id": str(group.get("org_id", "")),
             "admin": str(group.get("admin", "")),
-            "members_count": len(group.get("members", [])),
+            "members_count": group.get("members_count", 0),
             "AllowedEmailDomains": group.get("AllowedEmailDomains", [])
         })
 
@@ -178,7 +239,7 @@ def get_subgroups_of_group(group_id: str, user: AuthUser):
 
 
 @groups.post("/{gid}/resources")
-def add_new_resource_to_a_groupa(
+async def add_new_resource_to_a_groupa(
     user: AuthUser,
     gid: str,
     name: str = Form(..., min_length=3, max_length=50),
@@ -195,52 +256,56 @@ def add_new_resource_to_a_groupa(
             status_code=400, detail="INVALID_GROUP_ID_FORMAT"
         ) from ex
 
-    db = get_engine_db()
+    db = get_async_engine_db()
 
     # Check if group exists
-    group = db.groups.find_one({"_id": group_obj_id})
+    group = await db.groups.find_one({"_id": group_obj_id}, {"_id": 1})
     if not group:
         raise HTTPException(status_code=404, detail="GROUP_NOT_FOUND")
 
     # Check if user is a member
-    if ObjectId(user.user_id) not in group.get("members", []):
+    if not await asyncio.to_thread(is_member, get_engine_db().groups,
+                                   group_obj_id, ObjectId(user.user_id)):
         raise HTTPException(status_code=403, detail="USER_NOT_A_MEMBER")
 
-    # Generate unique filename:  timestamp_uuid. extension
-    file_extension = Path(file.filename).suffix if file. filename else ""
-    timestamp = int(datetime.now(timezone. utc).timestamp())
-    unique_id = uuid.uuid4().hex
-    unique_filename = f"{timestamp}_{unique_id}{file_extension}"
-
-    # Save file to disk
-    file_path = GROUPS_RESOURCES_DIR / unique_filename
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    stored = await store_upload(file, RESOURCE_MAX_SIZE)
 
     # Create resource document
-    file_url = f"{GROUPS_RESOURCES_DIR}/{unique_filename}"
     current_time = datetime.now(timezone.utc)
-    new_resource = {
-        "_id":  ObjectId(),
-        "name":  name,
-        "description": description,
-        "file_url": file_url,
-        "uploaded_by": user.username,
-        "upvotes": [],
-        "downvotes": [],
-        "_created_at": current_time,
-    }
-
-    # Push resource to group's resources array
-    db.groups.update_one(
-        {"_id": group_obj_id},
-        {"$push":  {"resources": new_resource}}
-    )
+    try:
+        await db.resources.insert_one({
+            "group_id": group_obj_id,
+            "name":  name,
+            "description": description,
+            "file_url": stored["url"],
+            "blob": stored["_id"],
+            "size": stored["size"],
+            "uploaded_by": user.username,
+            "upvotes": 0,
+            "downvotes": 0,
+            "score": 0,
+            "_created_at": current_time,
+        })
+    except BaseException:
+        # no resource points to the file, also when the client went away
+        await release_blob(stored["_id"])
+        raise
 
 
 @groups.get("/{gid}/resources")
-def get_resources(gid: str):
-    """Get all resources belonging to a group
+def get_resources(
+    gid: str,
+    response: Response,
+    sort: Literal["newest", "score"] = "newest",
+    after: str | None = None,
+    limit: int = Query(RESOURCES_PAGE_SIZE, ge=1,
+                       le=RESOURCES_MAX_PAGE_SIZE),
+):
+    """Get a page of the resources belonging to a group, the newest or the
+    best scored first
+
+    The cursor to pass as `after` for the next page is sent in the
+    X-Next-Cursor header, which is missing on the last page.
     """
     db = get_engine_db()
 
@@ -250,14 +315,20 @@ def get_resources(gid: str):
         raise HTTPException(
             status_code=400, detail="Invalid group_id format") from ex
 
-    group = db.groups.find_one({"_id": group_obj_id})
-    if not group:
+    if db.groups.count_documents({"_id": group_obj_id}, limit=1) == 0:
         raise HTTPException(status_code=404, detail="Group not found")
-    resources = group.get("resources")
+
+    try:
+        resources, next_cursor = list_resources(
+            group_obj_id, sort, after, limit)
+    except (InvalidId, ValueError) as ex:
+        raise HTTPException(status_code=400, detail="INVALID_CURSOR") from ex
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     for r in resources:
         r["_id"] = str(r["_id"])
-        r["upvotes"] = len(r.get("upvotes", []))
-        r["downvotes"] = len(r.get("downvotes", []))
+        r["group_id"] = str(r["group_id"])
     return resources
 
 
@@ -265,42 +336,47 @@ def get_resources(gid: str):
 def get_group_breadcrumb_path(group_id: str):
     """breadcrumbs path fron group till org"""
     db = get_engine_db()
-    path = []
 
-    # 1. Get the current group to find the Org ID
-    group = db.groups.find_one({"_id": ObjectId(group_id)})
-    if not group:
+    # 1. Get the group with its ancestors and its Organization Name in a
+    #    single query
+    result = list(db.groups.aggregate([
+        {"$match": {"_id": ObjectId(group_id)}},
+        {"$lookup": {
+            "from": "groups",
+            "localField": "ancestors",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"title": 1}}],
+            "as": "ancestorsData",
+        }},
+        {"$lookup": {
+            "from": "organizations",
+            "localField": "org_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"organization_name": 1}}],
+            "as": "org",
+        }},
+        {"$project": {"title": 1, "org_id": 1, "parentGroupId": 1,
+                      "ancestors": 1, "ancestorsData": 1, "org": 1}},
+    ]))
+    if not result:
         raise HTTPException(status_code=404, detail="Group not found")
+    group = result[0]
 
     org_id = group.get("org_id")
-
-    # 2. Fetch the Organization Name
-    org = db.organizations.find_one(
-        {"_id": ObjectId(org_id)},
-        {"organization_name": 1}
-    )
-    org_name = org["organization_name"] if org else "منظمة غير معروفة"
-
-    # 3. Walk up the group tree
-    current_id = ObjectId(group_id)
-    while current_id:
-        g = db.groups.find_one({"_id": current_id},
-                               {"title": 1, "parentGroupId": 1})
-        if not g:
-            break
-
-        path.insert(0, {
-            "group_id": str(g["_id"]),
-            "title": g["title"]
-        })
-
-        parent_id = g.get("parentGroupId")
-        # Ensure we don't loop if parentGroupId is empty string or null
-        current_id = (
-            ObjectId(parent_id)
-            if parent_id and parent_id != ""
-            else None
-        )
+    org_name = (group["org"][0]["organization_name"] if group["org"]
+                else "منظمة غير معروفة")
+
+    # 2. Order the ancestors from the main group down to the group
+    ancestors = group.get("ancestors")
+    found = group["ancestorsData"]
+    if ancestors is None:
+        # not backfilled yet
+        ancestors = ancestors_of(group)
+        found = db.groups.find({"_id": {"$in": ancestors}}, {"title": 1})
+    titles = {g["_id"]: g["title"] for g in found}
+    path = [{"group_id": str(a), "title": titles[a]}
+            for a in ancestors if a in titles]
+    path.append({"group_id": str(group["_id"]), "title": group["title"]})
 
     return {
         "org_name": org_name,
@@ -309,135 +385,44 @@ def get_group_breadcrumb_path(group_id: str):
     }
 
 
-@groups.post("/{gid}/resources/{rid}/upvote")
-def upvote_resource(gid: str, rid: str, user: AuthUser):
-    """Upvote a resource in a group"""
-    db = get_engine_db()
-
+def parse_resource_ids(gid: str, rid: str) -> tuple[ObjectId, ObjectId]:
+    """the ObjectIds of a group and one of its resources"""
     try:
-        group_obj_id = ObjectId(gid)
-        resource_obj_id = ObjectId(rid)
+        return ObjectId(gid), ObjectId(rid)
     except Exception as ex:
         raise HTTPException(
             status_code=400, detail="Invalid ID format"
         ) from ex
 
-    group = db.groups.find_one({"_id": group_obj_id})
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
 
-    resource = next(
-        (res for res in group.get("resources", [])
-         if res["_id"] == resource_obj_id),
-        None
-    )
-    if not resource:
+def vote_resource(gid: str, rid: str, user: AuthUser, value: int):
+    """Cast or take back the vote of a user on a resource of a group"""
+    group_obj_id, resource_obj_id = parse_resource_ids(gid, rid)
+    counters = vote(group_obj_id, resource_obj_id,
+                    ObjectId(user.user_id), value)
+    if counters is None:
         raise HTTPException(status_code=404, detail="Resource not found")
+    return counters
 
-    user_id = user.user_id
-
-    # Check if user already upvoted
-    already_upvoted = user_id in resource.get("upvotes", [])
-
-    if already_upvoted:
-        # Remove upvote if already upvoted
-        db.groups.update_one(
-            {"_id": group_obj_id, "resources._id": resource_obj_id},
-            {"$pull": {"resources.$.upvotes": user_id}}
-        )
-    else:
-        # Remove downvote if exists
-        db.groups.update_one(
-            {"_id": group_obj_id, "resources._id": resource_obj_id},
-            {"$pull": {"resources.$.downvotes": user_id}}
-        )
 
-        # Add upvote
-        db.groups.update_one(
-            {"_id": group_obj_id, "resources._id": resource_obj_id},
-            {"$addToSet": {"resources.$.upvotes": user_id}}
-        )
+@groups.post("/{gid}/resources/{rid}/upvote")
+def upvote_resource(gid: str, rid: str, user: AuthUser):
+    """Upvote a resource in a group, upvoting again removes the upvote"""
+    return vote_resource(gid, rid, user, 1)
 
 
 @groups.post("/{gid}/resources/{rid}/downvote")
 def downvote_resource(gid: str, rid: str, user: AuthUser):
-    """Downvote a resource in a group"""
-    db = get_engine_db()
-
-    try:
-        group_obj_id = ObjectId(gid)
-        resource_obj_id = ObjectId(rid)
-    except Exception as ex:
-        raise HTTPException(
-            status_code=400, detail="Invalid ID format"
-        ) from ex
-
-    group = db.groups.find_one({"_id": group_obj_id})
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-
-    resource = next(
-        (res for res in group.get("resources", [])
-         if res["_id"] == resource_obj_id),
-        None
-    )
-    if not resource:
-        raise HTTPException(status_code=404, detail="Resource not found")
-
-    user_id = user.user_id
-
-    # Check if user already downvoted
-    already_downvoted = user_id in resource.get("downvotes", [])
-
-    if already_downvoted:
-        # Remove downvote if already downvoted
-        db.groups.update_one(
-            {"_id": group_obj_id, "resources._id": resource_obj_id},
-            {"$pull": {"resources.$.downvotes": user_id}}
-        )
-    else:
-        # Remove upvote if exists
-        db.groups.update_one(
-            {"_id": group_obj_id, "resources._id": resource_obj_id},
-            {"$pull": {"resources.$.upvotes": user_id}}
-        )
-
-        # Add downvote
-        db.groups.update_one(
-            {"_id": group_obj_id, "resources._id": resource_obj_id},
-            {"$addToSet": {"resources.$.downvotes": user_id}}
-        )
+    """Downvote a resource in a group, downvoting again removes the
+    downvote
+    """
+    return vote_resource(gid, rid, user, -1)
 
 
 @groups.get("/{gid}/resources/{rid}/votes")
 def get_resource_votes(gid: str, rid: str):
     """Get upvote and downvote counts for a resource in a group"""
-    db = get_engine_db()
-
-    try:
-        group_obj_id = ObjectId(gid)
-        resource_obj_id = ObjectId(rid)
-    except Exception as ex:
-        raise HTTPException(
-            status_code=400, detail="Invalid ID format"
-        ) from ex
-
-    group = db.groups.find_one({"_id": group_obj_id})
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-
-    resource = next(
-        (res for res in group.get("resources", [])
-         if res["_id"] == resource_obj_id),
-        None
-    )
-    if not resource:
+    counters = get_counters(*parse_resource_ids(gid, rid))
+    if counters is None:
         raise HTTPException(status_code=404, detail="Resource not found")
-
-    upvotes_count = len(resource.get("upvotes", []))
-    downvotes_count = len(resource.get("downvotes", []))
-
-    return {
-        "upvotes": upvotes_count,
-        "downvotes": downvotes_count
-    }
+    return counters
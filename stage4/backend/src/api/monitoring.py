@@ -0,0 +1,84 @@
+"""Monitoring API endpoints
+
+Only the users whose ids are listed, comma separated, in MONITORING_ADMINS
+can read them.
+"""
+from os import environ
+
+from db import get_pool_stats
+from fastapi import Depends
+from fastapi.exceptions import HTTPException
+from fastapi.routing import APIRouter
+from services.email_service import outbox
+from services.group_tree import tree_cache
+from services.image_service import image_pipeline
+from services.password_service import hashing_pool
+from services.user_directory import sender_cache
+
+from .authentication import AuthUser, user_cache
+from .chat import manager, recent_messages, write_buffer
+
+MONITORING_ADMINS = {user_id.strip() for user_id in
+                     environ.get("MONITORING_ADMINS", "").split(",")
+                     if user_id.strip()}
+
+
+def require_admin(user: AuthUser):
+    """Refuse the users who are not monitoring admins"""
+    if user.user_id not in MONITORING_ADMINS:
+        raise HTTPException(status_code=403, detail="NOT_AN_ADMIN")
+
+
+monitoring = APIRouter(prefix="/monitoring", tags=["Monitoring"],
+                       dependencies=[Depends(require_admin)])
+
+
+@monitoring.get("/chat")
+def get_chat_stats():
+    """Connections and outbound queue depths of the chat rooms, the caches
+    of their latest messages and senders and the write-behind buffer when
+    enabled
+    """
+    return {
+        "rooms": manager.queue_depths(),
+        "recent_messages": recent_messages.stats(),
+        "senders": sender_cache.stats(),
+        "write_behind": write_buffer.stats() if write_buffer else None,
+    }
+
+
+@monitoring.get("/auth")
+def get_auth_stats():
+    """Size and hit counters of the authenticated users cache and the load
+    of the password hashing workers
+    """
+    return {
+        "users": user_cache.stats(),
+        "password_hashing": hashing_pool.stats(),
+    }
+
+
+@monitoring.get("/email")
+def get_email_stats():
+    """Emails sent, retried and given up by the outbox worker"""
+    return outbox.stats()
+
+
+@monitoring.get("/images")
+def get_images_stats():
+    """Images rendered, retried and given up by the image pipeline and the
+    load of its workers
+    """
+    return image_pipeline.stats()
+
+
+@monitoring.get("/groups")
+def get_groups_stats():
+    """Size and hit counters of the cached organization trees"""
+    return {"trees": tree_cache.stats()}
+
+
+@monitoring.get("/db")
+def get_db_stats():
+    """Options and connection pool statistics of the database clients"""
+    return get_pool_stats()
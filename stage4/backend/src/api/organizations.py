@@ -1,19 +1,24 @@
 """Organizations API endpoints
 """
-import shutil
 from datetime import datetime, timezone
-from pathlib import Path
 from typing import List
 
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
-from constants import ORG_PHOTOS_DIR
+from constants import (DEFAULT_ORG_PHOTO_URL, ORG_PHOTO_MAX_SIZE,
+                       ORGS_MAX_PAGE_SIZE, ORGS_PAGE_SIZE)
 from core.NewGroupData import NewGroupData
 from core.NewOrganizationForm import NewOrganizationForm
 from core.Organization import Organization
-from db import get_engine_db
-from fastapi import Depends
+from db import get_async_engine_db, get_engine_db
+from fastapi import Depends, Query, Response
 from fastapi.exceptions import HTTPException
 from fastapi.routing import APIRouter
+from pymongo.errors import DuplicateKeyError
+from services.blob_store import release_blob, store_upload
+from services.group_tree import child_ancestors, invalidate_org_tree
+from services.image_service import get_photo_variants, image_pipeline
+from services.membership import add_member, get_member_ids, is_member
 
 from .authentication import AuthUser
 
@@ -26,16 +31,10 @@ async def create_education_organization(
 ):
     """route to create new Organization"""
 
-    db = get_engine_db()
-    is_found = db.organizations.find_one(
-        {"organization_name": form.organization_name}
-    )
-    if is_found:
-        raise HTTPException(
-            status_code=422, detail="Organization already added"
-        )
+    db = get_async_engine_db()
 
-    photo_url = "/static/uploads/organizations/RR.gif"
+    blob = None
+    photo_url = DEFAULT_ORG_PHOTO_URL
     if form.photo and form.photo.filename:
 
         if form.photo.content_type not in ["image/jpeg", "image/png",
@@ -45,58 +44,106 @@ async def create_education_organization(
                 detail="Only JPEG, PNG, and GIF images are allowed."
             )
 
-        file_extension = Path(form.photo.filename).suffix
-        unique_name = f"{int(datetime.now(timezone.utc).timestamp())}"
-        unique_name += f"{file_extension}"
-        file_path = ORG_PHOTOS_DIR / unique_name
-
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(form.photo.file, buffer)
-
-        photo_url = f"{ORG_PHOTOS_DIR}/{unique_name}"
+        stored = await store_upload(form.photo, ORG_PHOTO_MAX_SIZE)
+        blob = stored["_id"]
+        photo_url = stored["url"]
 
     current_time = datetime.now(timezone.utc)
-    org_id = db.organizations.insert_one(
-        {
-            "organization_name": form.organization_name,
-            "email_domain": form.email_domain,
-            "location": form.location,
-            "photo_url": photo_url,
-            "members": [],
-            "messages": [],
-            "_banned_members": [],
-            "_created_at": current_time,
-            "_updated_at": current_time,
-        }
-    )
+    try:
+        org_id = await db.organizations.insert_one(
+            {
+                "organization_name": form.organization_name,
+                "email_domain": form.email_domain,
+                "location": form.location,
+                "photo_url": photo_url,
+                "blob": blob,
+                "members_count": 0,
+                "_banned_members": [],
+                "_created_at": current_time,
+                "_updated_at": current_time,
+            }
+        )
+    except DuplicateKeyError as ex:
+        if blob:
+            await release_blob(blob)
+        raise HTTPException(
+            status_code=422, detail="Organization already added"
+        ) from ex
+    except BaseException:
+        # the upload is referenced by nothing, cancelled requests included
+        if blob:
+            await release_blob(blob)
+        raise
+    if blob:
+        await image_pipeline.enqueue(blob)
     return {"message": "Organization added successfully",
             "organization_id": str(org_id.inserted_id)}
 
 
 @orgs.get("")
-def get_all_organization() -> List[Organization]:
-    """route to get all Organizations"""
+def get_all_organization(
+    response: Response,
+    after: str | None = None,
+    limit: int = Query(ORGS_PAGE_SIZE, ge=1, le=ORGS_MAX_PAGE_SIZE),
+    include_members: bool = True,
+) -> List[Organization]:
+    """route to get a page of the Organizations, the ones after the
+    organization id `after`
+
+    The id to pass as `after` for the next page is sent in the X-Next-Cursor
+    header, which is missing on the last page.
+    """
+    match = {}
+    if after:
+        try:
+            match["_id"] = {"$gt": ObjectId(after)}
+        except InvalidId as ex:
+            raise HTTPException(
+                status_code=400, detail="INVALID_CURSOR") from ex
+
+    # only the fields of the response leave the database
+    projection = {
+        "organization_name": 1,
+        "email_domain": 1,
+        "location": 1,
+        "photo_url": 1,
+        "blob": 1,
+        "members_count": 1,
+    }
+    if include_members:
+        projection["members"] = 1
 
     db = get_engine_db()
-    orgs_data = db.organizations.find()
-
-    orgs_list = []
-    for org in orgs_data:
-        member_ids_as_strings = [str(m) for m in org.get("members", [])]
-        user_count = len(member_ids_as_strings)
-        orgs_list.append(
-            Organization(**{
-                "organization_id": str(org["_id"]),
-                "organization_name": org["organization_name"],
-                "email_domain": org["email_domain"],
-                "location": org["location"],
-                "photo_url": org["photo_url"],
-                "members": member_ids_as_strings,
-                "members_count": user_count,
-            })
-        )
-
-    return orgs_list
+    orgs_data = list(
+        db.organizations.find(match, projection)
+        .sort("_id", 1).limit(limit + 1)
+    )
+    if len(orgs_data) > limit:
+        orgs_data = orgs_data[:limit]
+        response.headers["X-Next-Cursor"] = str(orgs_data[-1]["_id"])
+
+    members = {}
+    if include_members:
+        members = get_member_ids(
+            [org["_id"] for org in orgs_data],
+            {org["_id"]: org.get("members", []) for org in orgs_data})
+    variants = get_photo_variants(
+        [org["blob"] for org in orgs_data if org.get("blob")])
+
+    return [
+        Organization(**{
+            "organization_id": str(org["_id"]),
+            "organization_name": org["organization_name"],
+            "email_domain": org["email_domain"],
+            "location": org["location"],
+            "photo_url": org["photo_url"],
+            "photo_variants": variants.get(org.get("blob"), {}),
+            "members": ([str(m) for m in members[org["_id"]]]
+                        if include_members else None),
+            "members_count": org.get("members_count", 0),
+        })
+        for org in orgs_data
+    ]
 
 
 @orgs.get("/{org_id}")
@@ -114,16 +161,19 @@ def get_organization_by_id(org_id: str) -> Organization:
     if not org:
         raise HTTPException(status_code=404, detail="ORGANIZATION_NOT_FOUND")
 
-    member_ids_as_strings = [str(m) for m in org.get("members", [])]
+    member_ids = get_member_ids(
+        [org_obj_id], {org_obj_id: org.get("members", [])})[org_obj_id]
+    member_ids_as_strings = [str(m) for m in member_ids]
     return Organization(**{
         "organization_id": str(org["_id"]),
         "organization_name": org["organization_name"],
         "email_domain": org["email_domain"],
         "location": org["location"],
         "photo_url": org["photo_url"],
-        "messages": org["messages"],
+        "photo_variants": (get_photo_variants([org["blob"]])
+                           .get(org["blob"], {}) if org.get("blob") else {}),
         "members": member_ids_as_strings,
-        "members_count": len(org["members"]),
+        "members_count": org.get("members_count", 0),
     })
 
 
@@ -163,31 +213,25 @@ def create_group(org_id: str, user: AuthUser, new_group: NewGroupData):
     # CASE A: Create Group in Org
     # -------------------------
     if not new_group.parent_group_id:
-        found = db.groups.find_one(
-            {
-                "org_id": org_obj_id,
-                "title": title,
-                "parentGroupId": {"$exists": False},
-            }
-        )
-        if found:
-            raise HTTPException(status_code=422, detail="GROUP_ALREADY_EXIST")
-
-        inserted = db.groups.insert_one(
-            {
-                "title": title,
-                "org_id": org_obj_id,
-                "messages": [],
-                "resources": [],
-                "members": [user_obj_id],
-                "subGroups": [],
-                "AllowedEmailDomains": [],
-                "admin": user_obj_id,
-                "_created_at": current_time,
-                "_updated_at": current_time,
-            }
-        )
+        try:
+            inserted = db.groups.insert_one(
+                {
+                    "title": title,
+                    "org_id": org_obj_id,
+                    "ancestors": [],
+                    "members_count": 0,
+                    "subGroups": [],
+                    "AllowedEmailDomains": [],
+                    "admin": user_obj_id,
+                    "_created_at": current_time,
+                    "_updated_at": current_time,
+                }
+            )
+        except DuplicateKeyError as ex:
+            raise HTTPException(
+                status_code=422, detail="GROUP_ALREADY_EXIST") from ex
         new_id = inserted.inserted_id
+        add_member(db.groups, new_id, user_obj_id)
 
     # -------------------------
     # CASE B: Create SubGroup inside Parent Group
@@ -207,43 +251,36 @@ def create_group(org_id: str, user: AuthUser, new_group: NewGroupData):
             {
                 "_id": parent_obj_id,
                 "org_id": org_obj_id,
-            }
+            },
+            {"parentGroupId": 1, "ancestors": 1}
         )
         if not parent:
             raise HTTPException(
                 status_code=404, detail="PARENT_GROUP_NOT_FOUND")
 
         # user must be member (entered the group)
-        if user_obj_id not in parent.get("members", []):
+        if not is_member(db.groups, parent_obj_id, user_obj_id):
             raise HTTPException(status_code=403, detail="NOT_A_MEMBER")
 
-        # unique subgroup title under same parent
-        found = db.groups.find_one(
-            {
-                "org_id": org_obj_id,
-                "parentGroupId": parent_obj_id,
-                "title": title,
-            }
-        )
-        if found:
+        # the title is unique under the parent (org_parent_title_unique)
+        try:
+            inserted = db.groups.insert_one(
+                {
+                    "title": title,
+                    "org_id": org_obj_id,
+                    "parentGroupId": parent_obj_id,
+                    "ancestors": child_ancestors(parent),
+                    "members_count": 0,
+                    "subGroups": [],
+                    "AllowedEmailDomains": [],
+                    "admin": user_obj_id,
+                    "_created_at": current_time,
+                    "_updated_at": current_time,
+                }
+            )
+        except DuplicateKeyError as ex:
             raise HTTPException(
-                status_code=422, detail="SUBGROUP_ALREADY_EXIST")
-
-        inserted = db.groups.insert_one(
-            {
-                "title": title,
-                "org_id": org_obj_id,
-                "parentGroupId": parent_obj_id,
-                "messages": [],
-                "resources": [],
-                "members": [user_obj_id],
-                "subGroups": [],
-                "AllowedEmailDomains": [],
-                "admin": user_obj_id,
-                "_created_at": current_time,
-                "_updated_at": current_time,
-            }
-        )
+                status_code=422, detail="SUBGROUP_ALREADY_EXIST") from ex
 
         # link subgroup into parent.subGroups
         db.groups.update_one(
@@ -254,6 +291,9 @@ def create_group(org_id: str, user: AuthUser, new_group: NewGroupData):
             },
         )
         new_id = inserted.inserted_id
+        add_member(db.groups, new_id, user_obj_id)
+
+    invalidate_org_tree(org_obj_id)
 
     # -------------------------
     # Pipeline: return created group with populated subGroups
@@ -276,13 +316,6 @@ def create_group(org_id: str, user: AuthUser, new_group: NewGroupData):
                 "org_id": {"$toString": "$org_id"},
                 "parent_group_id": {"$toString": "$parentGroupId"},
                 "admin": {"$toString": "$admin"},
-                "members": {
-                    "$map": {
-                        "input": "$members",
-                        "as": "m",
-                        "in": {"$toString": "$$m"}
-                    }
-                },
                 "subGroups": {
                     "$map": {
                         "input": "$subGroupsData",
@@ -291,7 +324,9 @@ def create_group(org_id: str, user: AuthUser, new_group: NewGroupData):
                             "group_id": {"$toString": "$$sg._id"},
                             "title": "$$sg.title",
                             "admin": {"$toString": "$$sg.admin"},
-                            "members_count": {"$size": "$$sg.members"},
+                            "members_count": {
+                                "$ifNull": ["$$sg.members_count", 0]
+                            },
                         },
                     }
                 },
@@ -300,7 +335,10 @@ def create_group(org_id: str, user: AuthUser, new_group: NewGroupData):
     ]
 
     result = list(db.groups.aggregate(pipeline))
-    return result[0] if result else {}
+    if not result:
+        return {}
+    # the creator is the only member of the new group
+    return {**result[0], "members": [str(user_obj_id)]}
 
 
 @orgs.patch("/{org_id}/groups/{gid}/domains")
@@ -328,5 +366,6 @@ def update_group_domains(org_id: str, gid: str,
         {"$set": {"AllowedEmailDomains": cleaned_domains,
                   "_updated_at": datetime.now(timezone.utc)}}
     )
+    invalidate_org_tree(group["org_id"])
 
     return {"msg": "DOMAINS_UPDATED", "domains": cleaned_domains}
@@ -5,12 +5,16 @@ from datetime import datetime, timezone
 from bson.objectid import ObjectId
 from core.NewPatchUser import NewPatchUser
 from core.UserAddEmailData import UserAddEmailData
-from db import get_engine_db
+from db import get_async_engine_db, get_engine_db
 from fastapi import APIRouter, HTTPException
+from pymongo.errors import DuplicateKeyError
 from services.email_service import (generate_verification_token,
                                     send_verification_email)
+from services.membership import add_member, is_member
+from services.password_service import hash_password
+from services.user_directory import invalidate_sender
 
-from .authentication import AuthUser, password_hash
+from .authentication import AuthUser, invalidate_user
 
 users = APIRouter(prefix="/users", tags=["Users"])
 
@@ -21,52 +25,58 @@ def get_user_obj_id(user):
 
 
 @users.patch("")
-def patch_update_user(user: AuthUser, new_user: NewPatchUser):
+async def patch_update_user(user: AuthUser, new_user: NewPatchUser):
     """Update the fields in user based on the given fields in new_user
     """
     values_to_update = new_user.model_dump(
         exclude_unset=True, exclude_none=True)
     if len(values_to_update.keys()) == 0:
         return
-    db = get_engine_db()
-    if "username" in values_to_update.keys():
-        found = db.users.find_one({"username": values_to_update['username']})
-        if found is not None:
-            raise HTTPException(
-                status_code=422, detail="USERNAME_ALREADY_EXIST")
+    db = get_async_engine_db()
     if "password" in values_to_update.keys():
-        values_to_update["password"] = password_hash.hash(
+        values_to_update["password"] = await hash_password(
             values_to_update["password"])
-    db.users.update_one({"username": {"$eq": user.username}}, {
-        "$set": {
-            **values_to_update,
-            **{"_updated_at": datetime.now(timezone.utc)}
-        }
-    })
+    try:
+        await db.users.update_one({"username": {"$eq": user.username}}, {
+            "$set": {
+                **values_to_update,
+                **{"_updated_at": datetime.now(timezone.utc)}
+            }
+        })
+    except DuplicateKeyError as ex:
+        raise HTTPException(
+            status_code=422, detail="USERNAME_ALREADY_EXIST") from ex
+    invalidate_user(user.user_id)
+    if "username" in values_to_update.keys():
+        invalidate_sender(get_user_obj_id(user))
 
 
 @users.post("/emails")
-def add_user_email(user: AuthUser, email:  UserAddEmailData):
+async def add_user_email(user: AuthUser, email:  UserAddEmailData):
     """Add a new email to the user"""
-    db = get_engine_db()
-
-    # Check if email already exists
-    existing = db.users.find_one({"email.value": email.email})
-    if existing:
+    db = get_async_engine_db()
+
+    # Add email with new structure, email_unique rejects emails of other
+    # users and the filter the ones the user already has
+    try:
+        result = await db.users.update_one(
+            {"username": user.username,
+             "email.value": {"$ne": email.email}},
+            {"$push": {"email": {
+                "value": email.email,
+                "is_verified": False
+            }}}
+        )
+    except DuplicateKeyError as ex:
+        raise HTTPException(
+            status_code=422, detail="EMAIL_ALREADY_EXIST") from ex
+    if result.matched_count == 0:
         raise HTTPException(status_code=422, detail="EMAIL_ALREADY_EXIST")
-
-    # Add email with new structure
-    db.users.update_one(
-        {"username": user.username},
-        {"$push": {"email": {
-            "value": email.email,
-            "is_verified": False
-        }}}
-    )
+    invalidate_user(user.user_id)
 
     # Send verification email
     token = generate_verification_token(email.email)
-    send_verification_email(email.email, token, user.username)
+    await send_verification_email(email.email, token, user.username)
 
 
 @users.delete("/emails/{email_id}")
@@ -86,6 +96,7 @@ def delete_user_email(user: AuthUser, email_id: int):
         {"username": user.username},
         {"$pull": {"email": {"value": email_to_remove}}}
     )
+    invalidate_user(user.user_id)
 
 
 @users.post("/groups/{gid}")
@@ -98,22 +109,15 @@ def join_group(user: AuthUser, gid: str, is_org: bool):
     # 1. Select collection
     collection = db.organizations if is_org else db.groups
 
-    # 2. Find target
-    target = collection.find_one({"_id": ObjectId(gid)})
-    if not target:
+    # 2. Check the target exists
+    if collection.count_documents({"_id": ObjectId(gid)}, limit=1) == 0:
         detail = "ORGANIZATION_NOT_FOUND" if is_org else "GROUP_NOT_FOUND"
         raise HTTPException(status_code=404, detail=detail)
 
-    # 3. Check membership using ObjectId
-    if user_obj_id in target.get("members", []):
+    # 3. Perform the Join, the membership is unique per user and target
+    if not add_member(collection, ObjectId(gid), user_obj_id):
         raise HTTPException(status_code=422, detail="USER_ALREADY_JOINED")
 
-    # 4. Perform the Join
-    collection.update_one(
-        {"_id": ObjectId(gid)},
-        {"$addToSet": {"members": user_obj_id}}
-    )
-
 
 @users.get("/groups/{gid}/join_status")
 def is_joined_to_group(user: AuthUser, gid: str, is_org: bool):
@@ -124,12 +128,7 @@ def is_joined_to_group(user: AuthUser, gid: str, is_org: bool):
 
     collection = db.organizations if is_org else db.groups
 
-    target = collection.find_one({"_id": ObjectId(gid)})
-    if not target:
-        return {"msg": "no"}
-
-    # Compare ObjectIds
-    if user_obj_id in target.get("members", []):
+    if is_member(collection, ObjectId(gid), user_obj_id):
         return {"msg": "yes"}
 
     return {"msg": "no"}
@@ -6,9 +6,53 @@ BASE_DIR = Path("/static")
 UPLOAD_DIR = BASE_DIR / "uploads"
 ORG_PHOTOS_DIR = UPLOAD_DIR / "organizations"
 GROUPS_RESOURCES_DIR = UPLOAD_DIR / "groups" / "resources"
+BLOBS_DIR = UPLOAD_DIR / "blobs"  # uploads stored by content hash
+BLOB_GC_GRACE = 3600  # seconds an unreferenced blob is kept
+BLOB_DELETE_TIMEOUT = 60  # seconds before a blob being deleted is stale
+DEFAULT_ORG_PHOTO_URL = f"{ORG_PHOTOS_DIR}/RR.gif"
+ORG_PHOTO_MAX_SIZE = 5 * 1024 * 1024  # bytes
+RESOURCE_MAX_SIZE = 50 * 1024 * 1024  # bytes
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes read and written at once
 SECRET_KEY = "wow_secret_KEY"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 RESEND_API_KEY = "re_ffffffffffffff"  # resend API key
 FRONTEND_URL = "atrab.app"
 FROM_EMAIL = "Atrab <no-reply@atrab.app>"  # domain email
+CHAT_HISTORY_PAGE_SIZE = 50  # messages sent on join and per "load older"
+CHAT_HISTORY_MAX_PAGE_SIZE = 200
+ORGS_PAGE_SIZE = 100  # organizations per page of the listing
+ORGS_MAX_PAGE_SIZE = 100
+RESOURCES_PAGE_SIZE = 50  # resources per page of a group listing
+RESOURCES_MAX_PAGE_SIZE = 100
+CHAT_BUCKET_SIZE = 200  # messages stored per document of db.messages
+CHAT_SEND_QUEUE_SIZE = 256  # frames waiting to be sent to one socket
+CHAT_EVENTS_COLLECTION_SIZE = 16 * 1024 * 1024  # bytes kept for relaying
+CHAT_WRITE_BEHIND_BATCH_SIZE = 500  # buffered messages forcing a flush
+CHAT_WRITE_BEHIND_INTERVAL = 1.0  # seconds between flushes
+CHAT_WRITE_BEHIND_MAX_BUFFERED = 50000  # messages dropped above that
+CHAT_WRITE_BEHIND_MAX_RETRIES = 5  # failed flushes before dropping a batch
+CHAT_RECENT_MESSAGES = 100  # latest messages of a room kept in memory
+CHAT_CACHED_ROOMS = 1000
+CHAT_ROOM_IDLE_SECONDS = 30 * 60  # unused rooms are dropped after that
+SENDER_CACHE_SIZE = 10000  # users whose display info is kept for the chat
+SENDER_CACHE_TTL = 5 * 60  # seconds
+SPAM_CACHE_SIZE = 10000  # verdicts of recent messages kept
+SPAM_CACHE_TTL = 3600  # seconds a verdict is kept
+SPAM_CACHE_MAX_LENGTH = 500  # longer messages are checked every time
+USER_CACHE_SIZE = 10000  # authenticated users kept per process
+USER_CACHE_TTL = 30  # seconds
+GROUP_TREE_CACHE_SIZE = 1000  # organizations whose groups are kept
+GROUP_TREE_CACHE_TTL = 60  # seconds, bounds how stale members counts get
+EMAIL_OUTBOX_BATCH_SIZE = 100  # emails per provider call, Resend's limit
+EMAIL_OUTBOX_INTERVAL = 5.0  # seconds between polls of the outbox
+EMAIL_MAX_ATTEMPTS = 6  # sends of an email before giving up on it
+EMAIL_RETRY_DELAY = 30  # seconds before the first retry, doubled after
+EMAIL_SEND_TIMEOUT = 60  # seconds a claimed email stays hidden from others
+# sizes of the variants of the organization photos, cropped to fill them
+ORG_PHOTO_VARIANTS = {"thumbnail": (160, 160), "card": (640, 320)}
+IMAGE_MAX_PIXELS = 40_000_000  # larger images are not decoded
+IMAGE_PIPELINE_INTERVAL = 10.0  # seconds between polls of the pipeline
+IMAGE_MAX_ATTEMPTS = 3  # renderings of an image before giving up on it
+IMAGE_RETRY_DELAY = 60  # seconds before the first retry, doubled after
+IMAGE_RENDER_TIMEOUT = 300  # seconds a claimed image stays hidden
@@ -0,0 +1,52 @@
+"""Relay of chat broadcasts between processes
+"""
+from abc import ABC, abstractmethod
+from typing import Callable
+
+Deliver = Callable[[str, str], None]
+
+
+class Backplane(ABC):
+    """Publish/subscribe channel carrying encoded frames of chat rooms
+    between the processes serving them
+
+    Every process subscribes its ConnectionManager which then delivers the
+    frames of a room to its own sockets only.
+    """
+
+    def __init__(self):
+        self.subscribers: list[Deliver] = []
+
+    def subscribe(self, deliver: Deliver):
+        """register a callback receiving (room_id, frame) of every message"""
+        self.subscribers.append(deliver)
+
+    def deliver(self, room_id: str, frame: str):
+        """hand a frame to the local subscribers"""
+        for deliver in self.subscribers:
+            deliver(room_id, frame)
+
+    @abstractmethod
+    async def publish(self, room_id: str, frame: str):
+        """send a frame to the subscribers of every process"""
+
+    async def start(self):
+        """start relaying"""
+
+    async def stop(self):
+        """stop relaying"""
+
+
+class InMemoryBackplane(Backplane):
+    """Backplane relaying between the instances sharing the same hub, enough
+    for a single process and for tests simulating several
+    """
+
+    def __init__(self, hub: list | None = None):
+        super().__init__()
+        self.hub = hub if hub is not None else []
+        self.hub.append(self)
+
+    async def publish(self, room_id: str, frame: str):
+        for backplane in self.hub:
+            backplane.deliver(room_id, frame)
@@ -0,0 +1,47 @@
+"""Executor rejecting work instead of queueing it without limit
+"""
+import asyncio
+from concurrent.futures import Executor
+
+
+class BoundedExecutor:
+    """Runs blocking calls in an executor from the event loop, with at most
+    `max_pending` calls running or waiting for a worker
+
+    Calls over the limit raise asyncio.QueueFull right away so a burst is
+    turned away instead of piling up behind the workers.
+    """
+
+    def __init__(self, executor: Executor, max_pending: int):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args):
+        """run fn(*args) in the executor and return its result"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise asyncio.QueueFull
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def shutdown(self):
+        """stop the workers once the submitted calls are done"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """calls waiting or running and how many were served or turned away
+        """
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
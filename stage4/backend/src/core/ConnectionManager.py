@@ -1,34 +1,83 @@
 """Connections to websockets manager
 """
+from constants import CHAT_SEND_QUEUE_SIZE
+from core.Backplane import Backplane, InMemoryBackplane
+from core.QueuedConnection import QueuedConnection, encode_frame
 from fastapi.websockets import WebSocket
 
 
 class ConnectionManager:
-    """ manager class for websocket connections"""
+    """ manager class for websocket connections
 
-    def __init__(self):
-        self.active_connections: dict[str, list[WebSocket]] = {}
+    Broadcasts go through the backplane so they reach the sockets of the
+    room connected to other processes as well.
+    """
+
+    def __init__(self, queue_size: int = CHAT_SEND_QUEUE_SIZE,
+                 backplane: Backplane | None = None):
+        self.queue_size = queue_size
+        self.active_connections: dict[
+            str, dict[WebSocket, QueuedConnection]] = {}
+        self.connections: dict[WebSocket, QueuedConnection] = {}
+        self.backplane = backplane or InMemoryBackplane()
+        self.backplane.subscribe(self.deliver)
+
+    async def start(self):
+        """start receiving the broadcasts of other processes"""
+        await self.backplane.start()
+
+    async def stop(self):
+        """stop receiving the broadcasts of other processes"""
+        await self.backplane.stop()
 
     def connect(self, websocket: WebSocket, room_id: str):
         """add a websocket to an org"""
         if room_id not in self.active_connections:
-            self.active_connections[room_id] = []
-        self.active_connections[room_id].append(websocket)
+            self.active_connections[room_id] = {}
+        connection = QueuedConnection(websocket, self.queue_size)
+        self.active_connections[room_id][websocket] = connection
+        self.connections[websocket] = connection
 
     def disconnect(self, websocket: WebSocket, room_id: str):
         """removes a websocket connection"""
         if room_id in self.active_connections:
-            if websocket in self.active_connections[room_id]:
-                self.active_connections[room_id].remove(websocket)
+            connection = self.active_connections[room_id].pop(websocket, None)
+            if connection:
+                connection.close()
+                self.connections.pop(websocket, None)
             if not self.active_connections[room_id]:
                 del self.active_connections[room_id]
 
     async def send_personal_message(self, message, websocket: WebSocket):
         """send to self a massage"""
-        await websocket.send_json(message)
+        frame = encode_frame(message)
+        connection = self.connections.get(websocket)
+        if connection is None:
+            await websocket.send_text(frame)
+            return
+        # queued behind the broadcasts already waiting so the order holds
+        connection.enqueue(frame)
 
     async def broadcast(self, message_payload: dict, room_id: str):
         """broadcast a massage to all websockets with same org_id"""
+        await self.backplane.publish(room_id, encode_frame(message_payload))
+
+    def deliver(self, room_id: str, frame: str):
+        """send an encoded frame to the websockets of the room connected to
+        this process
+        """
         if room_id in self.active_connections:
-            for connection in self.active_connections[room_id]:
-                await connection.send_json(message_payload)
+            for connection in list(self.active_connections[room_id].values()):
+                connection.enqueue(frame)
+
+    def queue_depths(self) -> dict:
+        """number of connections and queued frames of every room"""
+        return {
+            room_id: {
+                "connections": len(connections),
+                "queued_frames": sum(c.depth() for c in connections.values()),
+                "max_queue_depth": max(
+                    (c.depth() for c in connections.values()), default=0),
+            }
+            for room_id, connections in self.active_connections.items()
+        }
@@ -0,0 +1,68 @@
+"""Connection pool statistics of a database client
+"""
+import threading
+
+from pymongo import monitoring
+
+
+class ConnectionPoolStats(monitoring.ConnectionPoolListener):
+    """Listener counting the connections of the pools of a client, to size
+    them under load
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {
+            "open": 0,
+            "checked_out": 0,
+            "waiting": 0,
+            "created": 0,
+            "closed": 0,
+            "check_outs": 0,
+            "check_out_failures": 0,
+            "pool_clears": 0,
+        }
+
+    def _add(self, **changes):
+        """apply changes to the counters"""
+        with self.lock:
+            for name, change in changes.items():
+                self.counters[name] += change
+
+    def stats(self) -> dict:
+        """current counters"""
+        with self.lock:
+            return dict(self.counters)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add(pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(open=1, created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(open=-1, closed=1)
+
+    def connection_check_out_started(self, event):
+        self._add(waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._add(waiting=-1, check_out_failures=1)
+
+    def connection_checked_out(self, event):
+        self._add(waiting=-1, checked_out=1, check_outs=1)
+
+    def connection_checked_in(self, event):
+        self._add(checked_out=-1)
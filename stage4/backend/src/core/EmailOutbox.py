@@ -0,0 +1,107 @@
+"""Persistent outbox of the emails to send
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from constants import (EMAIL_MAX_ATTEMPTS, EMAIL_OUTBOX_BATCH_SIZE,
+                       EMAIL_OUTBOX_INTERVAL, EMAIL_RETRY_DELAY,
+                       EMAIL_SEND_TIMEOUT)
+from core.EmailTransport import EmailTransport
+from core.JobQueue import JobQueue
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+
+class EmailOutbox(JobQueue):
+    """Emails are stored in db.email_outbox by the requests and sent in
+    batches by a background worker, so the requests never wait for the
+    email provider
+
+    A batch that fails is retried after `retry_delay` seconds, doubled on
+    every attempt, and given up after `max_attempts`. A pending email has a
+    unique key, queueing it again while it waits does nothing. Claimed
+    emails are hidden from the workers of the other processes for
+    `send_timeout` seconds and picked up again if never marked sent.
+    """
+    name = "Email outbox"
+    collection_name = "email_outbox"
+
+    def __init__(self, transport: EmailTransport,
+                 batch_size: int = EMAIL_OUTBOX_BATCH_SIZE,
+                 interval: float = EMAIL_OUTBOX_INTERVAL,
+                 max_attempts: int = EMAIL_MAX_ATTEMPTS,
+                 retry_delay: float = EMAIL_RETRY_DELAY,
+                 send_timeout: float = EMAIL_SEND_TIMEOUT):
+        super().__init__(batch_size, interval, max_attempts, retry_delay,
+                         send_timeout)
+        self.transport = transport
+        self.sent = 0
+
+    async def enqueue(self, key: str, email: dict) -> bool:
+        """store an email to send, False if one with the same key is
+        already waiting
+        """
+        try:
+            await self.collection.insert_one({
+                "key": key,
+                "email": email,
+                **self.pending(),
+                "_created_at": datetime.now(timezone.utc),
+            })
+        except DuplicateKeyError:
+            return False
+        self.wake.set()
+        return True
+
+    async def _send_each(self, jobs: list[dict]) -> tuple[list, list]:
+        """send the emails of a rejected batch one by one, returns the sent
+        jobs and the failed ones with their errors
+        """
+        sent, failed = [], []
+        for job in jobs:
+            try:
+                await asyncio.to_thread(self.transport.send, [job["email"]])
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                failed.append((job, str(e)))
+            else:
+                sent.append(job)
+        return sent, failed
+
+    async def process(self) -> int:
+        """send one batch of due emails, returns how many were claimed
+
+        A batch the provider rejects is sent again email by email, so one
+        bad email does not hold back the rest of its batch.
+        """
+        jobs = await self._claim()
+        if not jobs:
+            return 0
+
+        try:
+            await asyncio.to_thread(self.transport.send,
+                                    [job["email"] for job in jobs])
+            sent, failed = jobs, []
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if len(jobs) == 1:
+                sent, failed = [], [(jobs[0], str(e))]
+            else:
+                sent, failed = await self._send_each(jobs)
+
+        if failed:
+            await self.collection.bulk_write([
+                UpdateOne({"_id": job["_id"]}, self._failure(job, error))
+                for job, error in failed
+            ])
+        if sent:
+            await self.collection.update_many(
+                {"_id": {"$in": [job["_id"] for job in sent]}},
+                {"$set": {"status": "sent",
+                          "sent_at": datetime.now(timezone.utc)},
+                 "$inc": {"attempts": 1}},
+            )
+            self.sent += len(sent)
+        return len(jobs)
+
+    def stats(self) -> dict:
+        """emails sent, retried and given up by this process"""
+        return {"sent": self.sent, **super().stats()}
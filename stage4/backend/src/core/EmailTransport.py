@@ -0,0 +1,33 @@
+"""Transports delivering the emails of the outbox
+"""
+import json
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+
+# pylint: disable=too-few-public-methods
+class EmailTransport(ABC):
+    """Sends batches of emails, each one a dict of the Resend send params
+    (from, to, subject, html)
+
+    send is blocking and raises when the batch was not accepted, the
+    outbox then sends its emails one by one and retries the ones failing.
+    """
+
+    @abstractmethod
+    def send(self, emails: list[dict]):
+        """send a batch of emails"""
+
+
+class FileTransport(EmailTransport):
+    """Transport appending the emails as JSON lines to a file instead of
+    sending them, for development and tests
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def send(self, emails: list[dict]):
+        with self.path.open("a", encoding="utf-8") as file:
+            for email in emails:
+                file.write(json.dumps(email, ensure_ascii=False) + "\n")
@@ -0,0 +1,89 @@
+"""Background rendering of the variants of the uploaded images
+"""
+import asyncio
+
+from constants import (IMAGE_MAX_ATTEMPTS, IMAGE_PIPELINE_INTERVAL,
+                       IMAGE_RENDER_TIMEOUT, IMAGE_RETRY_DELAY)
+from core.BoundedExecutor import BoundedExecutor
+from core.JobQueue import JobQueue
+
+
+class ImagePipeline(JobQueue):
+    """Blobs of db.blobs queued with `enqueue` get their variants rendered
+    by `render(path, variants)` in the worker processes of `executor`, so
+    the requests never wait for an image to be decoded and resized
+
+    The state is kept on the blob: `variants_status` pending, ready or
+    failed, and `variants` the urls of the rendered files by name once
+    ready. An image that fails is retried after `retry_delay` seconds,
+    doubled on every attempt, and given up after `max_attempts`. Claimed
+    images are hidden from the pipelines of the other processes for
+    `render_timeout` seconds and picked up again if never finished.
+    """
+    name = "Image pipeline"
+    collection_name = "blobs"
+    status_field = "variants_status"
+    attempts_field = "variants_attempts"
+    due_field = "variants_attempt_at"
+    error_field = "variants_error"
+
+    def __init__(self, executor: BoundedExecutor, render,
+                 variants: dict[str, tuple[int, int]],
+                 interval: float = IMAGE_PIPELINE_INTERVAL,
+                 max_attempts: int = IMAGE_MAX_ATTEMPTS,
+                 retry_delay: float = IMAGE_RETRY_DELAY,
+                 render_timeout: float = IMAGE_RENDER_TIMEOUT):
+        # as many images as the executor has room for at once
+        super().__init__(executor.max_pending, interval, max_attempts,
+                         retry_delay, render_timeout)
+        self.executor = executor
+        self.render = render
+        self.variants = variants
+        self.rendered = 0
+
+    async def enqueue(self, blob_id: str):
+        """queue the rendering of the variants of a blob, nothing is done
+        if it was queued already
+        """
+        queued = await self.collection.update_one(
+            {"_id": blob_id, self.status_field: {"$exists": False}},
+            {"$set": self.pending()}
+        )
+        if queued.modified_count:
+            self.wake.set()
+
+    async def _render(self, job: dict):
+        """render the variants of one claimed image and store the result"""
+        try:
+            variants = await self.executor.run(self.render, job["url"],
+                                               self.variants)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            update = self._failure(job, str(e))
+        else:
+            self.rendered += 1
+            update = {"$set": {"variants_status": "ready",
+                               "variants": variants}}
+        await self.collection.update_one({"_id": job["_id"]}, update)
+
+    async def process(self) -> int:
+        """render one batch of due images, returns how many were claimed"""
+        jobs = await self._claim({"url": 1, "variants_attempts": 1})
+        await asyncio.gather(*(self._render(job) for job in jobs))
+        return len(jobs)
+
+    async def stop(self):
+        """stop the background worker and the worker processes, the queued
+        images stay stored
+        """
+        await super().stop()
+        self.executor.shutdown()
+
+    def stats(self) -> dict:
+        """images rendered, retried and given up by this process and the
+        load of the workers
+        """
+        return {
+            "rendered": self.rendered,
+            **super().stats(),
+            "workers": self.executor.stats(),
+        }
@@ -0,0 +1,125 @@
+"""Jobs stored in the database and run by a background worker
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
+
+from db import get_async_engine_db
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+
+# pylint: disable=too-many-instance-attributes
+class JobQueue(ABC):
+    """Jobs are documents of `collection_name` whose `status_field` is
+    pending, claimed in batches of `batch_size` by the worker of one of the
+    processes, woken up by `wake` or every `interval` seconds
+
+    A claimed job is hidden from the other workers until `lease` seconds
+    after its `due_field` and picked up again if never finished. A job that
+    fails is retried after `retry_delay` seconds, doubled on every attempt
+    counted in `attempts_field`, and given up after `max_attempts`.
+    """
+    name = "Job queue"
+    collection_name: str
+    status_field = "status"
+    attempts_field = "attempts"
+    due_field = "next_attempt_at"
+    error_field = "last_error"
+
+    def __init__(self, batch_size: int, interval: float, max_attempts: int,
+                 retry_delay: float, lease: float):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.wake = asyncio.Event()
+        self.worker: asyncio.Task | None = None
+        self.retried = 0
+        self.failed = 0
+        self.last_error: str | None = None
+
+    @property
+    def collection(self):
+        """the collection holding the jobs"""
+        return get_async_engine_db()[self.collection_name]
+
+    def pending(self) -> dict:
+        """the fields of a newly queued job"""
+        return {
+            self.status_field: "pending",
+            self.attempts_field: 0,
+            self.due_field: datetime.now(timezone.utc),
+        }
+
+    async def _claim(self, projection: dict | None = None) -> list[dict]:
+        """take up to `batch_size` due jobs for this worker"""
+        now = datetime.now(timezone.utc)
+        hidden_until = now + timedelta(seconds=self.lease)
+        jobs = []
+        while len(jobs) < self.batch_size:
+            job = await self.collection.find_one_and_update(
+                {self.status_field: "pending", self.due_field: {"$lte": now}},
+                {"$set": {self.due_field: hidden_until}},
+                projection=projection,
+                sort=[(self.due_field, ASCENDING)],
+            )
+            if job is None:
+                break
+            jobs.append(job)
+        return jobs
+
+    def _failure(self, job: dict, error: str) -> dict:
+        """the update retrying or giving up on a job that failed"""
+        self.last_error = error
+        attempts = job[self.attempts_field] + 1
+        if attempts >= self.max_attempts:
+            self.failed += 1
+            change = {self.status_field: "failed"}
+        else:
+            self.retried += 1
+            delay = self.retry_delay * 2 ** (attempts - 1)
+            change = {self.due_field: datetime.now(timezone.utc)
+                      + timedelta(seconds=delay)}
+        return {"$set": {
+            **change,
+            self.attempts_field: attempts,
+            self.error_field: error,
+        }}
+
+    @abstractmethod
+    async def process(self) -> int:
+        """run one batch of due jobs, returns how many were claimed"""
+
+    async def _work(self):
+        """run the due jobs when woken up or every `interval` seconds"""
+        while True:
+            self.wake.clear()
+            try:
+                while await self.process() == self.batch_size:
+                    pass
+            except PyMongoError as e:
+                print(f"{self.name} error: {e}")
+            with suppress(TimeoutError):
+                await asyncio.wait_for(self.wake.wait(), self.interval)
+
+    async def start(self):
+        """start the background worker on the running loop"""
+        self.wake = asyncio.Event()
+        self.worker = asyncio.create_task(self._work())
+
+    async def stop(self):
+        """stop the background worker, the queued jobs stay stored"""
+        if self.worker:
+            self.worker.cancel()
+            self.worker = None
+
+    def stats(self) -> dict:
+        """jobs retried and given up by this process"""
+        return {
+            "retried": self.retried,
+            "failed": self.failed,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,134 @@
+"""Write-behind buffer of chat messages
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from bson.objectid import ObjectId
+from constants import (CHAT_WRITE_BEHIND_BATCH_SIZE,
+                       CHAT_WRITE_BEHIND_INTERVAL,
+                       CHAT_WRITE_BEHIND_MAX_BUFFERED,
+                       CHAT_WRITE_BEHIND_MAX_RETRIES)
+from services.message_store import save_batches
+
+# called with the batches and whether some may be stored already
+Writer = Callable[[dict[ObjectId, list[dict]], bool], Awaitable[None]]
+
+
+# pylint: disable=too-many-instance-attributes
+class MessageWriteBuffer:
+    """Buffers chat messages per room and writes them in batches, once
+    `batch_size` messages are waiting or every `interval` seconds
+
+    Messages are broadcast before they reach the database, the ones still
+    buffered when the process dies are lost. Stopping flushes what is left.
+    A failed flush is retried with the next one, skipping the messages it
+    stored before failing, and dropped after `max_retries` failures. At
+    most `max_buffered` messages wait, the ones above are dropped.
+    """
+
+    def __init__(self, batch_size: int = CHAT_WRITE_BEHIND_BATCH_SIZE,
+                 interval: float = CHAT_WRITE_BEHIND_INTERVAL,
+                 write: Writer = save_batches,
+                 max_buffered: int = CHAT_WRITE_BEHIND_MAX_BUFFERED,
+                 max_retries: int = CHAT_WRITE_BEHIND_MAX_RETRIES):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.write = write
+        self.max_buffered = max_buffered
+        self.max_retries = max_retries
+        self.rooms: dict[ObjectId, list[dict]] = {}
+        # the batches of the flush in progress
+        self.writing: dict[ObjectId, list[dict]] = {}
+        self.depth = 0
+        self.retries = 0
+        self.dropped = 0
+        self.lock = asyncio.Lock()
+        self.timer: asyncio.Task | None = None
+        # the flushes started by `add`, referenced until they are done
+        self.flush_tasks: set[asyncio.Task] = set()
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def add(self, room_id: ObjectId, message: dict):
+        """buffer a message of a room, dropped if the buffer is full"""
+        if self.depth >= self.max_buffered:
+            self.dropped += 1
+            return
+        self.rooms.setdefault(room_id, []).append(message)
+        self.depth += 1
+        if self.depth >= self.batch_size and not self.lock.locked():
+            task = asyncio.create_task(self.flush())
+            self.flush_tasks.add(task)
+            task.add_done_callback(self.flush_tasks.discard)
+
+    def buffered(self, room_id: ObjectId) -> list[dict]:
+        """the messages of a room not stored yet, waiting or being written,
+        oldest first
+        """
+        return self.writing.get(room_id, []) + self.rooms.get(room_id, [])
+
+    async def flush(self):
+        """write every buffered message"""
+        async with self.lock:
+            if not self.rooms:
+                return
+            rooms, depth = self.rooms, self.depth
+            self.rooms, self.depth = {}, 0
+            self.writing = rooms
+
+            start = time.perf_counter()
+            try:
+                await self.write(rooms, self.retries > 0)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self.writing = {}
+                print(f"Failed to flush chat messages: {e}")
+                self.failed_flushes += 1
+                self.retries += 1
+                if self.retries > self.max_retries:
+                    self.dropped += depth
+                    self.retries = 0
+                    return
+                # keep them, ahead of the newer ones, for the next flush
+                for room_id, messages in self.rooms.items():
+                    rooms.setdefault(room_id, []).extend(messages)
+                self.rooms, self.depth = rooms, depth + self.depth
+                return
+
+            self.writing = {}
+            self.retries = 0
+            self.flushes += 1
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+
+    async def _flush_periodically(self):
+        """flush every `interval` seconds"""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def start(self):
+        """start the periodic flushes"""
+        self.timer = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """stop the periodic flushes and write what is left"""
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        await asyncio.gather(*self.flush_tasks)
+        await self.flush()
+
+    def stats(self) -> dict:
+        """buffer depth and flush latency"""
+        return {
+            "buffered_messages": self.depth,
+            "buffered_rooms": len(self.rooms),
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "dropped_messages": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+        }
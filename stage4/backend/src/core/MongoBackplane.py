@@ -0,0 +1,74 @@
+"""Backplane relaying chat broadcasts through the database
+"""
+import asyncio
+
+from bson.objectid import ObjectId
+from constants import CHAT_EVENTS_COLLECTION_SIZE
+from core.Backplane import Backplane
+from db import get_async_engine_db
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+
+class MongoBackplane(Backplane):
+    """Backplane publishing frames to a capped collection that every process
+    tails
+
+    Change streams would need a replica set, a tailable cursor on a capped
+    collection works on the standalone server we deploy.
+    """
+
+    def __init__(self, collection_size: int = CHAT_EVENTS_COLLECTION_SIZE):
+        super().__init__()
+        self.collection_size = collection_size
+        self.origin = ObjectId()  # tells the frames of this process apart
+        self.listener: asyncio.Task | None = None
+
+    async def start(self):
+        db = get_async_engine_db()
+        if "chat_events" not in await db.list_collection_names():
+            try:
+                await db.create_collection(
+                    "chat_events", capped=True, size=self.collection_size)
+                # tailable cursors die right away on an empty collection
+                await db.chat_events.insert_one({"sentinel": True})
+            except CollectionInvalid:
+                pass  # created by another process meanwhile
+        self.listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+            self.listener = None
+
+    async def publish(self, room_id: str, frame: str):
+        # local sockets do not wait for the round-trip
+        self.deliver(room_id, frame)
+        await get_async_engine_db().chat_events.insert_one({
+            "origin": self.origin,
+            "room_id": room_id,
+            "frame": frame,
+        })
+
+    async def _listen(self):
+        """Deliver the frames published by the other processes"""
+        events = get_async_engine_db().chat_events
+        # resume after the last delivered event, the ones published before
+        # this listener started are skipped
+        last_id = None
+        while True:
+            try:
+                if last_id is None:
+                    latest = await events.find_one(
+                        {}, {"_id": 1}, sort=[("$natural", -1)])
+                    last_id = latest["_id"] if latest else ObjectId()
+                cursor = events.find({"_id": {"$gt": last_id}},
+                                     cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for event in cursor:
+                        last_id = event["_id"]
+                        if event.get("origin") not in (None, self.origin):
+                            self.deliver(event["room_id"], event["frame"])
+            except PyMongoError as e:
+                print(f"Chat backplane error: {e}")
+            await asyncio.sleep(1)
@@ -10,6 +10,8 @@ class Organization(BaseModel):
     email_domain: str = Field(min_length=3, max_length=25)
     location: str = Field(min_length=3, max_length=25)
     photo_url: str | None = None
+    # urls of the resized photos by variant name, once rendered
+    photo_variants: dict[str, str] = {}
     # messages: list
-    members: list
+    members: list | None = None  # left out of the listing on request
     members_count: int
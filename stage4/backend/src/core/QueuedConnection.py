@@ -0,0 +1,84 @@
+"""Websocket with its own outbound queue
+"""
+import asyncio
+
+import orjson
+from fastapi import status
+from fastapi.websockets import WebSocket
+
+
+def encode_frame(payload) -> str:
+    """Encode a payload to the text of a websocket frame, done once per
+    message whatever the number of recipients
+    """
+    return orjson.dumps(payload).decode()
+
+
+RESYNC_FRAME = encode_frame({"type": "resync"})
+
+
+class QueuedConnection:
+    """A websocket whose outgoing frames are queued and sent by a dedicated
+    writer task, so a slow client only ever delays itself
+
+    When the queue overflows the pending frames are replaced by a single
+    resync frame telling the client to reload, if it overflows again
+    before the client catches up it is disconnected.
+    """
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.resync_pending = False
+        self.closed = False
+        self.writer = asyncio.create_task(self._write())
+
+    def enqueue(self, frame: str) -> bool:
+        """Queue an encoded frame for sending, returns False if the client is
+        too slow and got dropped
+        """
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.resync_pending:
+            self.drop()
+            return False
+
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESYNC_FRAME)
+        self.resync_pending = True
+        return True
+
+    def depth(self) -> int:
+        """Number of frames waiting to be sent"""
+        return self.queue.qsize()
+
+    def drop(self):
+        """Stop sending and disconnect the client"""
+        self.close()
+        asyncio.create_task(self.websocket.close(
+            code=status.WS_1013_TRY_AGAIN_LATER))
+
+    def close(self):
+        """Stop the writer task, pending frames are discarded"""
+        self.closed = True
+        self.writer.cancel()
+
+    async def _write(self):
+        """Send the queued frames one by one until closed"""
+        while True:
+            frame = await self.queue.get()
+            if frame is RESYNC_FRAME:
+                self.resync_pending = False
+            try:
+                await self.websocket.send_text(frame)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # the socket is gone, the receive loop cleans up after it
+                self.closed = True
+                return
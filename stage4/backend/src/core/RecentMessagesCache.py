@@ -0,0 +1,130 @@
+"""In memory cache of the latest messages of chat rooms
+"""
+import time
+from collections import OrderedDict, deque
+
+from constants import (CHAT_CACHED_ROOMS, CHAT_RECENT_MESSAGES,
+                       CHAT_ROOM_IDLE_SECONDS)
+
+
+# pylint: disable=too-few-public-methods
+class CachedRoom:
+    """Ring buffer of the latest messages of a room"""
+
+    def __init__(self, capacity: int):
+        self.messages: deque = deque(maxlen=capacity)
+        # messages arriving while the room is loaded from the database
+        self.pending: list[dict] | None = []
+        # True when the buffer holds the whole history of the room
+        self.complete = False
+        self.last_used = time.monotonic()
+
+
+class RecentMessagesCache:
+    """Keeps the latest messages, in the history wire format, of the rooms
+    in use so joining them does not need the database
+
+    Rooms are forgotten once idle for `idle_seconds` or when more than
+    `max_rooms` are cached, least recently used first. Message ids are
+    ObjectId hex strings so comparing them as strings orders them by age.
+    """
+
+    def __init__(self, capacity: int = CHAT_RECENT_MESSAGES,
+                 max_rooms: int = CHAT_CACHED_ROOMS,
+                 idle_seconds: float = CHAT_ROOM_IDLE_SECONDS):
+        self.capacity = capacity
+        self.max_rooms = max_rooms
+        self.idle_seconds = idle_seconds
+        self.rooms: OrderedDict[str, CachedRoom] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self.rooms
+
+    def _evict(self):
+        """drop the idle rooms and the least recently used ones above the
+        limit
+        """
+        idle_since = time.monotonic() - self.idle_seconds
+        while self.rooms:
+            room_id, room = next(iter(self.rooms.items()))
+            if len(self.rooms) <= self.max_rooms and \
+                    room.last_used >= idle_since:
+                break
+            del self.rooms[room_id]
+
+    def begin_fill(self, room_id: str):
+        """start caching a room, messages appended from now on are kept
+        until `fill` gives the ones loaded from the database
+        """
+        if room_id not in self.rooms:
+            self.rooms[room_id] = CachedRoom(self.capacity)
+        self._evict()
+
+    def fill(self, room_id: str, messages: list[dict], complete: bool):
+        """set the latest messages of a room, oldest first, `complete` when
+        the room has no older messages
+        """
+        room = self.rooms.get(room_id)
+        if room is None or room.pending is None:
+            return
+        loaded = {m["message_id"] for m in messages}
+        messages = messages + [
+            m for m in room.pending if m["message_id"] not in loaded]
+        messages.sort(key=lambda m: m["message_id"])
+        room.messages.extend(messages)
+        room.complete = complete and len(messages) <= self.capacity
+        room.pending = None
+
+    def discard(self, room_id: str):
+        """forget a room, like when loading it failed"""
+        self.rooms.pop(room_id, None)
+
+    def append(self, room_id: str, message: dict):
+        """add a new message to a cached room"""
+        room = self.rooms.get(room_id)
+        if room is None:
+            return
+        if room.pending is not None:
+            room.pending.append(message)
+            return
+        if len(room.messages) == room.messages.maxlen:
+            room.complete = False
+        room.messages.append(message)
+
+    def get_page(self, room_id: str, before: str | None,
+                 limit: int) -> dict | None:
+        """get a page of a room like the database would, or None when the
+        cache can not answer it
+        """
+        room = self.rooms.get(room_id)
+        if room is None or room.pending is not None:
+            self.misses += 1
+            return None
+        room.last_used = time.monotonic()
+        self.rooms.move_to_end(room_id)
+
+        older = [m for m in room.messages
+                 if before is None or m["message_id"] < before]
+        if len(older) <= limit and not room.complete:
+            # the page reaches past the oldest cached message
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        has_more = len(older) > limit
+        page = older[-limit:]
+        return {
+            "data": page,
+            "has_more": has_more,
+            "next_cursor": page[0]["message_id"] if has_more else None,
+        }
+
+    def stats(self) -> dict:
+        """cached rooms and hit ratio"""
+        return {
+            "rooms": len(self.rooms),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
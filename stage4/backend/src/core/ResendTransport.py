@@ -0,0 +1,17 @@
+"""Transport sending emails through the Resend API
+"""
+import resend
+from core.EmailTransport import EmailTransport
+
+
+# pylint: disable=too-few-public-methods
+class ResendTransport(EmailTransport):
+    """Transport sending each batch with a single call to Resend's batch
+    endpoint, which takes up to 100 emails
+    """
+
+    def __init__(self, api_key: str):
+        resend.api_key = api_key
+
+    def send(self, emails: list[dict]):
+        resend.Batch.send(emails)
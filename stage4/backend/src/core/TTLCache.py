@@ -0,0 +1,63 @@
+"""Bounded cache with expiring entries
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Least recently used cache of at most `max_size` entries, each one
+    expiring `ttl` seconds after it was set
+
+    Safe to share between the event loop and the threads running the sync
+    endpoints.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """get the value of a key, `default` if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """set the value of a key, evicting the least recently used entry
+        when full
+        """
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """forget a key"""
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        """forget every key"""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """size and hit ratio"""
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,94 @@
+"""ASGI middleware capping the size of upload requests
+"""
+import re
+
+from fastapi.responses import JSONResponse
+
+# room left for the multipart boundaries and the other form fields
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class BodyTooLarge(Exception):
+    """Raised while receiving a body over its limit once the response has
+    started
+    """
+
+
+# pylint: disable=too-few-public-methods
+class UploadSizeLimit:
+    """Rejects POST requests to the upload paths with 413 once their body
+    is over the quota of the path, before the form is parsed
+
+    A Content-Length over the quota is rejected before reading anything,
+    bodies without one are counted while received and answered with 413
+    as soon as they cross it, the app then sees a disconnected client.
+    """
+
+    def __init__(self, app, limits: dict[str, int]):
+        self.app = app
+        self.limits = [(re.compile(pattern), size + MULTIPART_OVERHEAD)
+                       for pattern, size in limits.items()]
+
+    def limit_of(self, scope) -> int | None:
+        """the body size limit of a request, None if unlimited"""
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return None
+        for pattern, size in self.limits:
+            if pattern.search(scope["path"]):
+                return size
+        return None
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limit_of(scope)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await self.reject(scope, receive, send)
+            return
+
+        received = 0
+        started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    if started:
+                        raise BodyTooLarge
+                    # answer now, the app parsing the form would turn any
+                    # error raised here into a 400, and let it see a
+                    # disconnected client
+                    rejected = True
+                    await self.reject(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if rejected:
+                return  # the 413 was sent already
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except Exception:  # pylint: disable=broad-exception-caught
+            if not rejected:
+                raise
+
+    @staticmethod
+    async def reject(scope, receive, send):
+        """answer 413 FILE_TOO_LARGE"""
+        response = JSONResponse({"detail": "FILE_TOO_LARGE"},
+                                status_code=413)
+        await response(scope, receive, send)
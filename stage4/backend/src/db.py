@@ -1,16 +1,114 @@
 """Database connection
+
+A single client, and so a single connection pool, is shared by the whole
+process. It is created on first use or by the app lifespan and closed on
+shutdown. The pool is configured from the environment:
+
+- MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS
+- MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+  MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_WAIT_QUEUE_TIMEOUT_MS
+- MONGO_WRITE_CONCERN ("majority" or a number of nodes) and
+  MONGO_READ_CONCERN ("local", "majority", ...)
 """
+import asyncio
 from os import environ
+from weakref import WeakKeyDictionary
+
+from core.ConnectionPoolStats import ConnectionPoolStats
+from pymongo import AsyncMongoClient, MongoClient
+
+MONGO_DB_HOST = environ.get("MONGO_DB_HOST", "localhost")
+
+sync_pool_stats = ConnectionPoolStats()
+async_pool_stats = ConnectionPoolStats()
 
-from pymongo import MongoClient
+_clients: dict[str, MongoClient] = {}
+# async clients can only be used from the event loop they were created on
+_async_clients: WeakKeyDictionary = WeakKeyDictionary()
 
 
-def get_db_connection(host=environ.get("MONGO_DB_HOST", "localhost")):
-    """Connect to the database"""
+def get_client_options() -> dict:
+    """Options of the database clients set in the environment"""
+    integer_options = {
+        "maxPoolSize": "MONGO_MAX_POOL_SIZE",
+        "minPoolSize": "MONGO_MIN_POOL_SIZE",
+        "maxIdleTimeMS": "MONGO_MAX_IDLE_TIME_MS",
+        "connectTimeoutMS": "MONGO_CONNECT_TIMEOUT_MS",
+        "socketTimeoutMS": "MONGO_SOCKET_TIMEOUT_MS",
+        "serverSelectionTimeoutMS": "MONGO_SERVER_SELECTION_TIMEOUT_MS",
+        "waitQueueTimeoutMS": "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+    }
+    options = {
+        option: int(environ[name])
+        for option, name in integer_options.items() if name in environ
+    }
 
-    return MongoClient(host, 27017)
+    write_concern = environ.get("MONGO_WRITE_CONCERN")
+    if write_concern:
+        options["w"] = int(write_concern) if write_concern.isdigit() \
+            else write_concern
+    if environ.get("MONGO_READ_CONCERN"):
+        options["readConcernLevel"] = environ["MONGO_READ_CONCERN"]
+
+    return options
+
+
+def get_db_connection(host=MONGO_DB_HOST):
+    """Connect to the database, reusing the client of the process"""
+    if host not in _clients:
+        _clients[host] = MongoClient(
+            host, 27017, event_listeners=[sync_pool_stats],
+            **get_client_options()
+        )
+    return _clients[host]
 
 
 def get_engine_db():
     """Get an instance from the main database for the backend"""
     return get_db_connection().engine
+
+
+def get_async_db_connection(host=MONGO_DB_HOST):
+    """Get the async client of the running event loop, connecting on first
+    use
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        _async_clients[loop] = AsyncMongoClient(
+            host, 27017, event_listeners=[async_pool_stats],
+            **get_client_options()
+        )
+    return _async_clients[loop]
+
+
+def get_async_engine_db():
+    """Get an async instance from the main database for the backend, to be
+    used from coroutines so database round-trips do not block the loop
+    """
+    return get_async_db_connection().engine
+
+
+async def open_db_connections():
+    """Create the clients of the process and check the database answers"""
+    get_db_connection()
+    await get_async_db_connection().admin.command("ping")
+
+
+async def close_db_connections():
+    """Close the clients of the process and their connection pools"""
+    for client in _clients.values():
+        client.close()
+    _clients.clear()
+
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def get_pool_stats() -> dict:
+    """Statistics of the connection pools of the process"""
+    return {
+        "options": get_client_options(),
+        "sync": sync_pool_stats.stats(),
+        "async": async_pool_stats.stats(),
+    }
@@ -0,0 +1,96 @@
+"""Indexes of the database collections
+
+Every index the backend relies on is declared here and created at startup
+and by `python -m jobs.ensure_indexes`, creating an index that already
+exists does nothing. Uniqueness is enforced by the unique indexes, the
+endpoints map the duplicate key errors to their error codes.
+"""
+from db import get_engine_db
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+INDEXES: dict[str, list[IndexModel]] = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True,
+                   name="username_unique"),
+        IndexModel([("email.value", ASCENDING)], unique=True,
+                   name="email_unique"),
+    ],
+    "organizations": [
+        IndexModel([("organization_name", ASCENDING)], unique=True,
+                   name="organization_name_unique"),
+        IndexModel([("blob", ASCENDING)], sparse=True, name="blob"),
+    ],
+    "groups": [
+        # main groups have no parentGroupId, so their titles are unique in
+        # the org and the titles of subgroups are unique under their parent
+        IndexModel([("org_id", ASCENDING), ("parentGroupId", ASCENDING),
+                    ("title", ASCENDING)], unique=True,
+                   name="org_parent_title_unique"),
+    ],
+    "email_outbox": [
+        # an email waiting to be sent is not queued a second time
+        IndexModel([("key", ASCENDING)], unique=True,
+                   partialFilterExpression={"status": "pending"},
+                   name="pending_key_unique"),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)],
+                   name="status_next_attempt_at"),
+    ],
+    "memberships": [
+        # membership checks are point lookups on this index
+        IndexModel([("user_id", ASCENDING), ("room_id", ASCENDING)],
+                   unique=True, name="user_room_unique"),
+        IndexModel([("room_id", ASCENDING), ("joined_at", ASCENDING)],
+                   name="room_id_joined_at"),
+    ],
+    "resources": [
+        IndexModel([("group_id", ASCENDING), ("_id", DESCENDING)],
+                   name="group_id_newest"),
+        IndexModel([("group_id", ASCENDING), ("score", DESCENDING),
+                    ("_id", DESCENDING)], name="group_id_score"),
+        IndexModel([("blob", ASCENDING)], sparse=True, name="blob"),
+    ],
+    "blobs": [
+        IndexModel([("refs", ASCENDING), ("_updated_at", ASCENDING)],
+                   name="refs_updated_at"),
+    ],
+    "votes": [
+        IndexModel([("resource_id", ASCENDING), ("user_id", ASCENDING)],
+                   unique=True, name="resource_user_unique"),
+    ],
+    "messages": [
+        # ObjectIds start with their creation time, so ordering the buckets
+        # by the id of their newest message orders them by time
+        IndexModel([("room_id", ASCENDING), ("last_id", DESCENDING),
+                    ("first_id", DESCENDING)],
+                   name="room_id_last_id_first_id"),
+        # at most one open bucket per room, so concurrent writers can not
+        # start two buckets and interleave messages between them
+        IndexModel([("room_id", ASCENDING)], unique=True,
+                   partialFilterExpression={"open": True},
+                   name="room_id_open"),
+    ],
+}
+
+
+def ensure_indexes() -> bool:
+    """Create the declared indexes, returns False if some could not be
+    created, like a unique index over existing duplicates
+    """
+    db = get_engine_db()
+    created = True
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                db[collection].create_indexes([index])
+            except OperationFailure as e:
+                print(f"Failed to create index {collection}."
+                      f"{index.document['name']}: {e}")
+                created = False
+    return created
+
+
+def duplicated_key(error: DuplicateKeyError) -> str:
+    """The first field of the unique index a write conflicted on"""
+    key_pattern = (error.details or {}).get("keyPattern", {})
+    return next(iter(key_pattern), "")
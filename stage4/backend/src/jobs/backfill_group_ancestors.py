@@ -0,0 +1,61 @@
+"""Store the ancestors of the groups created before they were stored
+
+The tree is read in one query and the ancestors computed in memory, then
+written in bulk to the groups missing them. Running it again does nothing
+to groups that have them already, and subgroups created meanwhile get
+theirs from create_group.
+
+usage (from src): python -m jobs.backfill_group_ancestors
+"""
+from bson.objectid import ObjectId
+from db import get_engine_db
+from pymongo import UpdateOne
+
+BATCH_SIZE = 1000  # groups written per bulk write
+
+
+def compute_ancestors(parents: dict) -> dict:
+    """The ancestors of every group, from the parent of each one"""
+    ancestors = {}
+
+    def resolve(group_id, seen):
+        if group_id in ancestors:
+            return ancestors[group_id]
+        parent_id = parents.get(group_id)
+        if parent_id not in parents or parent_id in seen:
+            # main group, missing parent or broken cycle
+            ancestors[group_id] = []
+        else:
+            ancestors[group_id] = (
+                resolve(parent_id, seen | {group_id}) + [parent_id])
+        return ancestors[group_id]
+
+    for group_id in parents:
+        resolve(group_id, frozenset())
+    return ancestors
+
+
+def run():
+    """Backfill the ancestors of every group missing them"""
+    db = get_engine_db()
+    parents = {}
+    missing = set()
+    for group in db.groups.find({}, {"parentGroupId": 1, "ancestors": 1}):
+        parent_id = group.get("parentGroupId")
+        # parentGroupId of main groups may be missing, null or empty
+        parents[group["_id"]] = ObjectId(parent_id) if parent_id else None
+        if "ancestors" not in group:
+            missing.add(group["_id"])
+
+    ancestors = compute_ancestors(parents)
+    updates = [UpdateOne({"_id": group_id, "ancestors": {"$exists": False}},
+                         {"$set": {"ancestors": ancestors[group_id]}})
+               for group_id in missing]
+    for start in range(0, len(updates), BATCH_SIZE):
+        db.groups.bulk_write(updates[start:start + BATCH_SIZE],
+                             ordered=False)
+    print(f"groups: backfilled the ancestors of {len(updates)} groups")
+
+
+if __name__ == "__main__":
+    run()
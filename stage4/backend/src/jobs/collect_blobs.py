@@ -0,0 +1,110 @@
+"""Reclaim the blobs no resource or organization references anymore
+
+The references of every blob untouched for BLOB_GC_GRACE seconds are
+counted again from the resources and organizations, repairing the counts
+left behind by a crash between a blob and the document using it, then the
+blobs left without references are deleted with their files. The grace
+period keeps the blobs of the uploads still being saved. A count is only
+written back if the blob did not change since it was counted.
+
+usage (from src): python -m jobs.collect_blobs
+"""
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from constants import BLOB_DELETE_TIMEOUT, BLOB_GC_GRACE
+from db import get_engine_db
+
+
+def references(collection_name: str) -> dict:
+    """The stage looking up the documents of a collection using a blob"""
+    return {"$lookup": {
+        "from": collection_name,
+        "localField": "_id",
+        "foreignField": "blob",
+        "pipeline": [{"$project": {"_id": 1}}],
+        "as": collection_name,
+    }}
+
+
+def recount(cutoff: datetime) -> list[dict]:
+    """The pipeline writing the recounted references of the blobs last
+    changed before `cutoff` back
+    """
+    return [
+        {"$match": {"_updated_at": {"$lt": cutoff},
+                    "deleting": {"$ne": True}}},
+        references("resources"),
+        references("organizations"),
+        {"$project": {
+            "_updated_at": 1,
+            "refs": {"$add": [{"$size": "$resources"},
+                              {"$size": "$organizations"}]},
+        }},
+        {"$merge": {
+            "into": "blobs",
+            "on": "_id",
+            "whenMatched": [{"$set": {"refs": {"$cond": [
+                {"$eq": ["$_updated_at", "$$new._updated_at"]},
+                "$$new.refs", "$refs",
+            ]}}}],
+            "whenNotMatched": "discard",
+        }},
+    ]
+
+
+def delete_files(blob: dict):
+    """Remove the file of a blob and the variants rendered from it, all
+    named after its hash
+    """
+    for path in Path(blob["url"]).parent.glob(f"{blob['_id']}*"):
+        path.unlink(missing_ok=True)
+
+
+def collect(cutoff: datetime) -> int:
+    """Delete the unreferenced blobs last changed before `cutoff`, returns
+    how many were deleted
+    """
+    blobs = get_engine_db().blobs
+    unreferenced = {"refs": {"$lte": 0}, "_updated_at": {"$lt": cutoff}}
+    deleted = 0
+    for blob in blobs.find({**unreferenced, "deleting": {"$ne": True}},
+                           {"url": 1}):
+        deleted += delete_blob(blob, {**unreferenced,
+                                      "deleting": {"$ne": True}})
+
+    # blobs marked by an interrupted run, unless an upload took them over
+    stale = datetime.now(timezone.utc) - timedelta(
+        seconds=BLOB_DELETE_TIMEOUT)
+    marked_before = {"deleting": True,
+                     "deleting_at": {"$not": {"$gte": stale}}}
+    for blob in blobs.find(marked_before, {"url": 1}):
+        deleted += delete_blob(blob, marked_before)
+    return deleted
+
+
+def delete_blob(blob: dict, condition: dict) -> bool:
+    """Mark a blob deleting if it still matches `condition`, then delete
+    its files and itself, False if it no longer matched
+    """
+    blobs = get_engine_db().blobs
+    marked_at = datetime.now(timezone.utc)
+    marked = blobs.update_one(
+        {"_id": blob["_id"], **condition},
+        {"$set": {"deleting": True, "deleting_at": marked_at}})
+    if marked.modified_count == 0:
+        return False  # referenced again or taken over meanwhile
+    delete_files(blob)
+    blobs.delete_one({"_id": blob["_id"], "deleting_at": marked_at})
+    return True
+
+
+def run(grace: float = BLOB_GC_GRACE):
+    """Recount the references and delete the unreferenced blobs"""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace)
+    get_engine_db().blobs.aggregate(recount(cutoff))
+    print(f"{collect(cutoff)} blobs deleted")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,10 @@
+"""Create the indexes declared in indexes.py
+
+usage (from src): python -m jobs.ensure_indexes
+"""
+import sys
+
+from indexes import ensure_indexes
+
+if __name__ == "__main__":
+    sys.exit(0 if ensure_indexes() else 1)
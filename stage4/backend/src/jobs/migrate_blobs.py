@@ -0,0 +1,88 @@
+"""Move the files uploaded before the blob store into it
+
+Every resource and organization photo still stored under its own name is
+hashed and referenced as a blob, so identical files end up stored once,
+then its document points at the blob and the old file is removed. The job
+is safe to run again after an interruption: a document is only switched
+if it still has no blob, otherwise the reference just taken is released.
+
+usage (from src): python -m jobs.migrate_blobs
+"""
+import asyncio
+import hashlib
+import re
+from pathlib import Path
+
+from constants import (BLOBS_DIR, DEFAULT_ORG_PHOTO_URL,
+                       GROUPS_RESOURCES_DIR, ORG_PHOTOS_DIR, UPLOAD_CHUNK_SIZE)
+from db import close_db_connections, get_async_engine_db
+from indexes import ensure_indexes
+from services.blob_store import add_blob, release_blob
+
+# collection, url field and directory of the files to move
+LEGACY_FILES = [
+    ("resources", "file_url", GROUPS_RESOURCES_DIR),
+    ("organizations", "photo_url", ORG_PHOTOS_DIR),
+]
+
+
+def copy_and_hash(path: Path) -> dict:
+    """Copy a file to a temporary file of the blob store while hashing it,
+    returns the path, size and sha256 of the copy
+    """
+    part = BLOBS_DIR / f".{path.name}.part"
+    digest = hashlib.sha256()
+    size = 0
+    with path.open("rb") as source, part.open("wb") as target:
+        while chunk := source.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+            target.write(chunk)
+    return {"path": part, "size": size, "sha256": digest.hexdigest()}
+
+
+async def migrate_document(collection_name: str, field: str,
+                           document: dict) -> bool:
+    """Move the file of a document into the blob store, False if there is
+    no file to move
+    """
+    path = Path(document[field])
+    if not path.is_file():
+        return False
+
+    copy = await asyncio.to_thread(copy_and_hash, path)
+    blob = await add_blob(copy["path"], copy["sha256"], copy["size"],
+                          path.suffix.lower())
+    switched = await get_async_engine_db()[collection_name].update_one(
+        {"_id": document["_id"], "blob": None},
+        {"$set": {field: blob["url"], "blob": blob["_id"]}}
+    )
+    if switched.modified_count == 0:
+        await release_blob(blob["_id"])
+        return False
+    path.unlink(missing_ok=True)
+    return True
+
+
+async def migrate():
+    """Move the files of every document without a blob"""
+    ensure_indexes()
+    BLOBS_DIR.mkdir(parents=True, exist_ok=True)
+    db = get_async_engine_db()
+
+    for collection_name, field, directory in LEGACY_FILES:
+        moved = 0
+        async for document in db[collection_name].find(
+                {"blob": None,
+                 field: {"$regex": f"^{re.escape(str(directory))}/",
+                         "$ne": DEFAULT_ORG_PHOTO_URL}},
+                {field: 1}):
+            moved += await migrate_document(collection_name, field,
+                                            document)
+        print(f"{collection_name}: {moved} files moved")
+
+    await close_db_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,65 @@
+"""Move the messages embedded in organizations and groups documents to
+the bucketed messages collection
+
+The job is safe to run while the app is serving and to run again after an
+interruption: every bucket is keyed by the id of its first message, so
+rewriting it replaces the copy from the previous run.
+
+usage (from src): python -m jobs.migrate_chat_messages
+"""
+from constants import CHAT_BUCKET_SIZE
+from db import get_engine_db
+from pymongo import ReplaceOne
+from indexes import ensure_indexes
+
+
+def migrate_room(collection, room_id) -> int:
+    """Move the messages of a room to buckets, one bucket per batch, and
+    return the number of messages moved
+    """
+    db = get_engine_db()
+    moved = 0
+
+    while True:
+        room = collection.find_one(
+            {"_id": room_id},
+            {"messages": {"$slice": [moved, CHAT_BUCKET_SIZE]}}
+        )
+        batch = room.get("messages", []) if room else []
+        if not batch:
+            break
+
+        db.messages.bulk_write([ReplaceOne(
+            {"_id": batch[0]["_id"]},
+            {
+                "room_id": room_id,
+                "first_id": min(m["_id"] for m in batch),
+                "last_id": max(m["_id"] for m in batch),
+                "start": batch[0]["timestamp"],
+                "end": batch[-1]["timestamp"],
+                "count": len(batch),
+                "open": False,
+                "messages": batch,
+            },
+            upsert=True
+        )])
+        moved += len(batch)
+
+    collection.update_one({"_id": room_id}, {"$unset": {"messages": ""}})
+    return moved
+
+
+def run():
+    """Migrate every room that still has embedded messages"""
+    db = get_engine_db()
+    ensure_indexes()
+
+    for collection in (db.organizations, db.groups):
+        rooms = collection.find({"messages": {"$exists": True}}, {"_id": 1})
+        for room in rooms:
+            moved = migrate_room(collection, room["_id"])
+            print(f"{collection.name} {room['_id']}: {moved} messages moved")
+
+
+if __name__ == "__main__":
+    run()
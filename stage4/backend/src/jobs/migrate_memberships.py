@@ -0,0 +1,68 @@
+"""Move the members arrays of organizations and groups to the memberships
+collection
+
+The job is safe to run while the app is serving and to run again after an
+interruption: memberships are upserted per user and room, and an array is
+only removed if it did not change since it was copied, otherwise the room
+is copied again. Until then the app reads both the array and the
+memberships.
+
+usage (from src): python -m jobs.migrate_memberships
+"""
+from datetime import datetime, timezone
+
+from db import get_engine_db
+from indexes import ensure_indexes
+from pymongo import UpdateOne
+from services.membership import KINDS
+
+BATCH_SIZE = 1000  # memberships written per bulk write
+
+
+def migrate_room(collection, room_id) -> int:
+    """Copy the members array of a room to memberships and remove it,
+    returns the number of members copied
+    """
+    db = get_engine_db()
+    kind = KINDS[collection.name]
+
+    while True:
+        room = collection.find_one({"_id": room_id},
+                                   {"members": 1, "_created_at": 1})
+        if room is None or "members" not in room:
+            return 0
+        members = room["members"]
+        # the real join time is unknown, the room creation is a lower bound
+        joined_at = room.get("_created_at", datetime.now(timezone.utc))
+
+        for start in range(0, len(members), BATCH_SIZE):
+            db.memberships.bulk_write([UpdateOne(
+                {"user_id": user_id, "room_id": room_id},
+                {"$setOnInsert": {"kind": kind, "joined_at": joined_at}},
+                upsert=True
+            ) for user_id in members[start:start + BATCH_SIZE]],
+                ordered=False)
+
+        removed = collection.update_one(
+            {"_id": room_id, "members": members},
+            {"$unset": {"members": ""}}
+        )
+        if removed.modified_count:
+            return len(members)
+
+
+def run():
+    """Migrate every organization and group that still has a members array
+    """
+    db = get_engine_db()
+    ensure_indexes()
+
+    for collection in (db.organizations, db.groups):
+        rooms = collection.find({"members": {"$exists": True}}, {"_id": 1})
+        for room in rooms:
+            moved = migrate_room(collection, room["_id"])
+            print(f"{collection.name} {room['_id']}: {moved} members moved")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,88 @@
+"""Move the resources embedded in groups, with their votes, to the
+resources and votes collections
+
+The job is safe to run again after an interruption: resources keep their
+ids and are only inserted once, votes are upserted per user and resource,
+and the array of a group is only removed if it did not change since it was
+copied, otherwise the group is copied again.
+
+usage (from src): python -m jobs.migrate_resources
+"""
+from bson.objectid import ObjectId
+from db import get_engine_db
+from indexes import ensure_indexes
+from pymongo import UpdateOne
+
+
+def resource_document(group_id, resource: dict) -> dict:
+    """The resources document of an embedded resource"""
+    upvotes = len(set(resource.get("upvotes", [])))
+    downvotes = len(set(resource.get("downvotes", [])))
+    return {
+        "group_id": group_id,
+        "name": resource["name"],
+        "description": resource.get("description"),
+        "file_url": resource["file_url"],
+        "uploaded_by": resource.get("uploaded_by"),
+        "upvotes": upvotes,
+        "downvotes": downvotes,
+        "score": upvotes - downvotes,
+        "_created_at": resource.get("_created_at"),
+    }
+
+
+def vote_updates(resource: dict) -> list[UpdateOne]:
+    """The votes documents of an embedded resource, the voters are stored
+    as user id strings in the arrays
+    """
+    return [UpdateOne(
+        {"resource_id": resource["_id"], "user_id": ObjectId(user_id)},
+        {"$setOnInsert": {"value": value}},
+        upsert=True
+    ) for value, voters in ((1, resource.get("upvotes", [])),
+                            (-1, resource.get("downvotes", [])))
+        for user_id in set(voters)]
+
+
+def migrate_group(group_id) -> int:
+    """Move the resources of a group, returns how many were moved"""
+    db = get_engine_db()
+
+    while True:
+        group = db.groups.find_one({"_id": group_id}, {"resources": 1})
+        if group is None or "resources" not in group:
+            return 0
+        resources = group["resources"]
+
+        if resources:
+            db.resources.bulk_write([UpdateOne(
+                {"_id": resource["_id"]},
+                {"$setOnInsert": resource_document(group_id, resource)},
+                upsert=True
+            ) for resource in resources], ordered=False)
+            votes = [update for resource in resources
+                     for update in vote_updates(resource)]
+            if votes:
+                db.votes.bulk_write(votes, ordered=False)
+
+        removed = db.groups.update_one(
+            {"_id": group_id, "resources": resources},
+            {"$unset": {"resources": ""}}
+        )
+        if removed.modified_count:
+            return len(resources)
+
+
+def run():
+    """Migrate every group that still has embedded resources"""
+    db = get_engine_db()
+    ensure_indexes()
+
+    groups = db.groups.find({"resources": {"$exists": True}}, {"_id": 1})
+    for group in groups:
+        moved = migrate_group(group["_id"])
+        print(f"groups {group['_id']}: {moved} resources moved")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,29 @@
+"""Queue the rendering of the variants of the organization photos stored
+before the image pipeline, or given up on
+
+usage (from src): python -m jobs.queue_photo_variants [--retry-failed]
+"""
+import sys
+from datetime import datetime, timezone
+
+from db import get_engine_db
+
+
+def run(retry_failed: bool = False):
+    """Mark the blobs of the organization photos without variants pending,
+    the pipelines of the running backends pick them up
+    """
+    db = get_engine_db()
+    blob_ids = db.organizations.distinct("blob", {"blob": {"$ne": None}})
+    statuses = [None, "failed"] if retry_failed else [None]
+    queued = db.blobs.update_many(
+        {"_id": {"$in": blob_ids}, "variants_status": {"$in": statuses}},
+        {"$set": {"variants_status": "pending",
+                  "variants_attempts": 0,
+                  "variants_attempt_at": datetime.now(timezone.utc)}}
+    )
+    print(f"{queued.modified_count} photos queued")
+
+
+if __name__ == "__main__":
+    run("--retry-failed" in sys.argv[1:])
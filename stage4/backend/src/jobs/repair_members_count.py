@@ -0,0 +1,47 @@
+"""Recompute the stored members_count of every organization and group from
+its memberships
+
+Needed once for the documents created before the count was stored, and to
+repair counts changed outside the app or left behind by a crash between a
+membership and its count update. The counts are computed by the database
+in a single aggregation per collection, members of a legacy array not
+migrated yet included.
+
+usage (from src): python -m jobs.repair_members_count
+"""
+from db import get_engine_db
+
+
+def recount(collection_name: str) -> list[dict]:
+    """The pipeline writing the recounted members of a collection back"""
+    return [
+        {"$lookup": {
+            "from": "memberships",
+            "localField": "_id",
+            "foreignField": "room_id",
+            "pipeline": [{"$project": {"_id": 0, "user_id": 1}}],
+            "as": "memberships",
+        }},
+        {"$project": {"members_count": {"$size": {"$setUnion": [
+            {"$ifNull": ["$members", []]},
+            "$memberships.user_id",
+        ]}}}},
+        {"$merge": {
+            "into": collection_name,
+            "on": "_id",
+            "whenMatched": "merge",
+            "whenNotMatched": "discard",
+        }},
+    ]
+
+
+def run():
+    """Recount the members of the organizations and groups"""
+    db = get_engine_db()
+    for collection in (db.organizations, db.groups):
+        collection.aggregate(recount(collection.name))
+        print(f"{collection.name}: members counts recomputed")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,27 +1,68 @@
 """Main App definition
 """
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
 
 from api.authentication import auth
-from api.chat import chat
+from api.chat import chat, chat_history, manager, write_buffer
 from api.groups import groups
+from api.monitoring import monitoring
 from api.organizations import orgs
 from api.users import users
-from constants import GROUPS_RESOURCES_DIR, ORG_PHOTOS_DIR, UPLOAD_DIR
+from constants import (BLOBS_DIR, GROUPS_RESOURCES_DIR, ORG_PHOTO_MAX_SIZE,
+                       ORG_PHOTOS_DIR, RESOURCE_MAX_SIZE, UPLOAD_DIR)
+from core.UploadSizeLimit import UploadSizeLimit
+from db import close_db_connections, open_db_connections
+from indexes import ensure_indexes
+from services.email_service import outbox
+from services.image_service import image_pipeline
+from services.password_service import hashing_pool
 
 ORG_PHOTOS_DIR.mkdir(parents=True, exist_ok=True)
 # Add after ORG_PHOTOS_DIR. mkdir(...)
 GROUPS_RESOURCES_DIR.mkdir(parents=True, exist_ok=True)
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+BLOBS_DIR.mkdir(parents=True, exist_ok=True)
 
 load_dotenv("../../.env", verbose=True)
 
 
-app = FastAPI(root_path="/api")
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """Prepare the database before serving and clean up on shutdown"""
+    await open_db_connections()
+    if not ensure_indexes():
+        # uniqueness is only enforced by the indexes, refuse to serve
+        # without them
+        await close_db_connections()
+        raise RuntimeError("Failed to create the database indexes, see "
+                           "python -m jobs.ensure_indexes")
+    await manager.start()
+    await outbox.start()
+    await image_pipeline.start()
+    if write_buffer:
+        await write_buffer.start()
+    yield
+    await manager.stop()
+    await outbox.stop()
+    await image_pipeline.stop()
+    if write_buffer:
+        await write_buffer.stop()
+    await close_db_connections()
+    hashing_pool.shutdown()
+
+
+app = FastAPI(root_path="/api", lifespan=lifespan)
+app.add_middleware(UploadSizeLimit, limits={
+    r"/organizations/?$": ORG_PHOTO_MAX_SIZE,
+    r"/groups/[^/]+/resources/?$": RESOURCE_MAX_SIZE,
+})
 app.include_router(auth)
 app.include_router(orgs)
 app.include_router(chat)
+app.include_router(chat_history)
 app.include_router(users)
 app.include_router(groups)
+app.include_router(monitoring)
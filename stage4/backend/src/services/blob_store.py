@@ -0,0 +1,111 @@
+"""Content addressed storage of the uploaded files
+
+Every distinct content is stored once, as a blob named after its sha256 in
+BLOBS_DIR, and described by a document of db.blobs, {_id: sha256, url,
+size, refs, _created_at, _updated_at}. `refs` counts the resources and
+organizations pointing at the blob through their `blob` field, uploading a
+content already stored only adds a reference.
+
+Blobs no longer referenced are reclaimed by jobs.collect_blobs, which marks
+a blob `deleting` before removing its file. A blob being deleted can not be
+referenced again, its upload waits until the document is gone and stores
+the file anew. A mark older than BLOB_DELETE_TIMEOUT seconds was left by an
+interrupted collection, the upload then takes the blob over instead.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from constants import BLOB_DELETE_TIMEOUT, BLOBS_DIR
+from db import get_async_engine_db
+from fastapi import UploadFile
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from services.upload_service import receive_upload
+
+
+def blob_path(sha256: str, extension: str = "") -> Path:
+    """Where the blob of a content is stored, spread over subdirectories
+    by the first two digits of its hash
+    """
+    return BLOBS_DIR / sha256[:2] / f"{sha256}{extension}"
+
+
+async def take_over_stale(sha256: str, url: str, size: int) -> dict | None:
+    """Replace a blob marked deleting for over BLOB_DELETE_TIMEOUT seconds
+    by a new one with a single reference, None if it is not stale
+    """
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=BLOB_DELETE_TIMEOUT)
+    return await get_async_engine_db().blobs.find_one_and_replace(
+        {"_id": sha256, "deleting": True,
+         "deleting_at": {"$not": {"$gte": stale}}},
+        {"url": url, "size": size, "refs": 1, "_created_at": now,
+         "_updated_at": now},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def add_blob(part: Path, sha256: str, size: int,
+                   extension: str = "") -> dict:
+    """Reference the blob of a complete temporary file, moving the file
+    into place, returns the blob document
+
+    The file keeps the extension of the first upload of its content.
+    """
+    blobs = get_async_engine_db().blobs
+    now = datetime.now(timezone.utc)
+    path = blob_path(sha256, extension)
+    try:
+        while True:
+            try:
+                blob = await blobs.find_one_and_update(
+                    {"_id": sha256, "deleting": {"$ne": True}},
+                    {"$inc": {"refs": 1},
+                     "$set": {"_updated_at": now},
+                     "$setOnInsert": {"url": str(path), "size": size,
+                                      "_created_at": now}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                break
+            except DuplicateKeyError:
+                # the blob is being collected, wait for it to be gone or
+                # take it over if its collection was interrupted
+                blob = await take_over_stale(sha256, str(path), size)
+                if blob:
+                    break
+                await asyncio.sleep(0.05)
+
+        path = Path(blob["url"])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # replaced even if present, identical content, so the file exists
+        # once the blob is referenced
+        os.replace(part, path)
+    finally:
+        part.unlink(missing_ok=True)
+    return blob
+
+
+async def store_upload(upload: UploadFile, max_size: int) -> dict:
+    """Store an upload as a blob, raises 413 FILE_TOO_LARGE past
+    `max_size` bytes
+
+    Returns the blob document, its url is the one to serve the file from.
+    The caller owns one reference and releases it if the upload is not
+    used in the end.
+    """
+    received = await receive_upload(upload, BLOBS_DIR, max_size)
+    return await add_blob(received["path"], received["sha256"],
+                          received["size"],
+                          Path(upload.filename or "").suffix.lower())
+
+
+async def release_blob(sha256: str):
+    """Drop one reference to a blob"""
+    await get_async_engine_db().blobs.update_one(
+        {"_id": sha256},
+        {"$inc": {"refs": -1},
+         "$set": {"_updated_at": datetime.now(timezone.utc)}}
+    )
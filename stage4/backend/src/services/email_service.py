@@ -1,14 +1,28 @@
-"""Email service using Resend
-"""
+"""Email service queueing the emails in the outbox
 
+The emails are sent by the outbox worker through Resend, or appended to the
+file EMAIL_FILE when EMAIL_TRANSPORT=file.
+"""
+import os
+from pathlib import Path
 
 import jwt
-import resend
 from constants import (RESEND_API_KEY, FRONTEND_URL,
                        FROM_EMAIL, SECRET_KEY, ALGORITHM)
+from core.EmailOutbox import EmailOutbox
+from core.EmailTransport import EmailTransport, FileTransport
+from core.ResendTransport import ResendTransport
+
+
+def create_transport() -> EmailTransport:
+    """Transport selected by EMAIL_TRANSPORT, resend or file"""
+    if os.environ.get("EMAIL_TRANSPORT", "resend") == "file":
+        return FileTransport(Path(os.environ.get("EMAIL_FILE",
+                                                 "emails.jsonl")))
+    return ResendTransport(RESEND_API_KEY)
 
 
-resend.api_key = RESEND_API_KEY
+outbox = EmailOutbox(create_transport())
 
 
 def generate_verification_token(email):
@@ -26,35 +40,35 @@ def decode_verification_token(token):
         return None
 
 
-def send_verification_email(to_email, token, username):
-    """Send verification email to user"""
+def verification_email(to_email, token, username) -> dict:
+    """The verification email of a user"""
     verification_link = f"{FRONTEND_URL}/verify-email/{token}"
 
-    try:
-        resend. Emails.send({
-            "from": FROM_EMAIL,
-            "to": to_email,
-            "subject":  "تأكيد البريد الإلكتروني - Verify Your Email",
-            "html": f"""
-            <div dir="rtl" style="font-family: Arial, sans-serif;
-            max-width:  600px; margin: 0 auto;">
-                <h2>مرحباً {username}!</h2>
-                <p>شكراً لتسجيلك معنا.
-                  يرجى تأكيد بريدك الإلكتروني بالنقر على الزر أدناه: </p>
-                <div style="text-align: center; margin: 30px 0;">
-                    <a href="{verification_link}"
-                       style="background-color: #4CAF50;
-                       color: white; padding: 15px 30px;
-                              text-decoration: none;
-                              border-radius: 5px; font-size: 16px;">
-                        تأكيد البريد الإلكتروني
-                    </a>
-                </div>
+    return {
+        "from": FROM_EMAIL,
+        "to": to_email,
+        "subject":  "تأكيد البريد الإلكتروني - Verify Your Email",
+        "html": f"""
+        <div dir="rtl" style="font-family: Arial, sans-serif;
+        max-width:  600px; margin: 0 auto;">
+            <h2>مرحباً {username}!</h2>
+            <p>شكراً لتسجيلك معنا.
+              يرجى تأكيد بريدك الإلكتروني بالنقر على الزر أدناه: </p>
+            <div style="text-align: center; margin: 30px 0;">
+                <a href="{verification_link}"
+                   style="background-color: #4CAF50;
+                   color: white; padding: 15px 30px;
+                          text-decoration: none;
+                          border-radius: 5px; font-size: 16px;">
+                    تأكيد البريد الإلكتروني
+                </a>
             </div>
-            """
-        })
-        return True
-    # pylint: disable=broad-exception-caught
-    except Exception as e:
-        print(f"Failed to send verification email: {e}")
-        return False
+        </div>
+        """
+    }
+
+
+async def send_verification_email(to_email, token, username):
+    """Queue the verification email of a user"""
+    await outbox.enqueue(f"verify:{to_email}",
+                         verification_email(to_email, token, username))
@@ -0,0 +1,91 @@
+"""Position of the groups in the tree of their organization
+
+Every group stores `ancestors`, the ids of the groups above it from the
+main group down to its parent, so a whole path is read at once. Groups
+created before it was stored get it from jobs.backfill_group_ancestors,
+until then it is found by walking up parentGroupId.
+
+The groups of an organization are cached together to serve its whole tree,
+creating a group or changing its domains invalidates them and the members
+counts are refreshed when they expire.
+"""
+from typing import Callable
+
+from bson.objectid import ObjectId
+from constants import GROUP_TREE_CACHE_SIZE, GROUP_TREE_CACHE_TTL
+from core.TTLCache import TTLCache
+from db import get_engine_db
+
+tree_cache = TTLCache(GROUP_TREE_CACHE_SIZE, GROUP_TREE_CACHE_TTL)
+
+
+def ancestors_of(group: dict) -> list[ObjectId]:
+    """The ancestors of a group from its main group down to its parent,
+    `group` needs its ancestors or parentGroupId fields
+    """
+    if "ancestors" in group:
+        return group["ancestors"]
+
+    db = get_engine_db()
+    ancestors = []
+    parent_id = group.get("parentGroupId")
+    # parentGroupId of main groups may be missing, null or empty
+    while parent_id:
+        parent = db.groups.find_one({"_id": ObjectId(parent_id)},
+                                    {"parentGroupId": 1, "ancestors": 1})
+        if not parent:
+            break
+        if "ancestors" in parent:
+            return parent["ancestors"] + [parent["_id"]] + ancestors
+        ancestors.insert(0, parent["_id"])
+        parent_id = parent.get("parentGroupId")
+    return ancestors
+
+
+def child_ancestors(parent: dict) -> list[ObjectId]:
+    """The ancestors of a new subgroup of `parent`"""
+    return ancestors_of(parent) + [parent["_id"]]
+
+
+def get_org_groups(org_id: ObjectId) -> list[dict]:
+    """The groups of an organization, all read by one indexed query"""
+    groups = tree_cache.get(org_id)
+    if groups is None:
+        groups = list(get_engine_db().groups.find(
+            {"org_id": org_id},
+            {"title": 1, "admin": 1, "parentGroupId": 1,
+             "members_count": 1, "AllowedEmailDomains": 1}
+        ))
+        tree_cache.set(org_id, groups)
+    return groups
+
+
+def invalidate_org_tree(org_id: ObjectId):
+    """Forget the cached groups of an organization after one changed"""
+    tree_cache.invalidate(org_id)
+
+
+def build_tree(groups: list[dict], max_depth: int | None,
+               node: Callable[[dict], dict]) -> list[dict]:
+    """Nest the groups under their parents down to `max_depth` levels, the
+    main groups being the first level, each group turned to a dict by node
+    and its subgroups set in its subGroups
+    """
+    ids = {group["_id"] for group in groups}
+    children: dict[ObjectId | None, list[dict]] = {}
+    for group in groups:
+        parent_id = group.get("parentGroupId")
+        # parentGroupId of main groups may be missing, null or empty
+        parent_id = ObjectId(parent_id) if parent_id else None
+        if parent_id not in ids:
+            parent_id = None
+        children.setdefault(parent_id, []).append(group)
+
+    def nest(parent_id, depth):
+        if max_depth is not None and depth >= max_depth:
+            return []
+        return [{**node(group),
+                 "subGroups": nest(group["_id"], depth + 1)}
+                for group in children.get(parent_id, [])]
+
+    return nest(None, 0)
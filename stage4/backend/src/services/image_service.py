@@ -0,0 +1,64 @@
+"""Variants of the organization photos, rendered in the background
+
+The photos are stored as uploaded. The image pipeline then renders the
+ORG_PHOTO_VARIANTS of each one as WebP files next to its blob, in
+IMAGE_PROCESSES dedicated worker processes so decoding large images never
+holds the event loop or the threadpool. The listing serves the variants
+that are ready and the original otherwise.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from constants import IMAGE_MAX_PIXELS, ORG_PHOTO_VARIANTS
+from core.BoundedExecutor import BoundedExecutor
+from core.ImagePipeline import ImagePipeline
+from db import get_engine_db
+from PIL import Image, ImageOps
+
+IMAGE_PROCESSES = int(os.environ.get(
+    "IMAGE_PROCESSES", str(max(1, (os.cpu_count() or 1) // 2))))
+
+
+def render_variants(url: str,
+                    variants: dict[str, tuple[int, int]]) -> dict[str, str]:
+    """Render the variants of the image stored at `url` next to it, each
+    cropped to fill its size, returns their urls by name
+
+    Raises ValueError for images over IMAGE_MAX_PIXELS once reduced, a
+    small compressed file can declare dimensions taking gigabytes decoded.
+    """
+    source = Path(url)
+    urls = {}
+    with Image.open(source) as image:
+        # let JPEG decode at a reduced scale, enough for the largest size
+        image.draft("RGB", (max(w for w, _ in variants.values()),
+                            max(h for _, h in variants.values())))
+        width, height = image.size
+        if width * height > IMAGE_MAX_PIXELS:
+            raise ValueError(f"image of {width}x{height} pixels is too large")
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        for name, size in variants.items():
+            path = source.with_name(f"{source.stem}.{name}.webp")
+            part = path.with_name(f".{path.name}.part")
+            ImageOps.fit(image, size, Image.Resampling.LANCZOS).save(
+                part, "WEBP", quality=80, method=4)
+            os.replace(part, path)
+            urls[name] = str(path)
+    return urls
+
+
+image_pipeline = ImagePipeline(
+    BoundedExecutor(ProcessPoolExecutor(IMAGE_PROCESSES), IMAGE_PROCESSES),
+    render_variants, ORG_PHOTO_VARIANTS)
+
+
+def get_photo_variants(blob_ids: list[str]) -> dict[str, dict[str, str]]:
+    """The urls of the rendered variants of the blobs that have them"""
+    return {
+        blob["_id"]: blob["variants"]
+        for blob in get_engine_db().blobs.find(
+            {"_id": {"$in": blob_ids}, "variants_status": "ready"},
+            {"variants": 1})
+    }
@@ -0,0 +1,85 @@
+"""Members of the organizations and groups
+
+Every membership is a document of db.memberships, {user_id, room_id, kind,
+joined_at}, unique per user and room, so checking one is a single indexed
+lookup. The organizations and groups keep the number of their members in
+`members_count`, changed right after the membership.
+
+Documents created before the memberships collection keep their members in
+a `members` array until jobs.migrate_memberships moves them, the functions
+here also look at that array meanwhile.
+"""
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+from db import get_engine_db
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+KINDS = {"organizations": "org", "groups": "group"}
+
+
+def add_member(collection: Collection, target_id: ObjectId,
+               user_id: ObjectId) -> bool:
+    """Add a user to the members of an existing organization or group,
+    False if the user is already a member
+    """
+    try:
+        get_engine_db().memberships.insert_one({
+            "user_id": user_id,
+            "room_id": target_id,
+            "kind": KINDS[collection.name],
+            "joined_at": datetime.now(timezone.utc),
+        })
+    except DuplicateKeyError:
+        return False
+
+    # a member of the legacy array joined before and is counted already
+    result = collection.update_one(
+        {"_id": target_id, "members": {"$ne": user_id}},
+        {"$inc": {"members_count": 1}}
+    )
+    return result.matched_count == 1
+
+
+def remove_member(collection: Collection, target_id: ObjectId,
+                  user_id: ObjectId) -> bool:
+    """Remove a user from the members of an organization or a group, False
+    if the user is not a member
+    """
+    deleted = get_engine_db().memberships.delete_one(
+        {"user_id": user_id, "room_id": target_id}).deleted_count
+    result = collection.update_one(
+        {"_id": target_id, "members": user_id},
+        {"$pull": {"members": user_id}, "$inc": {"members_count": -1}}
+    )
+    if deleted and result.matched_count == 0:
+        collection.update_one({"_id": target_id},
+                              {"$inc": {"members_count": -1}})
+    return bool(deleted or result.matched_count)
+
+
+def is_member(collection: Collection, target_id: ObjectId,
+              user_id: ObjectId) -> bool:
+    """Whether a user is a member of an organization or a group"""
+    found = get_engine_db().memberships.find_one(
+        {"user_id": user_id, "room_id": target_id}, {"_id": 1})
+    if found is not None:
+        return True
+    return collection.count_documents(
+        {"_id": target_id, "members": user_id}, limit=1) == 1
+
+
+def get_member_ids(room_ids: list[ObjectId],
+                   legacy: dict[ObjectId, list] | None = None
+                   ) -> dict[ObjectId, list[ObjectId]]:
+    """The ids of the members of each room, the ones of the legacy arrays
+    in `legacy` included
+    """
+    # dicts as ordered sets
+    members = {room_id: dict.fromkeys((legacy or {}).get(room_id, []))
+               for room_id in room_ids}
+    for membership in get_engine_db().memberships.find(
+            {"room_id": {"$in": room_ids}}, {"room_id": 1, "user_id": 1}):
+        members[membership["room_id"]][membership["user_id"]] = None
+    return {room_id: list(ids) for room_id, ids in members.items()}
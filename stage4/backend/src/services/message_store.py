@@ -0,0 +1,149 @@
+"""Storage of chat messages in per room buckets
+
+Messages of a room are appended to the room's single open bucket, a
+document of db.messages holding about CHAT_BUCKET_SIZE messages. Once full
+the bucket is closed and the next message opens a new one, so reading the
+latest messages of a room touches one or two small documents instead of
+the whole history.
+"""
+from bson.objectid import ObjectId
+from constants import CHAT_BUCKET_SIZE
+from db import get_async_engine_db
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+
+
+def _append_to_open_bucket(room_id: ObjectId, messages: list[dict]):
+    """Return the update appending messages to the open bucket of a room,
+    closing it in the same operation once it is full
+    """
+    ids = [message["_id"] for message in messages]
+    timestamps = [message["timestamp"] for message in messages]
+    return [
+        # messages may arrive out of order, like a retried write-behind
+        # batch, the bounds are kept over every message of the bucket
+        {"$set": {
+            "first_id": {"$min": ["$first_id", min(ids)]},
+            "last_id": {"$max": ["$last_id", max(ids)]},
+            "start": {"$min": ["$start", min(timestamps)]},
+            "end": {"$max": ["$end", max(timestamps)]},
+            "count": {"$add": [{"$ifNull": ["$count", 0]}, len(messages)]},
+            "messages": {"$concatArrays": [
+                {"$ifNull": ["$messages", []]},
+                # $literal keeps contents starting with "$" from being read
+                # as field paths
+                {"$literal": messages}
+            ]},
+        }},
+        {"$set": {
+            "room_id": room_id,
+            "open": {"$lt": ["$count", CHAT_BUCKET_SIZE]},
+        }},
+    ]
+
+
+async def stored_ids(room_id: ObjectId, messages: list[dict]) -> set:
+    """The ids of the messages, oldest first, already in the history of a
+    room
+
+    Only the latest buckets are read, back to the first one ending before
+    the oldest of the messages.
+    """
+    wanted = {message["_id"] for message in messages}
+    oldest = messages[0]["timestamp"]
+    found = set()
+    buckets = get_async_engine_db().messages.find(
+        {"room_id": room_id}, {"messages._id": 1, "end": 1}
+    ).sort([("last_id", -1), ("first_id", -1)])
+    async for bucket in buckets:
+        found.update(m["_id"] for m in bucket["messages"]
+                     if m["_id"] in wanted)
+        if bucket["end"] < oldest:
+            break
+    await buckets.close()
+    return found
+
+
+async def save_batches(batches: dict[ObjectId, list[dict]],
+                       retry: bool = False):
+    """Append the messages of several rooms, oldest first, to their
+    histories in a single round-trip
+
+    A write failing part way may have stored some of the messages, when
+    `retry` is set the ones already stored are skipped.
+    """
+    db = get_async_engine_db()
+
+    if retry:
+        unsaved = {}
+        for room_id, messages in batches.items():
+            stored = await stored_ids(room_id, messages)
+            unsaved[room_id] = [m for m in messages if m["_id"] not in stored]
+        batches = {room_id: messages
+                   for room_id, messages in unsaved.items() if messages}
+
+    operations = [
+        UpdateOne(
+            {"room_id": room_id, "open": True},
+            _append_to_open_bucket(room_id,
+                                   messages[i:i + CHAT_BUCKET_SIZE]),
+            upsert=True
+        )
+        for room_id, messages in batches.items()
+        for i in range(0, len(messages), CHAT_BUCKET_SIZE)
+    ]
+    if not operations:
+        return
+
+    try:
+        await db.messages.bulk_write(operations)
+    except BulkWriteError as ex:
+        errors = ex.details["writeErrors"]
+        if errors[0]["code"] != DUPLICATE_KEY:
+            raise
+        # another writer opened the bucket first, the operations from the
+        # failed one on now append to it
+        await db.messages.bulk_write(operations[errors[0]["index"]:])
+
+
+async def save_messages(room_id: ObjectId, messages: list[dict]):
+    """Append messages, oldest first, to the history of a room"""
+    await save_batches({room_id: messages})
+
+
+async def save_message(room_id: ObjectId, message: dict):
+    """Append a message to the history of a room"""
+    await save_messages(room_id, [message])
+
+
+async def get_messages(room_id: ObjectId, before: ObjectId | None = None,
+                       limit: int = CHAT_BUCKET_SIZE) -> list[dict]:
+    """Get up to `limit` of the latest messages of a room older than the
+    message `before`, oldest first
+    """
+    db = get_async_engine_db()
+
+    query = {"room_id": room_id}
+    if before is not None:
+        query["first_id"] = {"$lt": before}
+
+    # buckets newest message first, once `limit` messages are found the
+    # buckets whose newest message is older than all of them are skipped
+    messages = []
+    buckets = db.messages.find(query, {"messages": 1, "last_id": 1}).sort(
+        [("last_id", -1), ("first_id", -1)])
+    async for bucket in buckets:
+        # buckets stored before last_id was kept come last, in order
+        newest = bucket.get("last_id")
+        if len(messages) >= limit and (
+                newest is None or newest <= messages[-limit]["_id"]):
+            break
+        messages = sorted(messages + [
+            m for m in bucket["messages"]
+            if before is None or m["_id"] < before
+        ], key=lambda m: m["_id"])
+    await buckets.close()
+
+    return messages[-limit:] if limit else []
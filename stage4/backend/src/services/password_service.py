@@ -0,0 +1,50 @@
+"""Argon2 hashing of the passwords in dedicated worker processes
+
+Hashing is made to be slow and memory hungry, running it in FastAPI's
+threadpool lets a burst of logins starve every other sync endpoint. The
+workers are limited to PASSWORD_HASH_PROCESSES and at most
+PASSWORD_HASH_MAX_PENDING calls run or wait for them, the ones above are
+answered with 503 AUTH_BUSY.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from core.BoundedExecutor import BoundedExecutor
+from fastapi.exceptions import HTTPException
+from pwdlib import PasswordHash
+
+PASSWORD_HASH_PROCESSES = int(os.environ.get(
+    "PASSWORD_HASH_PROCESSES", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get(
+    "PASSWORD_HASH_MAX_PENDING", str(8 * PASSWORD_HASH_PROCESSES)))
+
+password_hash = PasswordHash.recommended()
+hashing_pool = BoundedExecutor(
+    ProcessPoolExecutor(PASSWORD_HASH_PROCESSES), PASSWORD_HASH_MAX_PENDING)
+
+
+def _hash(password: str) -> str:
+    return password_hash.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return password_hash.verify(password, hashed)
+
+
+async def _run(fn, *args):
+    try:
+        return await hashing_pool.run(fn, *args)
+    except asyncio.QueueFull as ex:
+        raise HTTPException(status_code=503, detail="AUTH_BUSY",
+                            headers={"Retry-After": "1"}) from ex
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password in a worker process"""
+    return await _run(_hash, password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """Check a password against its hash in a worker process"""
+    return await _run(_verify, password, hashed)
@@ -0,0 +1,128 @@
+"""Resources of the groups and their votes
+
+Resources are documents of db.resources keeping the number of their
+up and down votes and the score, upvotes minus downvotes. Every vote is a
+document of db.votes, {resource_id, user_id, value} with value 1, -1 or 0
+once taken back, unique per user and resource.
+"""
+from bson.objectid import ObjectId
+from db import get_engine_db
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# sort orders of the listing, _id breaks the ties so every page has a
+# well defined end to continue from
+SORTS = {
+    "newest": [("_id", -1)],
+    "score": [("score", -1), ("_id", -1)],
+}
+
+
+def encode_cursor(resource: dict, sort: str) -> str:
+    """The cursor continuing a listing after `resource`"""
+    if sort == "score":
+        return f"{resource['score']}_{resource['_id']}"
+    return str(resource["_id"])
+
+
+def after_cursor(cursor: str, sort: str) -> dict:
+    """The filter of the resources after a cursor, raises ValueError or
+    InvalidId on a malformed one
+    """
+    if sort == "score":
+        score, resource_id = cursor.split("_")
+        score, resource_id = int(score), ObjectId(resource_id)
+        return {"$or": [
+            {"score": {"$lt": score}},
+            {"score": score, "_id": {"$lt": resource_id}},
+        ]}
+    return {"_id": {"$lt": ObjectId(cursor)}}
+
+
+def list_resources(group_id: ObjectId, sort: str, after: str | None,
+                   limit: int) -> tuple[list[dict], str | None]:
+    """A page of the resources of a group and the cursor of the next page,
+    None on the last one
+    """
+    query = {"group_id": group_id}
+    if after:
+        query.update(after_cursor(after, sort))
+
+    resources = list(get_engine_db().resources.find(query)
+                     .sort(SORTS[sort]).limit(limit + 1))
+    if len(resources) <= limit:
+        return resources, None
+    resources = resources[:limit]
+    return resources, encode_cursor(resources[-1], sort)
+
+
+def counter_changes(old: int, new: int) -> dict:
+    """The changes of the counters of a resource when the vote of a user
+    goes from `old` to `new`, 0 being no vote
+    """
+    return {
+        "upvotes": (new == 1) - (old == 1),
+        "downvotes": (new == -1) - (old == -1),
+        "score": new - old,
+    }
+
+
+def toggle_vote(resource_id: ObjectId, user_id: ObjectId,
+                value: int) -> tuple[int, int]:
+    """Switch the vote of a user to `value`, or take it back if it was
+    `value` already, in one atomic update of the vote record
+
+    Returns the vote before and after, 0 being no vote.
+    """
+    votes = get_engine_db().votes
+    while True:
+        try:
+            before = votes.find_one_and_update(
+                {"resource_id": resource_id, "user_id": user_id},
+                [{"$set": {"value": {"$cond": [
+                    {"$eq": ["$value", value]}, 0, value
+                ]}}}],
+                projection={"_id": 0, "value": 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            continue  # a concurrent first vote inserted the record
+        old = before["value"] if before else 0
+        return old, 0 if old == value else value
+
+
+def vote(group_id: ObjectId, resource_id: ObjectId, user_id: ObjectId,
+         value: int) -> dict | None:
+    """Cast the vote of a user on a resource, voting the same way again
+    takes the vote back
+
+    Returns the counters of the resource, None if it is not in the group.
+    Two round-trips, each atomic: the vote record is switched first, which
+    orders the concurrent votes of a user, then the counters move by the
+    difference.
+    """
+    old, new = toggle_vote(resource_id, user_id, value)
+    counters = get_engine_db().resources.find_one_and_update(
+        {"_id": resource_id, "group_id": group_id},
+        {"$inc": counter_changes(old, new)},
+        projection={"_id": 0, "upvotes": 1, "downvotes": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if counters is None:
+        # no such resource, undo the vote
+        key = {"resource_id": resource_id, "user_id": user_id}
+        if old == 0:
+            get_engine_db().votes.delete_one(key)
+        else:
+            get_engine_db().votes.update_one(key, {"$set": {"value": old}})
+    return counters
+
+
+def get_counters(group_id: ObjectId, resource_id: ObjectId) -> dict | None:
+    """The up and down votes of a resource, None if it is not in the group
+    """
+    return get_engine_db().resources.find_one(
+        {"_id": resource_id, "group_id": group_id},
+        {"_id": 0, "upvotes": 1, "downvotes": 1}
+    )
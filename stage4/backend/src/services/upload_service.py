@@ -0,0 +1,42 @@
+"""Reception of the uploaded files
+
+An upload is streamed chunk by chunk to a temporary file while it is
+hashed, and only moved into place by the caller once complete, so a file
+is either complete or missing and never read half written. Uploads over
+their size quota are stopped as soon as they cross it.
+"""
+import asyncio
+import hashlib
+import uuid
+from pathlib import Path
+from constants import UPLOAD_CHUNK_SIZE
+from fastapi import UploadFile
+from fastapi.exceptions import HTTPException
+
+
+async def receive_upload(upload: UploadFile, directory: Path,
+                         max_size: int) -> dict:
+    """Write an upload to a new temporary file of `directory`, raises 413
+    FILE_TOO_LARGE past `max_size` bytes
+
+    Returns the path, size and sha256 of the temporary file, which the
+    caller renames or removes.
+    """
+    part = directory / f".{uuid.uuid4().hex}.part"
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with part.open("wb") as file:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(status_code=413,
+                                        detail="FILE_TOO_LARGE")
+                digest.update(chunk)
+                await asyncio.to_thread(file.write, chunk)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+
+    return {"path": part, "size": size, "sha256": digest.hexdigest()}
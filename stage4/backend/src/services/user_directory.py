@@ -0,0 +1,44 @@
+"""Display information of the users sending chat messages
+"""
+from bson.objectid import ObjectId
+from constants import SENDER_CACHE_SIZE, SENDER_CACHE_TTL
+from core.TTLCache import TTLCache
+from db import get_async_engine_db
+
+sender_cache = TTLCache(SENDER_CACHE_SIZE, SENDER_CACHE_TTL)
+
+
+async def get_senders(user_ids) -> dict[ObjectId, dict]:
+    """Get the display information of users by id, the ones not cached are
+    fetched in a single query and users that do not exist are left out
+    """
+    senders = {}
+    missing = []
+    for user_id in set(user_ids):
+        sender = sender_cache.get(user_id)
+        if sender is None:
+            missing.append(user_id)
+        else:
+            senders[user_id] = sender
+
+    if missing:
+        db = get_async_engine_db()
+        async for user in db.users.find({"_id": {"$in": missing}},
+                                        {"username": 1}):
+            sender = {"username": user["username"]}
+            sender_cache.set(user["_id"], sender)
+            senders[user["_id"]] = sender
+
+    return senders
+
+
+async def get_sender(user_id: ObjectId) -> dict | None:
+    """Get the display information of a user, None if it does not exist"""
+    return (await get_senders([user_id])).get(user_id)
+
+
+def invalidate_sender(user_id: ObjectId):
+    """Forget the cached information of a user after it changed, other
+    processes pick the change up once their entry expires
+    """
+    sender_cache.invalidate(user_id)
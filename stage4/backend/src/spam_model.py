@@ -1,11 +1,119 @@
 """Provide methods to deal with spam messages
+
+The word list of profanityfilter is compiled once into a single regular
+expression shaped like a trie, so a message is scanned in one pass
+whatever the number of words instead of once per word.
 """
+import asyncio
+import hashlib
+import re
+from concurrent.futures import ProcessPoolExecutor
+from os import environ
+
+from constants import SPAM_CACHE_MAX_LENGTH, SPAM_CACHE_SIZE, SPAM_CACHE_TTL
+from core.TTLCache import TTLCache
 from profanityfilter import ProfanityFilter
+from profanityfilter.profanityfilter import (ENDS_WITH_WORD_CHAR,
+                                             STARTS_WITH_WORD_CHAR)
+
+RE_ESCAPED_CHAR = re.compile(r"\\(.)")
+
+
+def trie_pattern(words: list[str]) -> str:
+    """Regular expression matching any of the words, sharing their common
+    prefixes so matching walks a trie
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def to_pattern(node: dict) -> str:
+        ends_here = "" in node
+        branches = [re.escape(char) + to_pattern(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else \
+            "(?:" + "|".join(branches) + ")"
+        return f"(?:{pattern})?" if ends_here else pattern
+
+    return to_pattern(trie)
+
+
+def build_matcher(profane_words: list[str]) -> re.Pattern:
+    """Compile the regex escaped words of profanityfilter, keeping its word
+    boundaries rules, into one case insensitive pattern
+    """
+    groups: dict[tuple[bool, bool], list[str]] = {}
+    for word in profane_words:
+        key = (bool(STARTS_WITH_WORD_CHAR.search(word)),
+               bool(ENDS_WITH_WORD_CHAR.search(word)))
+        groups.setdefault(key, []).append(
+            RE_ESCAPED_CHAR.sub(r"\1", word).lower())
+
+    alternatives = []
+    for (starts, ends), words in sorted(groups.items()):
+        pattern = trie_pattern(words)
+        alternatives.append(
+            (r"\b" if starts else "") + f"(?:{pattern})" +
+            (r"\b" if ends else ""))
+    return re.compile("|".join(alternatives), re.IGNORECASE)
 
-pf = ProfanityFilter()
+
+matcher = build_matcher(ProfanityFilter().get_profane_words())
+# verdicts by a digest of the message, so an entry has a fixed size
+verdicts = TTLCache(SPAM_CACHE_SIZE, SPAM_CACHE_TTL)
+# SPAM_CHECK_PROCESSES > 0 checks messages in worker processes instead of
+# a thread of the event loop's default executor
+SPAM_CHECK_PROCESSES = int(environ.get("SPAM_CHECK_PROCESSES", "0"))
+pool = ProcessPoolExecutor(SPAM_CHECK_PROCESSES) \
+    if SPAM_CHECK_PROCESSES > 0 else None
+
+
+def matches(message: str) -> bool:
+    """Return true if the message contains a profane word, uncached"""
+    return matcher.search(message) is not None
+
+
+def cache_key(message: str) -> bytes | None:
+    """The key of the cached verdict of a message, None if too long to be
+    worth caching
+    """
+    if len(message) > SPAM_CACHE_MAX_LENGTH:
+        return None
+    return hashlib.blake2b(message.encode(), digest_size=16).digest()
 
 
 def is_spam(message: str) -> bool:
     """Return true if the message is considered a spam
     """
-    return pf.is_profane(message)
+    key = cache_key(message)
+    if key is None:
+        return matches(message)
+    verdict = verdicts.get(key)
+    if verdict is None:
+        verdict = matches(message)
+        verdicts.set(key, verdict)
+    return verdict
+
+
+def are_spam(messages: list[str]) -> list[bool]:
+    """Return for every message whether it is considered a spam"""
+    return [is_spam(message) for message in messages]
+
+
+async def is_spam_async(message: str) -> bool:
+    """Return true if the message is considered a spam, checking it off the
+    event loop unless the verdict is cached
+    """
+    key = cache_key(message)
+    verdict = verdicts.get(key) if key is not None else None
+    if verdict is None:
+        verdict = await asyncio.get_running_loop().run_in_executor(
+            pool, matches, message)
+        if key is not None:
+            verdicts.set(key, verdict)
+    return verdict
@@ -0,0 +1,10 @@
+import pytest
+from indexes import ensure_indexes
+
+
+@pytest.fixture(scope="session")
+def database_indexes():
+    """Create the indexes the app creates at startup, the TestClient is
+    used without its lifespan
+    """
+    assert ensure_indexes()
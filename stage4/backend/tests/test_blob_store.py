@@ -0,0 +1,90 @@
+import asyncio
+import hashlib
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from db import close_db_connections, get_engine_db
+from fastapi import UploadFile
+from jobs import collect_blobs
+from services import blob_store
+
+pytestmark = pytest.mark.usefixtures("database_indexes")
+
+
+def store(content: bytes, filename: str = "notes.pdf") -> dict:
+    """Store some content as a blob"""
+    async def scenario():
+        try:
+            return await blob_store.store_upload(
+                UploadFile(io.BytesIO(content), filename=filename), 1000)
+        finally:
+            await close_db_connections()
+    return asyncio.run(scenario())
+
+
+class TestBlobStore:
+    """Test the content addressed storage of the uploads"""
+
+    @pytest.fixture(autouse=True)
+    def blobs_dir(self, tmp_path, monkeypatch):
+        """Store the blobs in a temporary directory"""
+        monkeypatch.setattr(blob_store, "BLOBS_DIR", tmp_path)
+        yield tmp_path
+        get_engine_db().blobs.delete_many(
+            {"url": {"$regex": f"^{tmp_path}"}})
+
+    def test_identical_uploads_share_a_blob(self, blobs_dir):
+        """Test that the same content is stored once and referenced twice
+        """
+        first = store(b"lecture notes")
+        second = store(b"lecture notes", "copy.PDF")
+        assert first["_id"] == second["_id"]
+        assert first["url"] == second["url"]
+        assert first["url"].endswith(".pdf")
+        assert second["refs"] == 2
+
+        files = [path for path in blobs_dir.rglob("*") if path.is_file()]
+        assert [str(path) for path in files] == [first["url"]]
+        assert files[0].read_bytes() == b"lecture notes"
+
+    def test_collect_unreferenced_blobs(self, blobs_dir):
+        """Test that the blobs nothing points at are deleted"""
+        used = store(b"used resource")
+        unused = store(b"unused resource")
+        now = datetime.now(timezone.utc)
+        resource_id = get_engine_db().resources.insert_one({
+            "name": "used", "file_url": used["url"], "blob": used["_id"],
+            "_created_at": now,
+        }).inserted_id
+
+        try:
+            collect_blobs.run(grace=-1)
+        finally:
+            get_engine_db().resources.delete_one({"_id": resource_id})
+
+        blobs = get_engine_db().blobs
+        assert blobs.find_one({"_id": used["_id"]})["refs"] == 1
+        assert blobs.find_one({"_id": unused["_id"]}) is None
+        assert [str(path) for path in blobs_dir.rglob("*")
+                if path.is_file()] == [used["url"]]
+
+    def test_take_over_interrupted_deletion(self, blobs_dir):
+        """Test that an upload does not wait on a blob left marked deleting
+        by an interrupted collection
+        """
+        content = b"orphaned by a crash"
+        sha256 = hashlib.sha256(content).hexdigest()
+        get_engine_db().blobs.insert_one({
+            "_id": sha256, "url": str(blobs_dir / "gone.pdf"), "size": 1,
+            "refs": 0, "deleting": True,
+            "deleting_at": datetime.now(timezone.utc) - timedelta(hours=1),
+        })
+
+        blob = store(content)
+        assert blob["_id"] == sha256
+        assert blob["refs"] == 1
+        assert "deleting" not in blob
+        assert blob["url"] == str(blob_store.blob_path(sha256, ".pdf"))
+        assert blobs_dir.joinpath(sha256[:2], f"{sha256}.pdf").read_bytes() \
+            == content
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from core.BoundedExecutor import BoundedExecutor
+
+
+class TestBoundedExecutor:
+    """Test the limit on the calls waiting for the workers"""
+
+    def test_run_returns_the_result(self):
+        """Test that the result of the call is returned"""
+        async def scenario():
+            executor = BoundedExecutor(ThreadPoolExecutor(1), max_pending=2)
+            result = await executor.run(pow, 2, 10)
+            executor.shutdown()
+            return result, executor.stats()
+
+        result, stats = asyncio.run(scenario())
+        assert result == 1024
+        assert stats["pending"] == 0
+        assert stats["completed"] == 1
+
+    def test_reject_when_full(self):
+        """Test that calls over the limit are rejected while the others run
+        """
+        release = threading.Event()
+
+        async def scenario():
+            executor = BoundedExecutor(ThreadPoolExecutor(1), max_pending=2)
+            running = [asyncio.create_task(executor.run(release.wait, 5))
+                       for _ in range(2)]
+            await asyncio.sleep(0.01)
+            with pytest.raises(asyncio.QueueFull):
+                await executor.run(release.wait, 5)
+            release.set()
+            await asyncio.gather(*running)
+            await executor.run(release.wait, 5)
+            executor.shutdown()
+            return executor.stats()
+
+        stats = asyncio.run(scenario())
+        assert stats["rejected"] == 1
+        assert stats["completed"] == 3
+        assert stats["pending"] == 0
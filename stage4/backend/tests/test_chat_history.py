@@ -0,0 +1,226 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from api.chat import save_message_to_db
+from bson.objectid import ObjectId
+from constants import CHAT_BUCKET_SIZE
+from db import get_engine_db
+from fastapi.testclient import TestClient
+from main import app
+from services.membership import add_member
+from services.message_store import get_messages, save_batches
+
+client = TestClient(app)
+pytestmark = pytest.mark.usefixtures("database_indexes")
+
+
+class TestChatHistory:
+    """Test the paginated chat history"""
+    access_token: str = ""
+    org_id: str = ""
+    messages_count = 7
+
+    @pytest.fixture(scope="class", autouse=True)
+    def setup_room_with_messages(self, request):
+        """Create a user and an organization with some messages"""
+        db = get_engine_db()
+        db.users.delete_many({})
+        db.organizations.delete_many({})
+        db.memberships.delete_many({})
+        db.messages.delete_many({})
+        client.post("/auth/register", json={
+            "email": "ali@gmail.com",
+            "password": "ali12345",
+            "first_name": "ali",
+            "last_name": "redmon",
+            "username": "ali"
+        })
+        response = client.post("/auth/login", data={
+            "username": "ali",
+            "password": "ali12345",
+        })
+        assert response.status_code == 200
+        request.cls.access_token = response.json()["access_token"]
+
+        user_id = db.users.find_one({"username": "ali"})["_id"]
+        org_id = db.organizations.insert_one({
+            "organization_name": "BIG_ORG",
+            "email_domain": "@GG.EDU",
+            "location": "RIYADH",
+            "photo_url": "",
+            "members": [],
+        }).inserted_id
+        request.cls.org_id = str(org_id)
+        add_member(db.organizations, org_id, user_id)
+
+        start = datetime.now(timezone.utc)
+        asyncio.run(self.save_messages(str(org_id), [{
+            "_id": ObjectId(),
+            "sender_id": user_id,
+            "content": f"message {i}",
+            "timestamp": start + timedelta(seconds=i)
+        } for i in range(request.cls.messages_count)]))
+
+    @staticmethod
+    async def save_messages(room_id, messages):
+        """Save the messages one by one like the chat does"""
+        for message in messages:
+            await save_message_to_db(room_id, message)
+
+    def get_page(self, before=None, limit=3):
+        """Get a page of the organization messages"""
+        params = {"limit": limit}
+        if before is not None:
+            params["before"] = before
+        return client.get(
+            f"/chat/{self.org_id}/messages", params=params,
+            headers={"Authorization": f"Bearer {self.access_token}"})
+
+    def test_history_requires_authentication(self):
+        """Test that the history is not served to anonymous users"""
+        response = client.get(f"/chat/{self.org_id}/messages")
+        assert response.status_code == 401
+
+    def test_history_requires_membership(self):
+        """Test that the history is not served to the non members"""
+        org_id = get_engine_db().organizations.insert_one({
+            "organization_name": "OTHER_ORG",
+            "email_domain": "@OTHER.EDU",
+            "location": "RIYADH",
+            "photo_url": "",
+            "members": [],
+        }).inserted_id
+        response = client.get(
+            f"/chat/{org_id}/messages",
+            headers={"Authorization": f"Bearer {self.access_token}"})
+        assert response.status_code == 403
+        assert response.json()["detail"] == "NOT_A_MEMBER"
+
+    def test_history_of_unknown_room(self):
+        """Test that the history of a room that does not exist is 404"""
+        response = client.get(
+            f"/chat/{ObjectId()}/messages",
+            headers={"Authorization": f"Bearer {self.access_token}"})
+        assert response.status_code == 404
+        assert response.json()["detail"] == "ROOM_NOT_FOUND"
+
+    def test_latest_page(self):
+        """Test that the first page holds the latest messages oldest first"""
+        response = self.get_page()
+        assert response.status_code == 200
+        body = response.json()
+        assert [m["content"] for m in body["data"]] == [
+            "message 4", "message 5", "message 6"]
+        assert body["data"][0]["user"]["username"] == "ali"
+        assert body["has_more"]
+        assert body["next_cursor"] == body["data"][0]["message_id"]
+
+    def test_walking_pages_with_cursor(self):
+        """Test that following the cursor returns every message once"""
+        contents = []
+        cursor = None
+        while True:
+            body = self.get_page(before=cursor).json()
+            contents = [m["content"] for m in body["data"]] + contents
+            cursor = body["next_cursor"]
+            if not body["has_more"]:
+                break
+        assert cursor is None
+        assert contents == [
+            f"message {i}" for i in range(self.messages_count)]
+
+    def test_renamed_sender(self):
+        """Test that the history shows the new username of a user who
+        renamed after their messages were read and cached
+        """
+        headers = {"Authorization": f"Bearer {self.access_token}"}
+        assert self.get_page().json()["data"][0]["user"]["username"] == "ali"
+        try:
+            response = client.patch("/users", headers=headers,
+                                    json={"username": "ali_renamed"})
+            assert response.status_code == 200
+            usernames = {m["user"]["username"]
+                         for m in self.get_page().json()["data"]}
+            assert usernames == {"ali_renamed"}
+        finally:
+            client.patch("/users", headers=headers, json={"username": "ali"})
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        response = self.get_page(before="not-an-id")
+        assert response.status_code == 400
+        assert response.json()["detail"] == "INVALID_CURSOR"
+
+    def test_page_size_cap(self):
+        """Test that the page size can not exceed the maximum"""
+        assert self.get_page(limit=100000).status_code == 422
+
+    def test_messages_are_bucketed(self):
+        """Test that a full bucket is closed and a new one is opened"""
+        db = get_engine_db()
+        room_id = ObjectId()
+        asyncio.run(self.save_messages(str(room_id), [{
+            "_id": ObjectId(),
+            "sender_id": ObjectId(),
+            "content": f"message {i}",
+            "timestamp": datetime.now(timezone.utc)
+        } for i in range(CHAT_BUCKET_SIZE + 1)]))
+
+        buckets = list(db.messages.find({"room_id": room_id}).sort(
+            "first_id", 1))
+        assert [b["count"] for b in buckets] == [CHAT_BUCKET_SIZE, 1]
+        assert [b["open"] for b in buckets] == [False, True]
+
+    def test_retried_batch_is_not_stored_twice(self):
+        """Test that retrying a write skips the messages it stored"""
+        db = get_engine_db()
+        room_id = ObjectId()
+        start = datetime.now(timezone.utc)
+        messages = [{
+            "_id": ObjectId(),
+            "sender_id": ObjectId(),
+            "content": f"message {i}",
+            "timestamp": start + timedelta(milliseconds=i)
+        } for i in range(CHAT_BUCKET_SIZE + 10)]
+
+        async def scenario():
+            # the first write stored the first bucket only, then failed
+            await save_batches({room_id: messages[:CHAT_BUCKET_SIZE]})
+            await save_batches({room_id: messages}, retry=True)
+
+        asyncio.run(scenario())
+        stored = [m["_id"] for bucket in db.messages.find(
+            {"room_id": room_id}).sort("first_id", 1)
+            for m in bucket["messages"]]
+        assert stored == [m["_id"] for m in messages]
+
+    def test_late_message_does_not_hide_newer_buckets(self):
+        """Test that a message appended out of order does not hide the
+        messages newer than it
+        """
+        room_id = ObjectId()
+        late = {
+            "_id": ObjectId(),
+            "sender_id": ObjectId(),
+            "content": "late",
+            "timestamp": datetime.now(timezone.utc)
+        }
+        messages = [{
+            "_id": ObjectId(),
+            "sender_id": ObjectId(),
+            "content": f"message {i}",
+            "timestamp": datetime.now(timezone.utc)
+        } for i in range(CHAT_BUCKET_SIZE + 1)]
+
+        async def scenario():
+            await save_batches({room_id: messages})
+            # the late message lands in the open bucket after the newest
+            await save_batches({room_id: [late]})
+            return (await get_messages(room_id, None, 1),
+                    await get_messages(room_id, None, len(messages) + 1))
+
+        latest, everything = asyncio.run(scenario())
+        assert [m["_id"] for m in latest] == [messages[-1]["_id"]]
+        assert [m["_id"] for m in everything] == [
+            late["_id"]] + [m["_id"] for m in messages]
@@ -0,0 +1,154 @@
+import asyncio
+import json
+
+import pytest
+from core.Backplane import Backplane, InMemoryBackplane
+from core.ConnectionManager import ConnectionManager
+from core.QueuedConnection import RESYNC_FRAME
+
+
+class FakeWebSocket:
+    """Websocket recording what is sent through it"""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.sent = []
+        self.close_code = None
+
+    async def send_text(self, frame):
+        """Record a frame after the configured delay"""
+        if self.fail:
+            raise RuntimeError("socket is gone")
+        await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(frame))
+
+    async def close(self, code=1000):
+        """Record the close code"""
+        self.close_code = code
+
+
+class TestConnectionManager:
+    """Test the fan-out of messages to the sockets of a room"""
+
+    def test_broadcast_reaches_every_socket_in_order(self):
+        """Test that every socket of the room gets every message once"""
+        async def scenario():
+            manager = ConnectionManager()
+            sockets = [FakeWebSocket() for _ in range(3)]
+            other_room = FakeWebSocket()
+            for socket in sockets:
+                manager.connect(socket, "room")
+            manager.connect(other_room, "other")
+            for i in range(5):
+                await manager.broadcast({"i": i}, "room")
+            await asyncio.sleep(0.01)
+            return sockets, other_room
+
+        sockets, other_room = asyncio.run(scenario())
+        for socket in sockets:
+            assert socket.sent == [{"i": i} for i in range(5)]
+        assert other_room.sent == []
+
+    def test_slow_socket_does_not_delay_the_room(self):
+        """Test that broadcasting does not wait for a slow socket"""
+        async def scenario():
+            manager = ConnectionManager()
+            slow, fast = FakeWebSocket(delay=1), FakeWebSocket()
+            manager.connect(slow, "room")
+            manager.connect(fast, "room")
+            await asyncio.wait_for(manager.broadcast({"i": 0}, "room"), 0.1)
+            await asyncio.sleep(0.01)
+            depths = manager.queue_depths()
+            manager.disconnect(slow, "room")
+            manager.disconnect(fast, "room")
+            return fast, depths
+
+        fast, depths = asyncio.run(scenario())
+        assert fast.sent == [{"i": 0}]
+        assert depths["room"]["connections"] == 2
+
+    def test_failing_socket_does_not_break_broadcast(self):
+        """Test that a dead socket does not stop the others"""
+        async def scenario():
+            manager = ConnectionManager()
+            dead, alive = FakeWebSocket(fail=True), FakeWebSocket()
+            manager.connect(dead, "room")
+            manager.connect(alive, "room")
+            await manager.broadcast({"i": 0}, "room")
+            await manager.broadcast({"i": 1}, "room")
+            await asyncio.sleep(0.01)
+            return alive
+
+        alive = asyncio.run(scenario())
+        assert alive.sent == [{"i": 0}, {"i": 1}]
+
+    def test_overflow_sends_resync_then_drops(self):
+        """Test that an overflowing socket is told to resync, then dropped
+        if it overflows again
+        """
+        async def scenario():
+            manager = ConnectionManager(queue_size=2)
+            slow = FakeWebSocket(delay=1)
+            manager.connect(slow, "room")
+            await asyncio.sleep(0)
+            for i in range(3):
+                await manager.broadcast({"i": i}, "room")
+            queued = list(manager.connections[slow].queue._queue)
+            for i in range(3):
+                await manager.broadcast({"i": i}, "room")
+            await asyncio.sleep(0)
+            return slow, queued
+
+        slow, queued = asyncio.run(scenario())
+        assert queued == [RESYNC_FRAME]
+        assert slow.close_code == 1013
+
+    def test_payload_is_encoded_once(self):
+        """Test that every socket of the room is sent the same frame"""
+        frames = []
+
+        class RecordingWebSocket(FakeWebSocket):
+            """Websocket keeping the raw frames"""
+
+            async def send_text(self, frame):
+                frames.append(frame)
+
+        async def scenario():
+            manager = ConnectionManager()
+            for _ in range(3):
+                manager.connect(RecordingWebSocket(), "room")
+            await manager.broadcast({"content": "hi"}, "room")
+            await asyncio.sleep(0.01)
+
+        asyncio.run(scenario())
+        assert len(frames) == 3
+        assert all(frame is frames[0] for frame in frames)
+
+    def test_broadcast_reaches_other_processes(self):
+        """Test that managers sharing a backplane relay each other's rooms
+        and only deliver to their own sockets
+        """
+        async def scenario():
+            hub = []
+            first = ConnectionManager(backplane=InMemoryBackplane(hub))
+            second = ConnectionManager(backplane=InMemoryBackplane(hub))
+            on_first, on_second = FakeWebSocket(), FakeWebSocket()
+            first.connect(on_first, "room")
+            second.connect(on_second, "room")
+            await first.broadcast({"i": 0}, "room")
+            await second.broadcast({"i": 1}, "room")
+            await asyncio.sleep(0.01)
+            return on_first, on_second
+
+        on_first, on_second = asyncio.run(scenario())
+        assert on_first.sent == [{"i": 0}, {"i": 1}]
+        assert on_second.sent == [{"i": 0}, {"i": 1}]
+
+    def test_backplane_must_publish(self):
+        """Test that a backplane without publish can not be created"""
+        class SilentBackplane(Backplane):
+            """Backplane forgetting to publish"""
+
+        with pytest.raises(TypeError):
+            SilentBackplane()
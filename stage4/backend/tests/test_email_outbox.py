@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+from core.EmailOutbox import EmailOutbox
+from core.EmailTransport import EmailTransport, FileTransport
+from db import get_engine_db
+
+pytestmark = pytest.mark.usefixtures("database_indexes")
+
+
+class FailingTransport(EmailTransport):
+    """Transport refusing every batch"""
+
+    def send(self, emails):
+        raise RuntimeError("provider is down")
+
+
+class RejectingTransport(FileTransport):
+    """Transport refusing the batches with an invalid address"""
+
+    def send(self, emails):
+        if any(email["to"] == "invalid" for email in emails):
+            raise ValueError("invalid address")
+        super().send(emails)
+
+
+def email(to):
+    """a minimal email"""
+    return {"from": "test@atrab.app", "to": to, "subject": "hi",
+            "html": "<p>hi</p>"}
+
+
+class TestEmailOutbox:
+    """Test the queueing and the sending of the emails"""
+
+    @pytest.fixture(autouse=True)
+    def setup_empty_outbox(self):
+        """Assure the outbox is empty before every test"""
+        get_engine_db().email_outbox.delete_many({})
+
+    def test_send_in_batches(self, tmp_path):
+        """Test that the queued emails are sent in batches"""
+        path = tmp_path / "emails.jsonl"
+        outbox = EmailOutbox(FileTransport(path), batch_size=2)
+
+        async def scenario():
+            for i in range(3):
+                assert await outbox.enqueue(f"key{i}", email(f"{i}@a.com"))
+            return [await outbox.process() for _ in range(3)]
+
+        assert asyncio.run(scenario()) == [2, 1, 0]
+        sent = [json.loads(line)["to"] for line in path.open()]
+        assert sorted(sent) == ["0@a.com", "1@a.com", "2@a.com"]
+        assert get_engine_db().email_outbox.count_documents(
+            {"status": "sent"}) == 3
+
+    def test_deduplicate_pending(self, tmp_path):
+        """Test that an email waiting with the same key is not queued again
+        """
+        outbox = EmailOutbox(FileTransport(tmp_path / "emails.jsonl"))
+
+        async def scenario():
+            first = await outbox.enqueue("verify:a@a.com", email("a@a.com"))
+            second = await outbox.enqueue("verify:a@a.com", email("a@a.com"))
+            await outbox.process()
+            third = await outbox.enqueue("verify:a@a.com", email("a@a.com"))
+            return first, second, third
+
+        assert asyncio.run(scenario()) == (True, False, True)
+
+    def test_retry_then_give_up(self):
+        """Test that a failed email is retried later and given up after the
+        last attempt
+        """
+        outbox = EmailOutbox(FailingTransport(), max_attempts=2,
+                             retry_delay=0)
+
+        async def scenario():
+            await outbox.enqueue("key", email("a@a.com"))
+            return [await outbox.process() for _ in range(3)]
+
+        assert asyncio.run(scenario()) == [1, 1, 0]
+        job = get_engine_db().email_outbox.find_one({"key": "key"})
+        assert job["status"] == "failed"
+        assert job["attempts"] == 2
+        assert job["last_error"] == "provider is down"
+        assert outbox.stats()["retried"] == 1
+        assert outbox.stats()["failed"] == 1
+
+    def test_rejected_batch_sent_one_by_one(self, tmp_path):
+        """Test that one rejected email does not fail its whole batch"""
+        path = tmp_path / "emails.jsonl"
+        outbox = EmailOutbox(RejectingTransport(path), retry_delay=0)
+
+        async def scenario():
+            for to in ["a@a.com", "invalid", "b@a.com"]:
+                await outbox.enqueue(f"key:{to}", email(to))
+            return await outbox.process()
+
+        assert asyncio.run(scenario()) == 3
+        sent = [json.loads(line)["to"] for line in path.open()]
+        assert sorted(sent) == ["a@a.com", "b@a.com"]
+        outbox_db = get_engine_db().email_outbox
+        assert outbox_db.count_documents({"status": "sent"}) == 2
+        failed = outbox_db.find_one({"key": "key:invalid"})
+        assert failed["status"] == "pending"
+        assert failed["attempts"] == 1
+        assert failed["last_error"] == "invalid address"
+        assert outbox.stats() == {"sent": 2, "retried": 1, "failed": 0,
+                                  "last_error": "invalid address"}
+
+    def test_transport_must_send(self):
+        """Test that a transport without send can not be created"""
+        class SilentTransport(EmailTransport):
+            """Transport forgetting to send"""
+
+        with pytest.raises(TypeError):
+            SilentTransport()
@@ -0,0 +1,129 @@
+import pytest
+from bson.objectid import ObjectId
+from db import get_engine_db
+from fastapi.testclient import TestClient
+from jobs.backfill_group_ancestors import compute_ancestors
+from main import app
+
+client = TestClient(app)
+
+
+class TestComputeAncestors:
+    """Test the ancestors computed by the backfill job"""
+
+    def test_chain(self):
+        """Test that the ancestors go from the main group to the parent"""
+        main, sub, subsub = ObjectId(), ObjectId(), ObjectId()
+        ancestors = compute_ancestors({subsub: sub, sub: main, main: None})
+        assert ancestors[main] == []
+        assert ancestors[sub] == [main]
+        assert ancestors[subsub] == [main, sub]
+
+    def test_missing_parent(self):
+        """Test that a group whose parent is gone is treated as a main group
+        """
+        orphan, child = ObjectId(), ObjectId()
+        ancestors = compute_ancestors({orphan: ObjectId(), child: orphan})
+        assert ancestors[orphan] == []
+        assert ancestors[child] == [orphan]
+
+    def test_cycle(self):
+        """Test that a cycle of parents does not loop"""
+        first, second = ObjectId(), ObjectId()
+        ancestors = compute_ancestors({first: second, second: first})
+        assert len(ancestors) == 2
+
+
+@pytest.mark.usefixtures("database_indexes")
+class TestStoredAncestors:
+    """Test the ancestors stored on the new groups and the breadcrumbs"""
+    headers: dict = {}
+    org_id: ObjectId = None
+
+    @pytest.fixture(scope="class", autouse=True)
+    def setup_user_and_org(self, request):
+        """Create a user and an organization"""
+        db = get_engine_db()
+        db.users.delete_many({})
+        db.organizations.delete_many({})
+        db.groups.delete_many({})
+        db.memberships.delete_many({})
+        client.post("/auth/register", json={
+            "email": "ali@gmail.com",
+            "password": "ali12345",
+            "first_name": "ali",
+            "last_name": "redmon",
+            "username": "ali",
+        })
+        response = client.post("/auth/login", data={
+            "username": "ali", "password": "ali12345"})
+        token = response.json()["access_token"]
+        request.cls.headers = {"Authorization": f"Bearer {token}"}
+        request.cls.org_id = db.organizations.insert_one({
+            "organization_name": "ANCESTORS_ORG",
+            "email_domain": "@GG.EDU",
+            "location": "RIYADH",
+            "photo_url": "",
+            "members_count": 0,
+        }).inserted_id
+
+    def create_group(self, title, parent_id=None):
+        """Create a group through the API, returns its id"""
+        response = client.post(
+            f"/organizations/{self.org_id}/groups", headers=self.headers,
+            json={"title": title,
+                  "parent_group_id": str(parent_id) if parent_id else None})
+        assert response.status_code == 200
+        return ObjectId(response.json()["group_id"])
+
+    def path(self, group_id):
+        """The breadcrumbs of a group"""
+        response = client.get(f"/groups/{group_id}/path")
+        assert response.status_code == 200
+        body = response.json()
+        assert body["org_name"] == "ANCESTORS_ORG"
+        assert body["org_id"] == str(self.org_id)
+        return [(step["group_id"], step["title"]) for step in body["path"]]
+
+    def test_created_groups_store_their_ancestors(self):
+        """Test that create_group stores the chain above the new group"""
+        main = self.create_group("main")
+        sub = self.create_group("sub", main)
+        subsub = self.create_group("subsub", sub)
+
+        groups = get_engine_db().groups
+        assert groups.find_one({"_id": main})["ancestors"] == []
+        assert groups.find_one({"_id": sub})["ancestors"] == [main]
+        assert groups.find_one({"_id": subsub})["ancestors"] == [main, sub]
+
+        assert self.path(subsub) == [
+            (str(main), "main"), (str(sub), "sub"), (str(subsub), "subsub")]
+        assert self.path(main) == [(str(main), "main")]
+
+    def test_path_of_groups_not_backfilled(self):
+        """Test that the breadcrumbs of groups without ancestors are found
+        by walking up their parents
+        """
+        groups = get_engine_db().groups
+        legacy_main = groups.insert_one(
+            {"title": "legacy main", "org_id": self.org_id}).inserted_id
+        legacy_sub = groups.insert_one(
+            {"title": "legacy sub", "org_id": self.org_id,
+             "parentGroupId": legacy_main}).inserted_id
+        legacy_subsub = groups.insert_one(
+            {"title": "legacy subsub", "org_id": self.org_id,
+             "parentGroupId": str(legacy_sub)}).inserted_id
+
+        assert self.path(legacy_subsub) == [
+            (str(legacy_main), "legacy main"),
+            (str(legacy_sub), "legacy sub"),
+            (str(legacy_subsub), "legacy subsub"),
+        ]
+
+        # a legacy group under a backfilled one
+        main = self.create_group("backfilled")
+        child = groups.insert_one(
+            {"title": "legacy child", "org_id": self.org_id,
+             "parentGroupId": main}).inserted_id
+        assert self.path(child) == [
+            (str(main), "backfilled"), (str(child), "legacy child")]
@@ -0,0 +1,42 @@
+from bson.objectid import ObjectId
+from services.group_tree import build_tree
+
+
+def titles(tree):
+    """the titles of a tree as nested tuples"""
+    return [(node["title"], titles(node["subGroups"])) for node in tree]
+
+
+class TestBuildTree:
+    """Test the nesting of the groups of an organization"""
+    main, sub, subsub, other = (ObjectId() for _ in range(4))
+    groups = [
+        {"_id": main, "title": "main"},
+        {"_id": sub, "title": "sub", "parentGroupId": main},
+        {"_id": subsub, "title": "subsub", "parentGroupId": str(sub)},
+        {"_id": other, "title": "other", "parentGroupId": ""},
+    ]
+
+    @staticmethod
+    def node(group):
+        """keep the title only"""
+        return {"title": group["title"]}
+
+    def test_whole_tree(self):
+        """Test that every group is nested under its parent"""
+        tree = build_tree(self.groups, None, self.node)
+        assert titles(tree) == [
+            ("main", [("sub", [("subsub", [])])]),
+            ("other", []),
+        ]
+
+    def test_max_depth(self):
+        """Test that the levels below max_depth are left out"""
+        tree = build_tree(self.groups, 2, self.node)
+        assert titles(tree) == [("main", [("sub", [])]), ("other", [])]
+
+    def test_missing_parent(self):
+        """Test that a group whose parent is gone shows as a main group"""
+        tree = build_tree([{"_id": ObjectId(), "title": "orphan",
+                            "parentGroupId": ObjectId()}], None, self.node)
+        assert titles(tree) == [("orphan", [])]
@@ -0,0 +1,100 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from core.BoundedExecutor import BoundedExecutor
+from core.ImagePipeline import ImagePipeline
+from db import close_db_connections, get_engine_db
+from PIL import Image, UnidentifiedImageError
+from services import image_service
+from services.image_service import render_variants
+
+VARIANTS = {"thumbnail": (160, 160), "card": (640, 320)}
+
+
+class TestRenderVariants:
+    """Test the rendering of the resized photos"""
+
+    @pytest.mark.parametrize("mode, extension", [
+        ("RGB", ".jpg"), ("RGBA", ".png"), ("P", ".gif")])
+    def test_variants_fill_their_sizes(self, tmp_path, mode, extension):
+        """Test that every variant is a WebP of exactly its size"""
+        source = tmp_path / f"abc{extension}"
+        Image.new(mode, (3000, 1000)).save(source)
+
+        urls = render_variants(str(source), VARIANTS)
+
+        assert set(urls) == set(VARIANTS)
+        for name, size in VARIANTS.items():
+            assert urls[name] == str(tmp_path / f"abc.{name}.webp")
+            with Image.open(urls[name]) as variant:
+                assert variant.format == "WEBP"
+                assert variant.size == size
+        assert sorted(path.name for path in tmp_path.iterdir()) == [
+            "abc.card.webp", f"abc{extension}", "abc.thumbnail.webp"]
+
+    def test_too_many_pixels(self, tmp_path, monkeypatch):
+        """Test that images over the pixels limit are not decoded"""
+        monkeypatch.setattr(image_service, "IMAGE_MAX_PIXELS", 1000 * 999)
+        source = tmp_path / "abc.png"
+        Image.new("1", (1000, 1000)).save(source)
+        with pytest.raises(ValueError, match="too large"):
+            render_variants(str(source), VARIANTS)
+        assert [path.name for path in tmp_path.iterdir()] == ["abc.png"]
+
+    def test_not_an_image(self, tmp_path):
+        """Test that a file that is not an image fails to render"""
+        source = tmp_path / "abc.png"
+        source.write_bytes(b"not an image")
+        with pytest.raises(UnidentifiedImageError):
+            render_variants(str(source), VARIANTS)
+
+
+@pytest.mark.usefixtures("database_indexes")
+class TestImagePipeline:
+    """Test the background rendering of the queued images"""
+
+    @pytest.fixture
+    def pipeline(self):
+        """A pipeline rendering in threads"""
+        executor = BoundedExecutor(ThreadPoolExecutor(2), 2)
+        yield ImagePipeline(executor, render_variants, VARIANTS,
+                            max_attempts=2, retry_delay=-1)
+        executor.shutdown()
+
+    @pytest.fixture
+    def blobs(self, tmp_path):
+        """Two blobs, an image and a broken one"""
+        image, broken = tmp_path / "image.png", tmp_path / "broken.png"
+        Image.new("RGB", (800, 600)).save(image)
+        broken.write_bytes(b"not an image")
+        get_engine_db().blobs.insert_many([
+            {"_id": "test-image", "url": str(image), "refs": 1},
+            {"_id": "test-broken", "url": str(broken), "refs": 1},
+        ])
+        yield
+        get_engine_db().blobs.delete_many(
+            {"_id": {"$in": ["test-image", "test-broken"]}})
+
+    @pytest.mark.usefixtures("blobs")
+    def test_render_queued_images(self, pipeline, tmp_path):
+        """Test that images are rendered once and broken ones given up"""
+        async def scenario():
+            try:
+                await pipeline.enqueue("test-image")
+                await pipeline.enqueue("test-image")
+                await pipeline.enqueue("test-broken")
+                return [await pipeline.process() for _ in range(3)]
+            finally:
+                await close_db_connections()
+
+        assert asyncio.run(scenario()) == [2, 1, 0]
+        blobs = get_engine_db().blobs
+        image = blobs.find_one({"_id": "test-image"})
+        assert image["variants_status"] == "ready"
+        assert image["variants"] == {
+            name: str(tmp_path / f"image.{name}.webp") for name in VARIANTS}
+        broken = blobs.find_one({"_id": "test-broken"})
+        assert broken["variants_status"] == "failed"
+        assert broken["variants_attempts"] == 2
+        assert pipeline.stats()["rendered"] == 1
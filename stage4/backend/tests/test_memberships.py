@@ -0,0 +1,66 @@
+import pytest
+from bson.objectid import ObjectId
+from db import get_engine_db
+from jobs.migrate_memberships import migrate_room
+from services.membership import add_member, get_member_ids, is_member
+
+pytestmark = pytest.mark.usefixtures("database_indexes")
+
+
+class TestMemberships:
+    """Test the memberships and the migration of the members arrays"""
+
+    @pytest.fixture(autouse=True)
+    def setup_legacy_group(self, request):
+        """Create a group keeping its members in an array"""
+        db = get_engine_db()
+        db.groups.delete_many({})
+        db.memberships.delete_many({})
+        request.cls.members = [ObjectId() for _ in range(3)]
+        request.cls.group_id = db.groups.insert_one({
+            "title": "legacy",
+            "org_id": ObjectId(),
+            "members": request.cls.members,
+            "members_count": 3,
+        }).inserted_id
+
+    def count(self):
+        """the stored members count of the group"""
+        return get_engine_db().groups.find_one(
+            {"_id": self.group_id})["members_count"]
+
+    def test_legacy_members_are_members(self):
+        """Test that the members of the array are seen before migrating"""
+        db = get_engine_db()
+        assert is_member(db.groups, self.group_id, self.members[0])
+        assert not is_member(db.groups, self.group_id, ObjectId())
+        assert not add_member(db.groups, self.group_id, self.members[0])
+        assert self.count() == 3
+
+    def test_join_counts_once(self):
+        """Test that a new member is counted once"""
+        db = get_engine_db()
+        user_id = ObjectId()
+        assert add_member(db.groups, self.group_id, user_id)
+        assert not add_member(db.groups, self.group_id, user_id)
+        assert is_member(db.groups, self.group_id, user_id)
+        assert self.count() == 4
+
+    def test_migrate_room(self):
+        """Test that the array is moved to memberships"""
+        db = get_engine_db()
+        user_id = ObjectId()
+        add_member(db.groups, self.group_id, user_id)
+
+        assert migrate_room(db.groups, self.group_id) == 3
+        assert "members" not in db.groups.find_one({"_id": self.group_id})
+        assert db.memberships.count_documents(
+            {"room_id": self.group_id}) == 4
+        assert all(is_member(db.groups, self.group_id, m)
+                   for m in self.members + [user_id])
+        assert sorted(get_member_ids([self.group_id])[self.group_id]) == \
+            sorted(self.members + [user_id])
+        assert self.count() == 4
+
+        # running it again does nothing
+        assert migrate_room(db.groups, self.group_id) == 0
@@ -0,0 +1,162 @@
+import asyncio
+
+from bson.objectid import ObjectId
+from core.MessageWriteBuffer import MessageWriteBuffer
+
+
+class RecordingWriter:
+    """Writer keeping the batches instead of saving them"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+        self.retries = []
+
+    async def __call__(self, rooms, retry):
+        self.retries.append(retry)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is down")
+        self.batches.append(rooms)
+
+
+class TestMessageWriteBuffer:
+    """Test the batching of chat messages writes"""
+
+    def test_flush_on_batch_size(self):
+        """Test that a full batch is written without waiting the interval"""
+        writer = RecordingWriter()
+        room = ObjectId()
+
+        async def scenario():
+            buffer = MessageWriteBuffer(batch_size=3, interval=60,
+                                        write=writer)
+            for i in range(3):
+                buffer.add(room, {"i": i})
+            await asyncio.sleep(0.01)
+            return buffer.stats()
+
+        stats = asyncio.run(scenario())
+        assert writer.batches == [{room: [{"i": 0}, {"i": 1}, {"i": 2}]}]
+        assert stats["buffered_messages"] == 0
+        assert stats["flushes"] == 1
+
+    def test_flush_on_interval_and_stop(self):
+        """Test that messages are written periodically and on stop"""
+        writer = RecordingWriter()
+        first, second = ObjectId(), ObjectId()
+
+        async def scenario():
+            buffer = MessageWriteBuffer(batch_size=100, interval=0.01,
+                                        write=writer)
+            await buffer.start()
+            buffer.add(first, {"i": 0})
+            buffer.add(second, {"i": 1})
+            await asyncio.sleep(0.05)
+            buffer.add(first, {"i": 2})
+            await buffer.stop()
+
+        asyncio.run(scenario())
+        assert writer.batches == [
+            {first: [{"i": 0}], second: [{"i": 1}]},
+            {first: [{"i": 2}]},
+        ]
+
+    def test_failed_flush_keeps_messages_in_order(self):
+        """Test that messages of a failed flush are retried first"""
+        writer = RecordingWriter(failures=1)
+        room = ObjectId()
+
+        async def scenario():
+            buffer = MessageWriteBuffer(batch_size=100, interval=60,
+                                        write=writer)
+            buffer.add(room, {"i": 0})
+            await buffer.flush()
+            buffer.add(room, {"i": 1})
+            failed = buffer.stats()
+            await buffer.flush()
+            return failed
+
+        failed = asyncio.run(scenario())
+        assert failed["failed_flushes"] == 1
+        assert failed["buffered_messages"] == 2
+        assert writer.batches == [{room: [{"i": 0}, {"i": 1}]}]
+        assert writer.retries == [False, True]
+
+    def test_batch_dropped_after_max_retries(self):
+        """Test that a batch failing again and again is dropped"""
+        writer = RecordingWriter(failures=3)
+        room = ObjectId()
+
+        async def scenario():
+            buffer = MessageWriteBuffer(batch_size=100, interval=60,
+                                        write=writer, max_retries=2)
+            buffer.add(room, {"i": 0})
+            for _ in range(3):
+                await buffer.flush()
+            buffer.add(room, {"i": 1})
+            await buffer.flush()
+            return buffer.stats()
+
+        stats = asyncio.run(scenario())
+        assert stats["dropped_messages"] == 1
+        assert stats["buffered_messages"] == 0
+        assert writer.batches == [{room: [{"i": 1}]}]
+        assert writer.retries == [False, True, True, False]
+
+    def test_full_buffer_drops_messages(self):
+        """Test that the buffer does not grow past its limit"""
+        writer = RecordingWriter()
+        room = ObjectId()
+
+        async def scenario():
+            buffer = MessageWriteBuffer(batch_size=100, interval=60,
+                                        write=writer, max_buffered=2)
+            for i in range(3):
+                buffer.add(room, {"i": i})
+            stats = buffer.stats()
+            await buffer.flush()
+            return stats
+
+        stats = asyncio.run(scenario())
+        assert stats["buffered_messages"] == 2
+        assert stats["dropped_messages"] == 1
+        assert writer.batches == [{room: [{"i": 0}, {"i": 1}]}]
+
+    def test_buffered_includes_the_flush_in_progress(self):
+        """Test that messages being written are still reported buffered"""
+        room = ObjectId()
+        seen = []
+
+        async def scenario():
+            async def write(rooms, retry):
+                # a newer message arrives while the batch is written
+                buffer.add(room, {"i": 1})
+                seen.append(buffer.buffered(room))
+
+            buffer = MessageWriteBuffer(batch_size=100, interval=60,
+                                        write=write)
+            buffer.add(room, {"i": 0})
+            await buffer.flush()
+            return buffer.buffered(room)
+
+        left = asyncio.run(scenario())
+        assert seen == [[{"i": 0}, {"i": 1}]]
+        assert left == [{"i": 1}]
+
+    def test_stop_waits_for_started_flushes(self):
+        """Test that stopping waits for the flushes started by add"""
+        writer = RecordingWriter()
+        room = ObjectId()
+
+        async def scenario():
+            buffer = MessageWriteBuffer(batch_size=2, interval=60,
+                                        write=writer)
+            buffer.add(room, {"i": 0})
+            buffer.add(room, {"i": 1})
+            pending = len(buffer.flush_tasks)
+            await buffer.stop()
+            return pending, len(buffer.flush_tasks)
+
+        assert asyncio.run(scenario()) == (1, 0)
+        assert writer.batches == [{room: [{"i": 0}, {"i": 1}]}]
@@ -0,0 +1,51 @@
+import pytest
+from api import monitoring
+from db import get_engine_db
+from fastapi.testclient import TestClient
+from main import app
+
+client = TestClient(app)
+pytestmark = pytest.mark.usefixtures("database_indexes")
+
+
+class TestMonitoringAccess:
+    """Test that only the monitoring admins read the monitoring"""
+    headers: dict = {}
+    user_id: str = ""
+
+    @pytest.fixture(scope="class", autouse=True)
+    def setup_user(self, request):
+        """Register and log a user in"""
+        db = get_engine_db()
+        db.users.delete_many({})
+        client.post("/auth/register", json={
+            "email": "ali@gmail.com",
+            "password": "ali12345",
+            "first_name": "ali",
+            "last_name": "redmon",
+            "username": "ali",
+        })
+        response = client.post("/auth/login", data={
+            "username": "ali", "password": "ali12345"})
+        token = response.json()["access_token"]
+        request.cls.headers = {"Authorization": f"Bearer {token}"}
+        user = db.users.find_one({"username": "ali"})
+        request.cls.user_id = str(user["_id"])
+
+    def test_requires_authentication(self):
+        """Test that anonymous requests are refused"""
+        assert client.get("/monitoring/db").status_code == 401
+
+    def test_requires_admin(self):
+        """Test that users who are not admins are refused"""
+        response = client.get("/monitoring/db", headers=self.headers)
+        assert response.status_code == 403
+        assert response.json()["detail"] == "NOT_AN_ADMIN"
+
+    def test_admin_reads_monitoring(self, monkeypatch):
+        """Test that the admins read every monitoring endpoint"""
+        monkeypatch.setattr(monitoring, "MONITORING_ADMINS", {self.user_id})
+        for path in ["chat", "auth", "email", "images", "groups", "db"]:
+            response = client.get(f"/monitoring/{path}",
+                                  headers=self.headers)
+            assert response.status_code == 200
@@ -4,6 +4,7 @@ from fastapi.testclient import TestClient
 from main import app
 
 client = TestClient(app)
+pytestmark = pytest.mark.usefixtures("database_indexes")
 
 
 class TestOrganizations:
@@ -63,3 +64,68 @@ class TestOrganizations:
         rs = self.register()
         assert rs.status_code == 422
         assert rs.json()["detail"] == "Organization already added"
+
+    def test_list_pages(self):
+        """Test that the listing is walked page by page with the cursor"""
+        names = [f"ORG_{i}" for i in range(5)]
+        for name in names:
+            assert self.register(organization_name=name).status_code == 200
+
+        listed = []
+        params = {"limit": 2}
+        while True:
+            rs = client.get("/organizations", params=params)
+            assert rs.status_code == 200
+            assert len(rs.json()) <= 2
+            listed += rs.json()
+            if "X-Next-Cursor" not in rs.headers:
+                break
+            params["after"] = rs.headers["X-Next-Cursor"]
+
+        assert [org["organization_name"] for org in listed] == names
+        assert all(org["members_count"] == 0 for org in listed)
+        assert all(org["members"] == [] for org in listed)
+
+    def test_list_without_members(self):
+        """Test that the members can be left out of the listing"""
+        self.register()
+        rs = client.get("/organizations", params={"include_members": False})
+        assert rs.status_code == 200
+        assert rs.json()[0]["members"] is None
+        assert rs.json()[0]["members_count"] == 0
+
+    def test_list_with_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        rs = client.get("/organizations", params={"after": "nope"})
+        assert rs.status_code == 400
+        assert rs.json()["detail"] == "INVALID_CURSOR"
+
+    def test_join_counts_members(self):
+        """Test that joining updates the stored members count once"""
+        db = get_engine_db()
+        db.users.delete_many({})
+        client.post("/auth/register", json={
+            "email": "ali@gmail.com",
+            "password": "ali12345",
+            "first_name": "ali",
+            "last_name": "redmon",
+            "username": "ali"
+        })
+        token = client.post("/auth/login", data={
+            "username": "ali",
+            "password": "ali12345",
+        }).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        org_id = self.register().json()["organization_id"]
+
+        join = client.post(f"/users/groups/{org_id}",
+                           params={"is_org": True}, headers=headers)
+        assert join.status_code == 200
+        join = client.post(f"/users/groups/{org_id}",
+                           params={"is_org": True}, headers=headers)
+        assert join.status_code == 422
+        assert join.json()["detail"] == "USER_ALREADY_JOINED"
+
+        listed = client.get("/organizations").json()
+        assert listed[0]["members_count"] == 1
+        assert len(listed[0]["members"]) == 1
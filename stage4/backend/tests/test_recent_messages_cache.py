@@ -0,0 +1,94 @@
+from bson.objectid import ObjectId
+from core.RecentMessagesCache import RecentMessagesCache
+
+
+def make_messages(count):
+    """Make messages in the history wire format, oldest first"""
+    return [{
+        "message_id": str(ObjectId()),
+        "content": f"message {i}",
+        "timestamp": "2026-01-01T00:00:00.000Z",
+        "user": {"_id": "", "username": "ali"},
+    } for i in range(count)]
+
+
+class TestRecentMessagesCache:
+    """Test serving history pages from memory"""
+
+    def test_unknown_room_is_a_miss(self):
+        """Test that rooms not cached are left to the database"""
+        cache = RecentMessagesCache()
+        assert cache.get_page("room", None, 10) is None
+        assert cache.stats()["misses"] == 1
+
+    def test_complete_room_pages(self):
+        """Test walking the pages of a room held entirely in memory"""
+        cache = RecentMessagesCache(capacity=10)
+        messages = make_messages(5)
+        cache.begin_fill("room")
+        cache.fill("room", messages, complete=True)
+
+        page = cache.get_page("room", None, 3)
+        assert page["data"] == messages[2:]
+        assert page["has_more"]
+        page = cache.get_page("room", page["next_cursor"], 3)
+        assert page["data"] == messages[:2]
+        assert not page["has_more"]
+        assert page["next_cursor"] is None
+
+    def test_pages_past_the_buffer_are_a_miss(self):
+        """Test that older pages of a truncated history need the database"""
+        cache = RecentMessagesCache(capacity=4)
+        messages = make_messages(6)
+        cache.begin_fill("room")
+        cache.fill("room", messages[-4:], complete=False)
+
+        assert cache.get_page("room", None, 3)["data"] == messages[3:]
+        assert cache.get_page("room", messages[3]["message_id"], 3) is None
+
+    def test_appended_messages_roll_the_buffer(self):
+        """Test that new messages push the oldest out of a full buffer"""
+        cache = RecentMessagesCache(capacity=3)
+        messages = make_messages(5)
+        cache.begin_fill("room")
+        cache.fill("room", messages[:2], complete=True)
+        for message in messages[2:]:
+            cache.append("room", message)
+
+        page = cache.get_page("room", None, 2)
+        assert page["data"] == messages[3:]
+        assert page["has_more"]
+        assert cache.get_page("room", None, 3) is None
+
+    def test_messages_arriving_while_filling_are_kept(self):
+        """Test that a message broadcast during the database load is kept
+        once, even when the load already has it
+        """
+        cache = RecentMessagesCache(capacity=10)
+        messages = make_messages(4)
+        cache.begin_fill("room")
+        cache.append("room", messages[2])
+        cache.append("room", messages[3])
+        assert cache.get_page("room", None, 2) is None
+        cache.fill("room", messages[:3], complete=True)
+
+        assert cache.get_page("room", None, 10)["data"] == messages
+
+    def test_least_recently_used_room_is_evicted(self):
+        """Test that the number of cached rooms is bounded"""
+        cache = RecentMessagesCache(max_rooms=2)
+        for room in ("first", "second", "third"):
+            cache.begin_fill(room)
+            cache.fill(room, make_messages(1), complete=True)
+
+        assert "first" not in cache
+        assert "second" in cache and "third" in cache
+
+    def test_idle_room_is_evicted(self):
+        """Test that rooms nobody reads are dropped"""
+        cache = RecentMessagesCache(idle_seconds=-1)
+        cache.begin_fill("idle")
+        cache.fill("idle", make_messages(1), complete=True)
+        cache.begin_fill("room")
+
+        assert "idle" not in cache
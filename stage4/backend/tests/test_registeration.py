@@ -4,6 +4,7 @@ from fastapi.testclient import TestClient
 from main import app
 
 client = TestClient(app)
+pytestmark = pytest.mark.usefixtures("database_indexes")
 
 
 class TestRegisteration:
@@ -0,0 +1,149 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+from bson.objectid import ObjectId
+from db import get_engine_db
+from fastapi.testclient import TestClient
+from main import app
+from services.resources import (after_cursor, counter_changes,
+                                encode_cursor, vote)
+
+client = TestClient(app)
+
+
+class TestVoteCounters:
+    """Test the changes of the counters and the cursors"""
+
+    def test_counter_changes(self):
+        """Test every transition of a vote"""
+        assert counter_changes(0, 1) == \
+            {"upvotes": 1, "downvotes": 0, "score": 1}
+        assert counter_changes(1, 0) == \
+            {"upvotes": -1, "downvotes": 0, "score": -1}
+        assert counter_changes(1, -1) == \
+            {"upvotes": -1, "downvotes": 1, "score": -2}
+        assert counter_changes(-1, 0) == \
+            {"upvotes": 0, "downvotes": -1, "score": 1}
+
+    def test_score_cursor(self):
+        """Test that a score cursor continues after its resource"""
+        resource = {"_id": ObjectId(), "score": -3}
+        cursor = encode_cursor(resource, "score")
+        assert after_cursor(cursor, "score") == {"$or": [
+            {"score": {"$lt": -3}},
+            {"score": -3, "_id": {"$lt": resource["_id"]}},
+        ]}
+
+    def test_malformed_cursor(self):
+        """Test that a malformed cursor raises"""
+        with pytest.raises(ValueError):
+            after_cursor("nope", "score")
+
+
+@pytest.mark.usefixtures("database_indexes")
+class TestResourcesListing:
+    """Test the paginated listing of the resources of a group"""
+
+    @pytest.fixture(autouse=True)
+    def setup_group_with_resources(self, request):
+        """Create a group with resources of different scores"""
+        db = get_engine_db()
+        db.groups.delete_many({})
+        db.resources.delete_many({})
+        group_id = db.groups.insert_one({"title": "group"}).inserted_id
+        request.cls.group_id = str(group_id)
+        db.resources.insert_many([{
+            "group_id": group_id,
+            "name": f"resource {i}",
+            "file_url": "",
+            "uploaded_by": "ali",
+            "upvotes": i % 3,
+            "downvotes": 0,
+            "score": i % 3,
+            "_created_at": datetime.now(timezone.utc),
+        } for i in range(7)])
+
+    def walk(self, sort):
+        """every resource of the group, fetched 2 by 2"""
+        listed = []
+        params = {"sort": sort, "limit": 2}
+        while True:
+            rs = client.get(f"/groups/{self.group_id}/resources",
+                            params=params)
+            assert rs.status_code == 200
+            listed += rs.json()
+            if "X-Next-Cursor" not in rs.headers:
+                return listed
+            params["after"] = rs.headers["X-Next-Cursor"]
+
+    def test_newest_first(self):
+        """Test that the newest resources come first"""
+        names = [r["name"] for r in self.walk("newest")]
+        assert names == [f"resource {i}" for i in reversed(range(7))]
+
+    def test_best_score_first(self):
+        """Test that the pages follow the score and cover every resource"""
+        listed = self.walk("score")
+        assert [r["score"] for r in listed] == [2, 2, 1, 1, 0, 0, 0]
+        assert len({r["_id"] for r in listed}) == 7
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        rs = client.get(f"/groups/{self.group_id}/resources",
+                        params={"sort": "score", "after": "nope"})
+        assert rs.status_code == 400
+        assert rs.json()["detail"] == "INVALID_CURSOR"
+
+
+@pytest.mark.usefixtures("database_indexes")
+class TestConcurrentVotes:
+    """Test that the counters stay consistent under parallel votes"""
+    voters = 100
+    votes = 4000
+
+    def test_parallel_votes(self):
+        """Fire thousands of parallel votes and compare the counters with
+        the vote records
+        """
+        db = get_engine_db()
+        db.resources.delete_many({})
+        db.votes.delete_many({})
+        group_id = ObjectId()
+        resource_id = db.resources.insert_one({
+            "group_id": group_id,
+            "name": "contested",
+            "file_url": "",
+            "uploaded_by": "ali",
+            "upvotes": 0,
+            "downvotes": 0,
+            "score": 0,
+        }).inserted_id
+        users = [ObjectId() for _ in range(self.voters)]
+        rng = random.Random(42)
+        ballots = [(rng.choice(users), rng.choice((1, -1)))
+                   for _ in range(self.votes)]
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            results = list(pool.map(
+                lambda ballot: vote(group_id, resource_id, *ballot),
+                ballots))
+        assert all(result is not None for result in results)
+
+        resource = db.resources.find_one({"_id": resource_id})
+        upvotes = db.votes.count_documents(
+            {"resource_id": resource_id, "value": 1})
+        downvotes = db.votes.count_documents(
+            {"resource_id": resource_id, "value": -1})
+        assert resource["upvotes"] == upvotes
+        assert resource["downvotes"] == downvotes
+        assert resource["score"] == upvotes - downvotes
+        assert upvotes + downvotes <= self.voters
+
+    def test_vote_on_missing_resource(self):
+        """Test that a vote on a resource not in the group leaves nothing"""
+        db = get_engine_db()
+        resource_id, user_id = ObjectId(), ObjectId()
+        assert vote(ObjectId(), resource_id, user_id, 1) is None
+        assert db.votes.count_documents({"resource_id": resource_id}) == 0
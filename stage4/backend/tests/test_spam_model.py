@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+from profanityfilter import ProfanityFilter
+from spam_model import (are_spam, build_matcher, cache_key, is_spam,
+                        is_spam_async, verdicts)
+
+MESSAGES = [
+    "hello there",
+    "what the fuck",
+    "FUCKING hell",
+    "assassin classic grass",
+    "you are an ass",
+    "Shit!",
+    "bitches",
+    "مرحبا بالجميع",
+    "",
+]
+
+
+class TestSpamModel:
+    """Test the compiled spam checker"""
+
+    @pytest.mark.parametrize("message", MESSAGES)
+    def test_same_verdict_as_profanityfilter(self, message):
+        """Test that the compiled matcher agrees with the word by word
+        check of profanityfilter
+        """
+        assert is_spam(message) == ProfanityFilter().is_profane(message)
+
+    def test_word_boundaries(self):
+        """Test that words are matched whole unless they do not start or end
+        with a word character
+        """
+        matcher = build_matcher(["ass", "a\\$\\$", "fu"])
+        assert matcher.search("an ass here")
+        assert not matcher.search("classic")
+        assert matcher.search("a$$hole")
+        assert not matcher.search("fun")
+
+    def test_batch_and_async_agree(self):
+        """Test that every entry point gives the same verdicts"""
+        expected = [is_spam(message) for message in MESSAGES]
+        assert are_spam(MESSAGES) == expected
+
+        async def check_all():
+            return [await is_spam_async(message) for message in MESSAGES]
+
+        assert asyncio.run(check_all()) == expected
+
+    def test_verdicts_cached_by_digest(self):
+        """Test that verdicts are keyed by a digest and long messages are
+        not cached
+        """
+        short, long = "a short clean message", "long " * 1000
+        is_spam(short)
+        is_spam(long)
+        assert verdicts.get(cache_key(short)) is False
+        assert cache_key(long) is None
+        assert verdicts.get(short) is None
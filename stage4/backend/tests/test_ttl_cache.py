@@ -0,0 +1,41 @@
+from core.TTLCache import TTLCache
+
+
+class TestTTLCache:
+    """Test the bounded expiring cache"""
+
+    def test_get_set_and_counters(self):
+        """Test that set values are returned and lookups are counted"""
+        cache = TTLCache(max_size=10, ttl=60)
+        assert cache.get("key") is None
+        cache.set("key", "value")
+        assert cache.get("key") == "value"
+        assert cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+    def test_expired_entries_are_missing(self):
+        """Test that entries are not returned after their ttl"""
+        cache = TTLCache(max_size=10, ttl=-1)
+        cache.set("key", "value")
+        assert cache.get("key", "default") == "default"
+        assert cache.stats()["size"] == 0
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that the size is bounded, keeping the used entries"""
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set("first", 1)
+        cache.set("second", 2)
+        cache.get("first")
+        cache.set("third", 3)
+        assert cache.get("second") is None
+        assert cache.get("first") == 1
+        assert cache.get("third") == 3
+
+    def test_invalidate(self):
+        """Test that invalidated keys are forgotten"""
+        cache = TTLCache(max_size=10, ttl=60)
+        cache.set("first", 1)
+        cache.set("second", 2)
+        cache.invalidate("first")
+        assert cache.get("first") is None
+        cache.clear()
+        assert cache.get("second") is None
@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+from core.UploadSizeLimit import MULTIPART_OVERHEAD, UploadSizeLimit
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.exceptions import HTTPException
+from fastapi.testclient import TestClient
+from services.upload_service import receive_upload
+
+app = FastAPI()
+app.add_middleware(UploadSizeLimit, limits={r"/upload$": 10,
+                                            r"/files$": 10})
+
+
+@app.post("/upload")
+@app.post("/other")
+async def body_size(request: Request):
+    return {"size": len(await request.body())}
+
+
+@app.post("/files")
+async def file_size(file: UploadFile = File(...)):
+    return {"size": len(await file.read())}
+
+
+def multipart_chunks(size: int):
+    """A multipart body with a file of `size` bytes, in chunks"""
+    yield (b"--boundary\r\n"
+           b'Content-Disposition: form-data; name="file"; '
+           b'filename="big.bin"\r\n'
+           b"Content-Type: application/octet-stream\r\n\r\n")
+    for start in range(0, size, 1024):
+        yield b"x" * min(1024, size - start)
+    yield b"\r\n--boundary--\r\n"
+
+
+class TestReceiveUpload:
+    """Test the streaming reception of the uploads"""
+
+    def test_stores_hashes_and_measures(self, tmp_path):
+        """Test that the upload is written whole to a temporary file"""
+        content = b"resource content " * 100000
+        upload = UploadFile(io.BytesIO(content), filename="notes.pdf")
+        received = asyncio.run(receive_upload(upload, tmp_path,
+                                              len(content)))
+
+        assert received["path"].parent == tmp_path
+        assert received["path"].suffix == ".part"
+        assert received["path"].read_bytes() == content
+        assert received["size"] == len(content)
+        assert received["sha256"] == hashlib.sha256(content).hexdigest()
+
+    def test_too_large_leaves_nothing(self, tmp_path):
+        """Test that an upload over the quota is refused and removed"""
+        upload = UploadFile(io.BytesIO(b"x" * 101), filename="big.bin")
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(receive_upload(upload, tmp_path, 100))
+        assert error.value.status_code == 413
+        assert error.value.detail == "FILE_TOO_LARGE"
+        assert not list(tmp_path.iterdir())
+
+
+class TestUploadSizeLimit:
+    """Test the rejection of the oversized upload requests"""
+
+    client = TestClient(app)
+    limit = 10 + MULTIPART_OVERHEAD
+
+    def test_under_the_limit(self):
+        """Test that small bodies go through"""
+        response = self.client.post("/upload", content=b"x" * self.limit)
+        assert response.status_code == 200
+        assert response.json() == {"size": self.limit}
+
+    def test_content_length_over_the_limit(self):
+        """Test that a declared oversized body is refused"""
+        response = self.client.post("/upload",
+                                    content=b"x" * (self.limit + 1))
+        assert response.status_code == 413
+        assert response.json() == {"detail": "FILE_TOO_LARGE"}
+
+    def test_streamed_body_over_the_limit(self):
+        """Test that a body without a length is cut off at the limit"""
+        def chunks():
+            for _ in range(self.limit // 1024 + 2):
+                yield b"x" * 1024
+
+        response = self.client.post("/upload", content=chunks())
+        assert response.status_code == 413
+
+    def test_streamed_form_over_the_limit(self):
+        """Test that a form parsed by the app is answered with 413 too"""
+        headers = {"Content-Type": "multipart/form-data; boundary=boundary"}
+        small = self.client.post("/files", headers=headers,
+                                 content=multipart_chunks(100))
+        assert small.json() == {"size": 100}
+
+        response = self.client.post("/files", headers=headers,
+                                    content=multipart_chunks(self.limit))
+        assert response.status_code == 413
+        assert response.json() == {"detail": "FILE_TOO_LARGE"}
+
+    def test_other_paths_are_unlimited(self):
+        """Test that the paths without a limit are not checked"""
+        response = self.client.post("/other",
+                                    content=b"x" * (self.limit + 1))
+        assert response.status_code == 200
@@ -2,8 +2,10 @@ import pytest
 from db import get_engine_db
 from fastapi.testclient import TestClient
 from main import app
+from services.email_service import generate_verification_token
 
 client = TestClient(app)
+pytestmark = pytest.mark.usefixtures("database_indexes")
 
 
 class TestUserEmailsUpdate:
@@ -99,3 +101,15 @@ class TestUserEmailsUpdate:
 
         new_email_strings = [e['value'] for e in me['email']]
         assert "ali2@gmail.com" not in new_email_strings
+
+    def test_verify_email(self):
+        """the verified email shows up right away for a cached user"""
+        me = self.get_current_user().json()
+        assert not me["email"][0]["is_verified"]
+
+        token = generate_verification_token(me["email"][0]["value"])
+        response = client.get(f"/auth/verify-email/{token}")
+        assert response.status_code == 200
+
+        me = self.get_current_user().json()
+        assert me["email"][0]["is_verified"]
@@ -7,6 +7,7 @@ from fastapi.testclient import TestClient
 from main import app
 
 client = TestClient(app)
+pytestmark = pytest.mark.usefixtures("database_indexes")
 
 
 class TestUserUpdate:
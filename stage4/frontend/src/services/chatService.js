@@ -29,8 +29,13 @@ const chatService = {
           return
         }
 
-        if (data.type === 'history') {
-          onMessage({ type: 'history', data: data.data })
+        if (data.type === 'history' || data.type === 'older_history') {
+          onMessage({ type: data.type, data: data.data, hasMore: data.has_more })
+          return
+        }
+
+        if (data.type === 'resync') {
+          onMessage({ type: 'resync' })
           return
         }
 
@@ -56,6 +61,12 @@ const chatService = {
     }
   },
 
+  loadOlder(before) {
+    if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+      this.socket.send(JSON.stringify({ type: 'load_older', before }))
+    }
+  },
+
   close() {
     if (this.socket) {
       this.socket.close()
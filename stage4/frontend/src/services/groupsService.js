@@ -88,9 +88,17 @@ const groupsService = {
   },
 
   async getAllResources(gid) {
-    const response = await fetch(`${API_URL}/${gid}/resources`)
-    if (!response.ok) throw new Error('Failed to fetch resources')
-    return response.json()
+    const resources = []
+    let cursor = null
+    do {
+      const params = new URLSearchParams({ sort: 'score' })
+      if (cursor) params.set('after', cursor)
+      const response = await fetch(`${API_URL}/${gid}/resources?${params}`)
+      if (!response.ok) throw new Error('Failed to fetch resources')
+      resources.push(...(await response.json()))
+      cursor = response.headers.get('X-Next-Cursor')
+    } while (cursor)
+    return resources
   },
 
   async getGroupPath(groupId) {
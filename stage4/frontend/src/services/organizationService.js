@@ -1,16 +1,25 @@
 // services/organizationService.js
 
 export default {
-  // Fetch all organizations
+  // Fetch all organizations, page by page, without their members lists
   async getAll() {
     try {
-      const response = await fetch('/api/organizations')
+      const organizations = []
+      let cursor = null
+      do {
+        const params = new URLSearchParams({ include_members: 'false' })
+        if (cursor) params.set('after', cursor)
+        const response = await fetch(`/api/organizations?${params}`)
 
-      if (!response.ok) {
-        throw new Error(`Server error: ${response.status}`)
-      }
+        if (!response.ok) {
+          throw new Error(`Server error: ${response.status}`)
+        }
 
-      return await response.json() // Return the organizations data
+        organizations.push(...(await response.json()))
+        cursor = response.headers.get('X-Next-Cursor')
+      } while (cursor)
+
+      return organizations // Return the organizations data
     } catch (err) {
       throw new Error(`خطأ في الشبكة: ${err.message}`)
     }